@@ -5,17 +5,25 @@ import matplotlib.pyplot as plt
 import matplotlib
 from cashflow.engines.components import Income, Credit, Saving, Expense
 from cashflow.engines.budget import Budget
+from cashflow.engines.inflation import constant_cpi, deflate_summary
+from cashflow.engines.registry import ComponentRegistry
+from cashflow.engines.whatif import WhatIfGrid
 import datetime as dt
 from dateutil.relativedelta import relativedelta
 from cashflow.utils.plotting import (
     plot_budget_across_time,
     plot_aggregated_budget,
     plot_components_across_time,
+    chart_components_across_time,
 )
 from cashflow.utils.logging_utils import init_logger
+from cashflow.utils.metrics import REGISTRY, configure_from_env
 
 logger = init_logger()
 
+# CASHFLOW_METRICS_FILE and CASHFLOW_METRICS_PORT turn on operational metrics
+metrics_file = configure_from_env()
+
 # we only consider time pr month
 today = dt.date.today().replace(day=1)
 
@@ -43,9 +51,27 @@ retirement_age = st.sidebar.text_input(
 expected_lifespan = st.sidebar.text_input(
     label="Expected lifespan", value="90", key=f"expected_lifespan"
 )
+inflation = st.sidebar.number_input(
+    label="Expected annual inflation", value=0.02, key=f"inflation"
+)
+real_terms = st.sidebar.checkbox(
+    label="Show amounts in today's DKK", value=False, key=f"real_terms"
+)
+interactive = st.sidebar.checkbox(
+    label="Interactive charts", value=False, key=f"interactive"
+)
+precompute = st.sidebar.checkbox(
+    label="Precompute what-if scenarios", value=True, key=f"precompute"
+)
 year_of_retirement = dt.date.today().year + int(retirement_age) - int(age)
 year_of_death = dt.date.today().year + int(expected_lifespan) - int(age)
 
+# components are kept across reruns and only rebuilt when their inputs change
+if "registry" not in st.session_state:
+    st.session_state["registry"] = ComponentRegistry()
+registry = st.session_state["registry"]
+registry.begin()
+
 st.sidebar.markdown(
     """
     ## Incomes
@@ -84,7 +110,9 @@ for i in range(1, st.session_state["num_incomes"] + 1):
         )
     raise_dates = [dt.date(year, 1, 1) for year in raise_years]
 
-    income = Income(
+    income = registry.get(
+        f"income_{i}",
+        Income,
         name=name,
         monthly_amount=monthly_amount,
         change_at_dates=raise_dates,
@@ -116,7 +144,9 @@ for num in range(1, st.session_state["num_expenses"] + 1):
     monthly_amount = st.sidebar.number_input(
         label="monthly amount (DKK)", value=10000, key=f"expense_monthly_amount_{num}"
     )
-    expense = Expense(name=name, monthly_amount=monthly_amount)
+    expense = registry.get(
+        f"expense_{num}", Expense, name=name, monthly_amount=monthly_amount
+    )
     EXPENSES.append(expense)
 
 
@@ -147,7 +177,9 @@ for num in range(1, st.session_state["num_savings"] + 1):
     interest_rate = st.sidebar.number_input(
         label="annual interest rate", value=0.02, key=f"saving_interest_rate_{num}"
     )
-    saving = Saving(
+    saving = registry.get(
+        f"saving_{num}",
+        Saving,
         name=name,
         monthly_amount=monthly_amount,
         initial_amount=initial_amount,
@@ -188,7 +220,9 @@ for num in range(1, st.session_state["num_credits"] + 1):
         value=0.05,
         key=f"credit_annual_interest_rate_{num}",
     )
-    credit = Credit(
+    credit = registry.get(
+        f"credit_{num}",
+        Credit,
         name=name,
         credit_amount=total_amount,
         initial_payoff=initial_payoff,
@@ -203,8 +237,22 @@ budget = Budget(incomes=INCOMES, expenses=EXPENSES, savings=SAVINGS, credits=CRE
 # RUN SIMULATION #
 ##################
 
-budget.run()
-budget.get_summary()
+registry.end()
+if precompute:
+    # neighbouring scenarios are simulated in the background between reruns, so
+    # moving a single input is usually served from the grid
+    if "whatif" not in st.session_state:
+        st.session_state["whatif"] = WhatIfGrid()
+    registry.load(budget, st.session_state["whatif"].result(budget))
+else:
+    registry.simulate(budget)
+
+# deflate the summaries instead of re-simulating in real terms
+if real_terms:
+    dates = budget.incomes[0].summary.index
+    cpi = pd.Series(constant_cpi(inflation, len(dates) - 1), index=dates[1:])
+    for c in budget.incomes + budget.expenses + budget.savings:
+        c.summary = deflate_summary(c.summary, cpi)
 
 #############
 # VISUALIZE #
@@ -215,7 +263,7 @@ if st.button("Simulate Income"):
     # PLOT CUMULATIVE INCOMES ACROSS TIME #
     #######################################
 
-    fig = plot_components_across_time(
+    kwargs = dict(
         components=budget.incomes,
         from_date=dt.date.today(),
         to_date=dt.date(year_of_death, 1, 1),
@@ -223,7 +271,13 @@ if st.button("Simulate Income"):
         cumulative=False,
         agg="mean",
     )
-    st.pyplot(fig)
+    if interactive:
+        # zooming and range selection happen in the browser without reruns
+        spec, data = chart_components_across_time(**kwargs)
+        st.vega_lite_chart(data, spec)
+    else:
+        fig = plot_components_across_time(**kwargs)
+        st.pyplot(fig)
 
 
 if st.button("Simulate Saving"):
@@ -231,7 +285,7 @@ if st.button("Simulate Saving"):
     # PLOT SAVINGS ACROSS TIME #
     #######################################
 
-    fig = plot_components_across_time(
+    kwargs = dict(
         components=budget.savings,
         from_date=dt.date.today(),
         to_date=dt.date(year_of_death, 1, 1),
@@ -239,7 +293,12 @@ if st.button("Simulate Saving"):
         cumulative=True,
         agg="sum",
     )
-    st.pyplot(fig)
+    if interactive:
+        spec, data = chart_components_across_time(**kwargs)
+        st.vega_lite_chart(data, spec)
+    else:
+        fig = plot_components_across_time(**kwargs)
+        st.pyplot(fig)
 
 
 if False:
@@ -283,3 +342,6 @@ if False:
     #############################################
     # PLOT SAVINGS BUDGET ACROSS TIME
     #############################################
+
+if metrics_file:
+    REGISTRY.write(metrics_file)
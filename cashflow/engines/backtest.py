@@ -0,0 +1,139 @@
+"""Replay historical rates through every rolling start year of a plan."""
+import re
+import typing as T
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.vectorized import VectorizedBudget, VectorizedResult
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+
+def load_history(path: str | Path, date_column: str = "date") -> pd.DataFrame:
+    """Monthly history of annual rates from a local csv, one column per series.
+
+    Rates are fractions (0.05 for 5%). Yearly or irregular observations are
+    forward filled to every month.
+    """
+    df = pd.read_csv(path, parse_dates=[date_column]).set_index(date_column)
+    df = df.sort_index()
+    df.index = df.index.to_period("M")
+    df = df[~df.index.duplicated(keep="last")]
+    months = pd.period_range(df.index[0], df.index[-1], freq="M")
+    return df.reindex(months).ffill()
+
+
+def rolling_windows(
+    series: np.ndarray, n_months: int, step: int = 12, offset: int = 0
+) -> np.ndarray:
+    """(windows, n_months) strided view of series, one window every step months."""
+    return sliding_window_view(series, n_months)[offset::step]
+
+
+@dataclass
+class BacktestResult:
+    """One simulated scenario per historical start month."""
+
+    starts: T.List[pd.Period]
+    result: VectorizedResult
+
+    @property
+    def success_rate(self) -> float:
+        return float((self.result.run_out < 0).mean())
+
+    def summary(self) -> pd.DataFrame:
+        final_balances = self.result.final_balances()
+        return pd.DataFrame(
+            {
+                "run_out_date": self.result.run_out_dates(),
+                "survived": self.result.run_out < 0,
+                "margin": self.result.margin,
+                "final_wealth": final_balances.sum(axis=1),
+            },
+            index=pd.Index([str(x) for x in self.starts], name="start"),
+        )
+
+    def worst_window(self) -> str:
+        """The start that ran out of money first, else the one ending poorest."""
+        run_out = np.where(self.result.run_out >= 0, self.result.run_out, np.inf)
+        wealth = self.result.final_balances().sum(axis=1)
+        return str(self.starts[np.lexsort((wealth, run_out))[0]])
+
+
+class Backtest:
+    """Run a budget through every rolling window of a rate history as one batch.
+
+    rates maps parameters to columns of the history. Savings interest rates follow
+    the historical path through the window (annual rates are converted to monthly
+    ones for savings with monthly interests); every other parameter, e.g. a
+    credit's annual_interest_rate, is fixed at its value at the start of the
+    window, like a fixed rate mortgage taken that month. Windows start every step
+    months in the calendar month of the budget's first simulated month, and the
+    windows are strided views over the history rather than copies.
+    """
+
+    def __init__(
+        self,
+        budget: Budget | VectorizedBudget,
+        history: pd.DataFrame,
+        rates: T.Dict[str, str],
+        n_years: int,
+        step: int = 12,
+    ):
+        self.engine = (
+            budget if isinstance(budget, VectorizedBudget) else VectorizedBudget(budget)
+        )
+        self.n_months = 12 * n_years
+        assert (
+            self.n_months <= self.engine.n_months
+        ), f"The budget only covers {self.engine.n_months // 12} years."
+        assert (
+            len(history) >= self.n_months
+        ), f"The history is shorter than {n_years} years."
+        first_month = self.engine.dates[0].month
+        offset = int(np.argmax(history.index.month == first_month))
+
+        self.paths: T.Dict[str, np.ndarray] = {}
+        self.parameters: T.Dict[str, np.ndarray] = {}
+        for parameter, column in rates.items():
+            key = self.engine.resolve(parameter)
+            annual_rates = history[column].to_numpy(dtype=float)
+            match = re.fullmatch(r"savings\[(\d+)\]\.interest_rate", key)
+            if match is None:
+                self.parameters[key] = rolling_windows(
+                    annual_rates, self.n_months, step, offset
+                )[:, 0]
+                continue
+            annually = self.engine.savings[int(match.group(1))]
+            monthly_rates = (
+                annual_rates if annually else (1 + annual_rates) ** (1 / 12) - 1
+            )
+            self.paths[key] = rolling_windows(
+                monthly_rates, self.n_months, step, offset
+            )
+            pass
+        self.starts = list(
+            history.index[offset : len(history) - self.n_months + 1 : step]
+        )
+        pass
+
+    def run(self, parameters: T.Dict[str, T.Any] | None = None) -> BacktestResult:
+        """Simulate all windows; parameters holds further (scalar) overrides."""
+        result = self.engine.run(
+            parameters={**self.parameters, **(parameters or {})},
+            until=self.engine.dates[self.n_months - 1],
+            rate_paths=self.paths,
+        )
+        backtest = BacktestResult(starts=self.starts, result=result)
+        logger.info(
+            f"BACKTEST: {len(self.starts)} windows of {self.n_months // 12} years, "
+            f"{backtest.success_rate:.0%} survived, worst start "
+            f"{backtest.worst_window()}."
+        )
+        return backtest
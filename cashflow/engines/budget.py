@@ -2,10 +2,16 @@ import typing as T
 import pandas as pd
 import datetime as dt
 from cashflow.engines.components import Income, Expense, Saving, Credit
+from cashflow.engines.drawdown import DrawdownPolicy
+from cashflow.engines.protocol import KINDS, kind_of, simulate_budget
+from cashflow.engines.stepped import SteppedBudget
 from cashflow.utils.logging_utils import init_logger
+from cashflow.utils.metrics import timed
 
 logger = init_logger()
 
+ENGINES = ["legacy", "vectorized", "kernel"]
+
 
 class Budget:
     def __init__(
@@ -14,39 +20,68 @@ class Budget:
         expenses: T.List[Expense],
         savings: T.List[Saving],
         credits: T.List[Credit],
+        engine: str = "legacy",
+        others: T.List | None = None,
+        frequency: str = "monthly",
+        frequencies: T.Dict[str, str] | None = None,
+        drawdown: DrawdownPolicy | None = None,
     ):
-        self.incomes = incomes
-        self.expenses = expenses + [c.interests for c in credits]
-        self.savings = savings + [c.ownership for c in credits]
-        self.credits = credits
+        """others holds components of further kinds registered in protocol.KINDS.
+
+        frequency is the step of the simulation and frequencies maps component
+        names to the frequency they pay or compound at (see SteppedBudget); both
+        need one of the array engines.
+
+        drawdown covers negative months the bank account can't from other
+        savings (see cashflow.engines.drawdown); it needs an array engine too.
+        """
+        assert engine in ENGINES, f"engine must be one of {ENGINES}."
+        assert (engine != "legacy") or (
+            frequency == "monthly" and not frequencies
+        ), "The legacy engine only steps monthly."
+        assert (engine != "legacy") or (
+            drawdown is None
+        ), "The legacy engine only draws from the bank account."
+        self.engine = engine
+        self.frequency = frequency
+        self.frequencies = frequencies
+        self.drawdown = drawdown
+        self.components = {name: [] for name in KINDS}
+        for component in incomes + expenses + savings + credits + (others or []):
+            self.components[kind_of(component).name].append(component)
+            pass
+        # owned components (e.g. the interests and ownership of a credit) follow
+        for kind in KINDS.values():
+            for component in list(self.components[kind.name]):
+                for name, owned in kind.expand(component).items():
+                    self.components[name] += owned
+                pass
+        self.incomes = self.components["incomes"]
+        self.expenses = self.components["expenses"]
+        self.savings = self.components["savings"]
+        self.credits = self.components["credits"]
         pass
 
+    @timed(
+        "cashflow_budget_run_seconds",
+        "Duration of Budget.run.",
+        labels=lambda self: {"engine": self.engine},
+    )
     def run(self):
+        if self.engine != "legacy":
+            return self._run_compiled()
         for month in range(60 * 12):
             self.update()
             date = self.incomes[0].current_date
 
-            # payouts
+            # payouts, expenses, savings and credits (in the order of the kinds)
             money = 0
-            for income in self.incomes:
-                money += income.payout()
-                pass
-
-            # expenses
-            for expense in self.expenses:
-                if not expense.is_credit_controlled:
-                    money -= expense.spend()
-                pass
-
-            # savings
-            for saving in self.savings[1:]:
-                if not saving.is_credit_controlled:
-                    money -= saving.deposit()
-                pass
-
-            # credits
-            for credit in self.credits:
-                money -= credit.payoff()
+            for kind in KINDS.values():
+                for component in self.components[kind.name]:
+                    amount = kind.step(self, component)
+                    if amount is not None:
+                        money += kind.sign * amount
+                    pass
                 pass
 
             # check balance
@@ -62,22 +97,37 @@ class Budget:
             # add remainder to bank account
             self.savings[0].deposit(money)
 
-            # get (positive) saving interests
-            for saving in self.savings:
-                saving.get_interests()
+            # get (positive) saving interests and add (negative) credit interests
+            for kind in KINDS.values():
+                for component in self.components[kind.name]:
+                    kind.settle(self, component)
+                    pass
                 pass
 
-            # add (negative) credit interests
-            for credit in self.credits:
-                credit.add_interests()
-                pass
+    def _run_compiled(self):
+        """Simulate all months at once and load the results into the components."""
+        if (self.frequency != "monthly") or self.frequencies:
+            stepped = SteppedBudget(self, self.frequency, self.frequencies)
+            result = stepped.run(kernel=self.engine == "kernel", drawdown=self.drawdown)
+            stepped.load(result)
+        else:
+            result = simulate_budget(
+                self, kernel=self.engine == "kernel", drawdown=self.drawdown
+            )
+        if result.run_out[0] >= 0:
+            logger.error(f"{result.run_out_dates()[0]}: You've run out of money!")
+        pass
 
+    @timed("cashflow_budget_get_summary_seconds", "Duration of Budget.get_summary.")
     def get_summary(self):
-        for x in self.incomes + self.expenses + self.savings:
-            x.get_summary()
+        for kind in KINDS.values():
+            if kind.has_summary:
+                for x in self.components[kind.name]:
+                    x.get_summary()
+        pass
 
     def update(self):
-        for x in self.incomes + self.expenses + self.savings + self.credits:
+        for x in [x for kind in KINDS.values() for x in self.components[kind.name]]:
             x.update()
             pass
         pass
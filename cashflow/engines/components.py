@@ -1,14 +1,62 @@
+import abc
 import typing as T
 import pandas as pd
 from dateutil.relativedelta import relativedelta
 import datetime as dt
 from cashflow.utils.colors import colors
 from cashflow.utils.logging_utils import init_logger
+from cashflow.utils.metrics import REGISTRY
 
 logger = init_logger()
 
 
-class Income:
+class CachedSummary(abc.ABC):
+    """Summary built lazily from the ledgers and cached until they change.
+
+    Every change of a ledger bumps a version; the summary is rebuilt on first
+    access after that. Plotting, Budget.get_summary and exports all read the
+    same cached frame, so it must not be modified in place. Assigning summary
+    (e.g. a deflated copy) replaces the cached frame until the next change.
+    """
+
+    _version = 0
+    _summary = None
+    _summary_key = None
+
+    def _changed(self):
+        self._version += 1
+
+    def _ledger_key(self) -> T.Hashable:
+        return self._version
+
+    @abc.abstractmethod
+    def _build_summary(self) -> pd.DataFrame:
+        """Summary of the ledgers as they are now."""
+
+    @property
+    def summary(self) -> pd.DataFrame:
+        key = self._ledger_key()
+        hit = (self._summary is not None) and (self._summary_key == key)
+        REGISTRY.inc(
+            "cashflow_summary_cache_total",
+            "Summary lookups, by whether the cached summary was still valid.",
+            result="hit" if hit else "miss",
+        )
+        if not hit:
+            self._summary = self._build_summary()
+            self._summary_key = key
+        return self._summary
+
+    @summary.setter
+    def summary(self, summary: pd.DataFrame):
+        self._summary = summary
+        self._summary_key = self._ledger_key()
+
+    def get_summary(self) -> pd.DataFrame:
+        return self.summary
+
+
+class Income(CachedSummary):
     def __init__(
         self,
         name: str = "income",
@@ -46,6 +94,7 @@ class Income:
             self.monthly_amount + self.cumulative_amounts.loc[self.last_date]
         )
         self.last_date = self.current_date
+        self._changed()
         return self.monthly_amount
 
     def update(self):
@@ -56,16 +105,31 @@ class Income:
         if self.current_date > self.last_income_date:
             self.monthly_amount = 0
 
-    def get_summary(self):
+    def load(self, dates: T.List[dt.date], amounts: T.Sequence[float]):
+        """Replace the monthly payouts with precomputed amounts (NaN months are skipped)."""
+        df = pd.DataFrame({"date": dates, "amount": amounts}).dropna()
+        self.monthly_amounts = df.set_index("date")
+        self.cumulative_amounts = pd.concat(
+            [
+                self.cumulative_amounts.iloc[:1],
+                self.monthly_amounts["amount"]
+                .cumsum()
+                .rename("cumulative_amount")
+                .to_frame(),
+            ]
+        )
+        self._changed()
+        pass
+
+    def _build_summary(self) -> pd.DataFrame:
         df = self.monthly_amounts.merge(
             self.cumulative_amounts, on="date", how="right", validate="1:1"
         )
         df["name"] = self.name
-        self.summary = df
         return df
 
 
-class Expense:
+class Expense(CachedSummary):
     def __init__(
         self,
         name: str = "expense",
@@ -109,6 +173,7 @@ class Expense:
             amount + self.cumulative_amounts.loc[self.last_date]
         )
         self.last_date = self.current_date
+        self._changed()
         return amount
 
     def update(self):
@@ -118,16 +183,31 @@ class Expense:
             self.monthly_amount += self.change_dict.get(self.current_date)
             pass
 
-    def get_summary(self):
+    def load(self, dates: T.List[dt.date], amounts: T.Sequence[float]):
+        """Replace the monthly expenses with precomputed amounts (NaN months are skipped)."""
+        df = pd.DataFrame({"date": dates, "amount": amounts}).dropna()
+        self.monthly_expenses = df.set_index("date")
+        self.cumulative_amounts = pd.concat(
+            [
+                self.cumulative_amounts.iloc[:1],
+                self.monthly_expenses["amount"]
+                .cumsum()
+                .rename("cumulative_amount")
+                .to_frame(),
+            ]
+        )
+        self._changed()
+        pass
+
+    def _build_summary(self) -> pd.DataFrame:
         df = self.monthly_expenses.merge(
             self.cumulative_amounts, on="date", how="right", validate="1:1"
         )
         df["name"] = self.name
-        self.summary = df
         return df
 
 
-class Saving:
+class Saving(CachedSummary):
     def __init__(
         self,
         name: str = "saving",
@@ -184,6 +264,7 @@ class Saving:
         # update current savings
         self.current_savings += amount
 
+        self._changed()
         return amount
 
     def get_interests(
@@ -208,6 +289,7 @@ class Saving:
         )
         # update current savings
         self.current_savings += interests
+        self._changed()
         pass
 
     def update(self):
@@ -215,7 +297,41 @@ class Saving:
         self.current_date += relativedelta(months=+1)
         pass
 
-    def get_summary(self):
+    def load(
+        self,
+        dates: T.List[dt.date],
+        amounts: T.Sequence[float],
+        interests: T.Sequence[float],
+    ):
+        """Replace deposits and interests with precomputed ones (NaN months are skipped)."""
+        deposits = pd.DataFrame({"date": dates, "amount": amounts}).dropna()
+        self.monthly_amounts = pd.concat(
+            [self.monthly_amounts.iloc[:1], deposits.set_index("date")]
+        )
+        self.cumulative_amount = (
+            self.monthly_amounts["amount"]
+            .cumsum()
+            .rename("cumulative_amount")
+            .to_frame()
+        )
+        df = pd.DataFrame({"date": dates, "interest": interests}).dropna()
+        self.monthly_interests = df.set_index("date")
+        self.cumulative_interests = pd.concat(
+            [
+                self.cumulative_interests.iloc[:1],
+                self.monthly_interests["interest"]
+                .cumsum()
+                .rename("cumulative_interests")
+                .to_frame(),
+            ]
+        )
+        self.current_savings = (
+            self.cumulative_amount.iloc[-1, 0] + self.cumulative_interests.iloc[-1, 0]
+        )
+        self._changed()
+        pass
+
+    def _build_summary(self) -> pd.DataFrame:
         df = self.monthly_amounts
         df = df.merge(self.cumulative_amount, on="date", how="right", validate="1:1")
         df = df.merge(self.monthly_interests, on="date", how="left", validate="1:1")
@@ -223,11 +339,10 @@ class Saving:
         df["cumulative_savings"] = df["cumulative_amount"] + df["cumulative_interests"]
         df = df[df.columns[[0, 1, 4, 2, 3]]]
         df["name"] = self.name
-        self.summary = df
         return df
 
 
-class Credit:
+class Credit(CachedSummary):
     def __init__(
         self,
         name="credit",
@@ -240,6 +355,8 @@ class Credit:
         self.current_date = today  # internal date reference, to be updated continuously
         self.name = name
         self.initial_amount = initial_payoff
+        self.credit_amount = credit_amount
+        self.loan_duration = loan_duration
         self.credit = pd.DataFrame(
             {"date": [today], "credit": credit_amount - initial_payoff}
         ).set_index("date")
@@ -276,6 +393,7 @@ class Credit:
         self.credit.loc[self.current_date] = (
             self.credit.loc[self.last_date] - self.monthly_payment
         )
+        self._changed()
         return self.monthly_payment
 
     def add_interests(self):
@@ -286,15 +404,22 @@ class Credit:
             self.credit.loc[self.current_date] += interests
             self.interests.monthly_amount = interests / 12
             self.ownership.monthly_amount = self.monthly_payment - interests / 12
+            self._changed()
+        pass
+
+    def _ledger_key(self) -> T.Hashable:
+        return (self._version, self.interests._version, self.ownership._version)
+
+    def load(self, dates: T.List[dt.date], credit: T.Sequence[float]):
+        """Replace the outstanding credit with precomputed values (NaN months are skipped)."""
+        df = pd.DataFrame({"date": dates, "credit": credit}).dropna()
+        self.credit = pd.concat([self.credit.iloc[:1], df.set_index("date")])
+        self._changed()
         pass
 
-    def get_summary(self):
-        interests_summary = self.interests.get_summary()[
-            ["amount", "cumulative_amount"]
-        ]
-        ownership_summary = self.ownership.get_summary()[
-            ["amount", "cumulative_amount"]
-        ]
+    def _build_summary(self) -> pd.DataFrame:
+        interests_summary = self.interests.summary[["amount", "cumulative_amount"]]
+        ownership_summary = self.ownership.summary[["amount", "cumulative_amount"]]
         interests_summary = interests_summary.rename(
             columns={
                 "amount": "interests",
@@ -0,0 +1,244 @@
+"""Event driven simulation that jumps from one change point to the next."""
+import datetime as dt
+import math
+import typing as T
+from dataclasses import dataclass
+
+import numpy as np
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.vectorized import VectorizedBudget, months_between
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+
+def grow(balance: float, deposit: float, rate: float, n_months: int) -> float:
+    """Balance after n_months of b_t = b_{t-1} * (1 + rate) + deposit."""
+    if rate == 0:
+        return balance + n_months * deposit
+    growth = (1 + rate) ** n_months
+    return balance * growth + deposit * (growth - 1) / rate
+
+
+def months_until_run_out(
+    balance: float, money: float, rate: float, n_months: int
+) -> int | None:
+    """First month of a segment where the bank account can't cover money < 0.
+
+    The bank balance is monotone within a segment, so the month is found in
+    closed form and only checked against its neighbours.
+    """
+    if money >= 0:
+        return None
+
+    def ran_out(k: int) -> bool:
+        return grow(balance, money, rate, k) + money <= 0
+
+    if ran_out(0):
+        return 0
+    if rate == 0:
+        k = math.ceil(-balance / money - 1)
+    else:
+        # balance_k = c * (1 + rate) ** k + limit, decreasing if c < 0
+        limit = -money / rate
+        c = balance - limit
+        if c >= 0 or limit + money <= 0:
+            return None if c >= 0 else 0
+        k = math.ceil(math.log((limit + money) / -c) / math.log(1 + rate))
+    k = max(k, 0)
+    while k > 0 and ran_out(k - 1):
+        k -= 1
+    while k < n_months and not ran_out(k):
+        k += 1
+    return k if k < n_months else None
+
+
+@dataclass
+class EventResult:
+    """Balances at every segment boundary of an event driven simulation."""
+
+    dates: T.List[dt.date]
+    months: np.ndarray
+    names: T.Dict[str, T.List[str]]
+    balances: np.ndarray
+    credits: np.ndarray
+    run_out: int
+    run_out_date: dt.date | None
+
+    def final_balances(self) -> np.ndarray:
+        return self.balances[-1]
+
+
+class EventDrivenBudget:
+    """Simulate a single scenario of a budget by advancing between events.
+
+    Between two events all monthly amounts and interest rates are constant, so
+    savings, the bank residual and the outstanding credits are advanced with
+    geometric sums. Events are raises (change_dict entries), the month after the
+    last income date, January and February for annual interests, the month after
+    every loan anniversary and the end of each loan term. The cost scales with
+    the number of events rather than months times components.
+    """
+
+    def __init__(self, budget: Budget | VectorizedBudget, n_months: int = 60 * 12):
+        self.engine = (
+            budget
+            if isinstance(budget, VectorizedBudget)
+            else VectorizedBudget(budget, n_months)
+        )
+        self.n_months = self.engine.n_months
+        self.names = self.engine.names
+        pass
+
+    def _scalar_parameters(
+        self, parameters: T.Dict[str, T.Any] | None
+    ) -> T.Dict[str, float]:
+        n_scenarios, values = self.engine._parameter_values(parameters)
+        assert n_scenarios == 1, "The event driven engine simulates one scenario."
+        return {k: float(v[0, 0]) for k, v in values.items()}
+
+    def events(
+        self, parameters: T.Dict[str, T.Any] | None = None
+    ) -> T.List[T.Tuple[int, str, str]]:
+        """All change points as (month, component, description), sorted by month."""
+        return self._events(self._scalar_parameters(parameters))
+
+    def _events(self, p: T.Dict[str, float]) -> T.List[T.Tuple[int, str, str]]:
+        e = self.engine
+        events = []
+        for kind, components in [("incomes", e.incomes), ("expenses", e.expenses)]:
+            for i, change_months in enumerate(components):
+                name = e.names[kind][i]
+                for j, month in enumerate(change_months or []):
+                    if month is not None:
+                        events.append((month, name, f"change_by_amounts[{j}]"))
+                if kind == "incomes":
+                    month = int(p[f"incomes[{i}].last_income_date"]) + 1
+                    events.append((month, name, "last income"))
+        for i, annually in enumerate(e.savings):
+            if annually:
+                for month in np.flatnonzero(e.calendar_months == 1) + 1:
+                    events.append((int(month), e.names["savings"][i], "interests"))
+                    events.append((int(month) + 1, e.names["savings"][i], "interests"))
+        for i, name in enumerate(e.names["credits"]):
+            for month in range(13, self.n_months + 1, 12):
+                events.append((month, name, "interests capitalised"))
+            duration = p[f"credits[{i}].loan_duration"]
+            events.append((int(math.ceil(12 * duration)) + 1, name, "loan term ends"))
+        return sorted(x for x in events if 1 < x[0] <= self.n_months)
+
+    def run(
+        self,
+        parameters: T.Dict[str, T.Any] | None = None,
+        until: dt.date | None = None,
+    ) -> EventResult:
+        """Simulate up to (and including) until; parameters must be scalars."""
+        e = self.engine
+        p = self._scalar_parameters(parameters)
+        n_months = self.n_months
+        if until is not None:
+            n_months = max(min(n_months, months_between(e.start_date, until)), 1)
+        boundaries = sorted(
+            {1, n_months + 1} | {m for m, _, _ in self._events(p) if m <= n_months}
+        )
+
+        # (sign, monthly amount, [(month, change)], last month) of every flow
+        flows = [
+            (1, f"incomes[{i}]", months, p[f"incomes[{i}].last_income_date"])
+            for i, months in enumerate(e.incomes)
+        ] + [
+            (-1, f"expenses[{i}]", months, math.inf)
+            for i, months in enumerate(e.expenses)
+            if months is not None
+        ]
+        flows = [
+            (
+                sign,
+                p[f"{key}.monthly_amount"],
+                [
+                    (m, p[f"{key}.change_by_amounts[{j}]"])
+                    for j, m in enumerate(months)
+                    if m is not None
+                ],
+                last,
+            )
+            for sign, key, months, last in flows
+        ]
+
+        n_credits = len(e.names["credits"])
+        n_savings = len(e.savings) - n_credits
+        principals = [
+            p[f"credits[{i}].credit_amount"] - p[f"credits[{i}].initial_payoff"]
+            for i in range(n_credits)
+        ]
+        credit_rates = [
+            p[f"credits[{i}].annual_interest_rate"] for i in range(n_credits)
+        ]
+        payments = []
+        for principal, rate, i in zip(principals, credit_rates, range(n_credits)):
+            duration = p[f"credits[{i}].loan_duration"]
+            payments.append(
+                principal / duration / 12
+                if rate == 0
+                else (1 + rate) ** (duration - 1)
+                / ((1 + rate) ** duration - 1)
+                * principal
+                * rate
+                / 12
+            )
+        credits = list(principals)
+        credit_interests = [0.0] * n_credits
+        balances = [p[f"savings[{i}].initial_amount"] for i in range(n_savings)]
+        balances += [0.0] * n_credits
+        monthly_deposits = [
+            p.get(f"savings[{i}].monthly_amount", 0) for i in range(1, n_savings)
+        ]
+        interest_rates = [
+            p[f"savings[{i}].interest_rate"] for i in range(len(e.savings))
+        ]
+        months, history, credit_history = [0], [list(balances)], [list(credits)]
+        run_out = -1
+
+        for start, stop in zip(boundaries[:-1], boundaries[1:]):
+            n = stop - start
+            money = sum(
+                sign * (amount + sum(a for m, a in changes if m <= start))
+                for sign, amount, changes, last in flows
+                if start <= last
+            )
+            deposits = [0.0] + monthly_deposits
+            money -= sum(deposits) + sum(payments)
+            deposits += [x - i / 12 for x, i in zip(payments, credit_interests)]
+            is_january = e.calendar_months[start - 1] == 1
+            rates = [
+                r if (not annually) or is_january else 0
+                for r, annually in zip(interest_rates, e.savings)
+            ]
+
+            k = months_until_run_out(balances[0], money, rates[0], n)
+            if k is not None:
+                # stop right before the month where the money runs out
+                n, run_out = k, start + k - 1
+            deposits[0] = money
+            balances = [grow(b, d, r, n) for b, d, r in zip(balances, deposits, rates)]
+            credits = [c - n * x for c, x in zip(credits, payments)]
+            if (run_out < 0) and (stop - 1) % 12 == 0:
+                credit_interests = [c * r for c, r in zip(credits, credit_rates)]
+                credits = [c + i for c, i in zip(credits, credit_interests)]
+            months.append(start + n - 1)
+            history.append(list(balances))
+            credit_history.append(list(credits))
+            if run_out >= 0:
+                break
+            pass
+
+        return EventResult(
+            dates=[e.dates[m - 1] if m > 0 else e.start_date for m in months],
+            months=np.array(months),
+            names=self.names,
+            balances=np.array(history),
+            credits=np.array(credit_history).reshape(len(months), n_credits),
+            run_out=run_out,
+            run_out_date=e.dates[run_out] if run_out >= 0 else None,
+        )
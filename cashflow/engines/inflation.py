@@ -0,0 +1,107 @@
+"""Express simulated amounts in real terms (today's DKK) without re-simulating."""
+import dataclasses
+import datetime as dt
+import typing as T
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cashflow.engines.vectorized import VectorizedResult
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+MONTHLY_SERIES = ["incomes", "expenses", "deposits", "interests", "balances", "credits"]
+
+
+def constant_cpi(annual_rate: float, n_months: int) -> np.ndarray:
+    """Price index after every simulated month for a constant inflation rate."""
+    return (1 + annual_rate) ** (np.arange(1, n_months + 1) / 12)
+
+
+def cpi_from_rates(annual_rates: np.ndarray, n_months: int) -> np.ndarray:
+    """Price index of shape (scenarios, months) from drawn annual inflation rates.
+
+    annual_rates holds one rate per scenario (scenarios,) or a path of annualised
+    rates per scenario and month (scenarios, months).
+    """
+    annual_rates = np.asarray(annual_rates, dtype=float)
+    if annual_rates.ndim == 1:
+        annual_rates = annual_rates[:, None]
+    monthly_growth = np.broadcast_to(
+        (1 + annual_rates) ** (1 / 12), (annual_rates.shape[0], n_months)
+    )
+    return np.cumprod(monthly_growth, axis=1)
+
+
+def cpi_from_csv(
+    path: str | Path,
+    dates: T.List[dt.date],
+    start_date: dt.date,
+    date_column: str = "date",
+    cpi_column: str = "cpi",
+    annual_rate: float = 0.02,
+) -> np.ndarray:
+    """Price index from a local csv, relative to start_date.
+
+    Observations are forward filled onto the monthly dates. Months after the last
+    observation are extrapolated with annual_rate.
+    """
+    df = pd.read_csv(path, parse_dates=[date_column])
+    cpi = df.set_index(date_column)[cpi_column].sort_index()
+    cpi.index = cpi.index.to_period("M")
+    cpi = cpi[~cpi.index.duplicated(keep="last")]
+    months = pd.PeriodIndex([start_date] + list(dates), freq="M")
+    observed = cpi.reindex(cpi.index.union(months)).ffill().reindex(months)
+    assert not np.isnan(
+        observed.iloc[0]
+    ), f"The csv has no observation at or before {start_date}."
+    last = cpi.index[-1]
+    months_after = np.array([(m - last).n if m > last else 0 for m in months])
+    values = observed.to_numpy() * (1 + annual_rate) ** (months_after / 12)
+    return values[1:] / values[0]
+
+
+def deflate(result: VectorizedResult, cpi: np.ndarray) -> VectorizedResult:
+    """Divide every monthly series of a result by a price index.
+
+    cpi is shaped (months,) or (scenarios, months). All series are deflated in one
+    broadcasted division of a single block, and the returned result holds views
+    into that block; dates, names, run-out months and initial balances are shared
+    with the nominal result without copying.
+    """
+    n_months = len(result.dates)
+    cpi = np.asarray(cpi, dtype=float)
+    assert cpi.shape[-1] >= n_months, "The price index must cover every month."
+    cpi = cpi[..., :n_months].reshape(-1, 1, n_months)
+    assert cpi.shape[0] in [
+        1,
+        result.n_scenarios,
+    ], "The price index needs one path or one path per scenario."
+    series = [getattr(result, name) for name in MONTHLY_SERIES]
+    block = np.concatenate(series, axis=1)
+    block /= cpi
+    bounds = np.cumsum([0] + [x.shape[1] for x in series])
+    return dataclasses.replace(
+        result,
+        **{
+            name: block[:, start:stop]
+            for name, start, stop in zip(MONTHLY_SERIES, bounds[:-1], bounds[1:])
+        },
+        taxes=result.taxes / cpi[:, 0] if result.taxes is not None else None,
+        withdrawals=(
+            result.withdrawals / cpi if result.withdrawals is not None else None
+        ),
+    )
+
+
+def deflate_summary(summary: pd.DataFrame, cpi: pd.Series) -> pd.DataFrame:
+    """Deflate the numeric columns of a component summary (indexed by date).
+
+    Cumulative columns are deflated with the price index at their own date.
+    """
+    df = summary.copy()
+    columns = df.select_dtypes("number").columns
+    df[columns] = df[columns].div(cpi.reindex(df.index).fillna(1), axis=0)
+    return df
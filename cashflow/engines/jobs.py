@@ -0,0 +1,502 @@
+"""Resumable batch simulations through a job queue journaled in SQLite.
+
+Every scenario config (as accepted by budget_from_dict, with optional parameter
+overrides) is a row of the jobs table, enqueued once per batch and key so that
+re-enqueueing a client book is a no-op. A runner leases jobs to a pool of worker
+processes and records each outcome, with a pointer to where the worker put the
+result, in a single UPDATE. Only the runner writes to the journal, and a lease
+is only completed by the runner holding it.
+
+Leases expire after lease_seconds unless renewed, and jobs leased by a runner
+process that no longer exists are reclaimed at start, so a run that died halfway
+resumes with the jobs that did not complete. A worker that dies takes the pool
+down with it; its jobs are returned to pending and the pool is recreated.
+Workers write results atomically (to a temporary file that is then renamed), so
+a job repeated after a crash overwrites its own result.
+
+Run with `python -m cashflow.engines.jobs` to run, interrupt and resume a batch.
+"""
+import datetime as dt
+import json
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+import typing as T
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+
+from cashflow.engines.serialization import compile_dict, result_to_dict
+from cashflow.utils.logging_utils import init_logger
+from cashflow.utils.metrics import REGISTRY
+
+logger = init_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY,
+    batch TEXT NOT NULL,
+    key TEXT NOT NULL,
+    config TEXT NOT NULL,
+    parameters TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created TEXT NOT NULL,
+    finished TEXT,
+    UNIQUE (batch, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (batch, status, lease_expires);
+"""
+
+STATUSES = ["pending", "leased", "done", "failed"]
+
+
+@dataclass
+class Job:
+    job_id: int
+    key: str
+    config: T.Dict[str, T.Any]
+    parameters: T.Dict[str, T.Any] | None
+
+
+def runner_id() -> str:
+    """Owner of the leases taken by this process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _alive(owner: str) -> bool:
+    """Whether a lease owner on this host is still running (True elsewhere)."""
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError):
+        return True
+    return True
+
+
+def _now() -> str:
+    return dt.datetime.now().isoformat(timespec="seconds")
+
+
+class JobQueue:
+    """Jobs of one or more batches in a SQLite file (created if missing)."""
+
+    def __init__(self, path: str | Path, lease_seconds: float = 600.0):
+        self.path = str(path)
+        self.lease_seconds = lease_seconds
+        self.connection = sqlite3.connect(self.path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # every committed outcome survives a crash of the process
+        self.connection.execute("PRAGMA synchronous=FULL")
+        self.connection.executescript(SCHEMA)
+        self.owner = runner_id()
+        pass
+
+    def close(self):
+        self.connection.close()
+        pass
+
+    def __enter__(self) -> "JobQueue":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        pass
+
+    def _transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT, so concurrent runners lease disjoint jobs."""
+        queue = self
+
+        class Transaction:
+            def __enter__(self):
+                queue.connection.execute("BEGIN IMMEDIATE")
+                return queue.connection
+
+            def __exit__(self, kind, *args):
+                queue.connection.execute("COMMIT" if kind is None else "ROLLBACK")
+                pass
+
+        return Transaction()
+
+    def enqueue(
+        self,
+        batch: str,
+        configs: T.Iterable[T.Dict[str, T.Any]],
+        keys: T.Iterable[str] | None = None,
+        parameters: T.Iterable[T.Dict[str, T.Any] | None] | None = None,
+    ) -> int:
+        """Add configs to a batch and return how many were new.
+
+        keys identify the jobs within the batch (their position by default);
+        configs already enqueued under the same key are left as they are.
+        """
+        configs = list(configs)
+        keys = [str(k) for k in keys] if keys is not None else None
+        keys = keys or [str(i) for i in range(len(configs))]
+        parameters = list(parameters) if parameters is not None else None
+        parameters = parameters or [None] * len(configs)
+        assert len(keys) == len(configs) == len(parameters), "Give one key per job."
+        created = _now()
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO jobs (batch, key, config, parameters, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        batch,
+                        key,
+                        json.dumps(config),
+                        json.dumps(p) if p is not None else None,
+                        created,
+                    )
+                    for key, config, p in zip(keys, configs, parameters)
+                ],
+            )
+            added = connection.total_changes - before
+        logger.info(f"JOBS: {added} of {len(configs)} jobs added to batch {batch}.")
+        return added
+
+    def reclaim(self, batch: str) -> int:
+        """Put jobs leased by runners on this host that died back to pending."""
+        owners = [
+            owner
+            for (owner,) in self.connection.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE batch = ? AND status = 'leased'",
+                (batch,),
+            )
+            if not _alive(owner)
+        ]
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "UPDATE jobs SET status = 'pending', owner = NULL, "
+                "lease_expires = NULL WHERE batch = ? AND status = 'leased' "
+                "AND owner = ?",
+                [(batch, owner) for owner in owners],
+            )
+            reclaimed = connection.total_changes - before
+        if reclaimed:
+            logger.warning(f"JOBS: reclaimed {reclaimed} jobs of runners that died.")
+        return reclaimed
+
+    def lease(self, batch: str, n: int) -> T.List[Job]:
+        """Lease up to n pending jobs (or jobs whose lease expired)."""
+        now = time.time()
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT job_id, key, config, parameters FROM jobs "
+                "WHERE batch = ? AND (status = 'pending' OR "
+                "(status = 'leased' AND lease_expires < ?)) "
+                "ORDER BY job_id LIMIT ?",
+                (batch, now, n),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET status = 'leased', owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE job_id = ?",
+                [(self.owner, now + self.lease_seconds, row[0]) for row in rows],
+            )
+        return [
+            Job(
+                job_id=job_id,
+                key=key,
+                config=json.loads(config),
+                parameters=json.loads(parameters) if parameters else None,
+            )
+            for job_id, key, config, parameters in rows
+        ]
+
+    def renew(self, job_ids: T.Iterable[int]):
+        """Extend the leases this runner holds on job_ids."""
+        expires = time.time() + self.lease_seconds
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE jobs SET lease_expires = ? "
+                "WHERE job_id = ? AND owner = ? AND status = 'leased'",
+                [(expires, job_id, self.owner) for job_id in job_ids],
+            )
+        pass
+
+    def complete(self, job_id: int, result: str) -> bool:
+        """Mark a leased job done with a pointer to its result.
+
+        False if the lease was lost (expired and taken by another runner).
+        """
+        with self._transaction() as connection:
+            changed = connection.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, "
+                "owner = NULL, lease_expires = NULL, finished = ? "
+                "WHERE job_id = ? AND owner = ? AND status = 'leased'",
+                (result, _now(), job_id, self.owner),
+            ).rowcount
+        return changed == 1
+
+    def fail(self, job_id: int, error: str, max_attempts: int = 3) -> bool:
+        """Record an error; the job is retried until it has run max_attempts."""
+        with self._transaction() as connection:
+            changed = connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' "
+                "ELSE 'pending' END, error = ?, owner = NULL, lease_expires = NULL, "
+                "finished = ? WHERE job_id = ? AND owner = ? AND status = 'leased'",
+                (max_attempts, error, _now(), job_id, self.owner),
+            ).rowcount
+        return changed == 1
+
+    def release(self, job_ids: T.Iterable[int]):
+        """Return leases to pending without counting the attempt."""
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE jobs SET status = 'pending', owner = NULL, "
+                "lease_expires = NULL, attempts = attempts - 1 "
+                "WHERE job_id = ? AND owner = ? AND status = 'leased'",
+                [(job_id, self.owner) for job_id in set(job_ids)],
+            )
+        pass
+
+    def progress(self, batch: str) -> T.Dict[str, int]:
+        """Number of jobs of a batch per status."""
+        counts = dict(
+            self.connection.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE batch = ? GROUP BY status",
+                (batch,),
+            ).fetchall()
+        )
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def results(self, batch: str) -> T.Dict[str, str]:
+        """Result pointer of every completed job, by key."""
+        return dict(
+            self.connection.execute(
+                "SELECT key, result FROM jobs WHERE batch = ? AND status = 'done'",
+                (batch,),
+            ).fetchall()
+        )
+
+
+@dataclass
+class SimulationHandler:
+    """Simulate a job with VectorizedBudget and write result_to_dict as JSON.
+
+    Results go to directory/<batch>/<job_id>.json (keys are not safe file
+    names) and the path is the pointer.
+    """
+
+    directory: str
+    batch: str
+    n_months: int = 60 * 12
+    monthly: bool = False
+
+    def __call__(self, job: Job) -> str:
+        engine = compile_dict(job.config, self.n_months)
+        result = engine.run(job.parameters)
+        directory = Path(self.directory) / self.batch
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{job.job_id}.json"
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, delete=False, suffix=".tmp"
+        ) as f:
+            json.dump(result_to_dict(result, monthly=self.monthly), f)
+        os.replace(f.name, path)
+        return str(path)
+
+
+def _run_job(handler: T.Callable[[Job], str], job: Job) -> str:
+    return handler(job)
+
+
+def _make_pool(
+    max_workers: int, max_tasks_per_child: int | None
+) -> ProcessPoolExecutor:
+    """max_tasks_per_child is only passed if given, it needs Python 3.11."""
+    if max_tasks_per_child is None:
+        return ProcessPoolExecutor(max_workers)
+    assert sys.version_info >= (3, 11), "max_tasks_per_child needs Python 3.11."
+    return ProcessPoolExecutor(max_workers, max_tasks_per_child=max_tasks_per_child)
+
+
+def run_batch(
+    queue: JobQueue,
+    batch: str,
+    handler: T.Callable[[Job], str],
+    max_workers: int | None = None,
+    max_attempts: int = 3,
+    max_tasks_per_child: int | None = None,
+    report_every: float = 10.0,
+    progress: T.Callable[[T.Dict[str, int]], None] | None = None,
+) -> T.Dict[str, int]:
+    """Run the pending jobs of a batch on a process pool until none are left.
+
+    handler, a picklable callable Job -> result pointer, runs in the workers;
+    the runner records every outcome as soon as its worker returns, renews the
+    leases of running jobs and reports progress (and calls progress with the
+    counts per status) every report_every seconds. Returns the final counts.
+
+    Workers are replaced after max_tasks_per_child jobs if given (Python 3.11+;
+    they are then spawned rather than forked). If a worker dies, e.g. killed for running out
+    of memory, the pool breaks: the jobs it held go back to pending without
+    counting an attempt and the pool is recreated, up to max_attempts times in a
+    row without any job completing.
+    """
+    queue.reclaim(batch)
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = queue.progress(batch)
+    total, done_before = sum(counts.values()), counts["done"]
+    start = last_report = last_renewal = time.perf_counter()
+    running: T.Dict[Future, Job] = {}
+    breaks = 0
+    pool = _make_pool(max_workers, max_tasks_per_child)
+    try:
+        while True:
+            stranded: T.List[Job] = []
+            # keep every worker busy with one job in flight and one waiting
+            leased = queue.lease(batch, 2 * max_workers - len(running))
+            for i, job in enumerate(leased):
+                try:
+                    running[pool.submit(_run_job, handler, job)] = job
+                except BrokenProcessPool:
+                    stranded += leased[i:]
+                    break
+            if not running and not stranded:
+                break
+            finished, _ = wait(
+                running,
+                timeout=min(report_every, queue.lease_seconds / 3),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in finished:
+                job = running.pop(future)
+                try:
+                    recorded = queue.complete(job.job_id, future.result())
+                    outcome = "done"
+                    breaks = 0
+                except BrokenProcessPool:
+                    stranded.append(job)
+                    continue
+                except Exception as e:
+                    recorded = queue.fail(job.job_id, repr(e), max_attempts)
+                    outcome = "error"
+                    logger.warning(f"JOBS: job {job.key} of {batch} failed: {e!r}")
+                if not recorded:
+                    outcome = "lost"
+                    logger.warning(f"JOBS: lost the lease of job {job.key}.")
+                REGISTRY.inc(
+                    "cashflow_jobs_total", "Jobs run, by outcome.", outcome=outcome
+                )
+                pass
+            if stranded:
+                # every job still on the broken pool fails the same way
+                stranded += running.values()
+                running = {}
+                queue.release(job.job_id for job in stranded)
+                pool.shutdown(wait=False, cancel_futures=True)
+                breaks += 1
+                if breaks > max_attempts:
+                    raise RuntimeError(
+                        f"The worker pool broke {breaks} times in a row."
+                    )
+                logger.warning(
+                    f"JOBS: a worker died, {len(stranded)} jobs of {batch} "
+                    f"return to pending and the pool is recreated."
+                )
+                pool = _make_pool(max_workers, max_tasks_per_child)
+            now = time.perf_counter()
+            if now - last_renewal > queue.lease_seconds / 3:
+                queue.renew(job.job_id for job in running.values())
+                last_renewal = now
+            if now - last_report > report_every:
+                counts = _report(queue, batch, total, done_before, now - start)
+                if progress is not None:
+                    progress(counts)
+                last_report = now
+            pass
+    finally:
+        queue.release(job.job_id for job in running.values())
+        pool.shutdown(cancel_futures=True)
+    counts = _report(queue, batch, total, done_before, time.perf_counter() - start)
+    if progress is not None:
+        progress(counts)
+    return counts
+
+
+def _report(
+    queue: JobQueue, batch: str, total: int, done_before: int, seconds: float
+) -> T.Dict[str, int]:
+    counts = queue.progress(batch)
+    rate = (counts["done"] - done_before) / max(seconds, 1e-9)
+    left = counts["pending"] + counts["leased"]
+    eta = f", {left / rate:.0f}s left" if rate > 0 and left else ""
+    logger.info(
+        f"JOBS: {batch}: {counts['done']}/{total} done, {counts['failed']} failed, "
+        f"{rate:.1f} jobs/s{eta}."
+    )
+    return counts
+
+
+if __name__ == "__main__":
+    import multiprocessing
+    import shutil
+    import signal
+
+    import numpy as np
+
+    directory = Path(tempfile.mkdtemp(prefix="cashflow-jobs-"))
+    config = {
+        "incomes": [{"name": "Salary", "monthly_amount": 35000}],
+        "expenses": [{"name": "Living", "monthly_amount": 15000}],
+        "savings": [
+            {"name": "Bank", "initial_amount": 50000, "interest_rate": 0.0},
+            {
+                "name": "Stocks",
+                "initial_amount": 0,
+                "monthly_amount": 4000,
+                "interest_rate": 0.06,
+                "interest_frequency": "annually",
+            },
+        ],
+        "credits": [
+            {"name": "House", "credit_amount": 2000000, "annual_interest_rate": 0.04}
+        ],
+    }
+    living = np.linspace(5000, 25000, 400)
+    handler = SimulationHandler(str(directory / "results"), batch="nightly")
+
+    def first_run():
+        # own process group, so the crash below takes the workers down too
+        os.setsid()
+        with JobQueue(directory / "jobs.sqlite") as queue:
+            run_batch(queue, "nightly", handler, max_workers=2, report_every=1)
+
+    with JobQueue(directory / "jobs.sqlite") as queue:
+        queue.enqueue(
+            "nightly",
+            [config] * len(living),
+            keys=[f"household-{i}" for i in range(len(living))],
+            parameters=[{"Living.monthly_amount": x} for x in living.tolist()],
+        )
+    # kill the first runner halfway and resume in a new one
+    process = multiprocessing.Process(target=first_run)
+    process.start()
+    time.sleep(3)
+    os.killpg(process.pid, signal.SIGKILL)
+    process.join()
+    with JobQueue(directory / "jobs.sqlite") as queue:
+        logger.info(f"JOBS: after the crash {queue.progress('nightly')}.")
+        start = time.perf_counter()
+        counts = run_batch(queue, "nightly", handler, max_workers=2, report_every=1)
+        logger.info(
+            f"JOBS: resumed in {time.perf_counter() - start:.1f}s, "
+            f"{len(queue.results('nightly'))} results."
+        )
+    shutil.rmtree(directory)
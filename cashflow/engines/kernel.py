@@ -0,0 +1,155 @@
+"""Month loop over flat float64 arrays, compiled with Numba when it is installed.
+
+The bank account of Budget.run is settled month by month: the residual is
+deposited, the negative balance check looks at last month's bank balance and
+interests are paid on last month's balances. month_loop runs exactly that loop
+over precomputed flows (see VectorizedBudget) without Python objects per month.
+Without Numba a NumPy version loops over months only, vectorized over scenarios
+and savings.
+
+Run with `python -m cashflow.engines.kernel` to benchmark the engines.
+"""
+import time
+import typing as T
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+HAS_NUMBA = numba is not None
+
+
+def _month_loop_scalar(
+    money: np.ndarray,
+    deposits: np.ndarray,
+    rates: np.ndarray,
+    initial_balances: np.ndarray,
+) -> T.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    n_scenarios, n_savings, n_months = deposits.shape
+    balances = np.empty_like(deposits)
+    interests = np.empty_like(deposits)
+    run_out = np.full(n_scenarios, -1, dtype=np.int64)
+    margin = np.full(n_scenarios, np.inf)
+    for s in range(n_scenarios):
+        for t in range(n_months):
+            previous_bank = initial_balances[s, 0] if t == 0 else balances[s, 0, t - 1]
+            if money[s, t] < 0:
+                buffer = previous_bank + money[s, t]
+                if buffer < margin[s]:
+                    margin[s] = buffer
+                if (buffer <= 0) and (run_out[s] < 0):
+                    run_out[s] = t
+            for k in range(n_savings):
+                previous = initial_balances[s, k] if t == 0 else balances[s, k, t - 1]
+                interests[s, k, t] = previous * rates[s, k, t]
+                balances[s, k, t] = previous + interests[s, k, t] + deposits[s, k, t]
+    return balances, interests, run_out, margin
+
+
+def _month_loop_numpy(
+    money: np.ndarray,
+    deposits: np.ndarray,
+    rates: np.ndarray,
+    initial_balances: np.ndarray,
+) -> T.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    n_scenarios, n_savings, n_months = deposits.shape
+    balances = np.empty_like(deposits)
+    interests = np.empty_like(deposits)
+    run_out = np.full(n_scenarios, -1, dtype=np.int64)
+    margin = np.full(n_scenarios, np.inf)
+    previous = initial_balances.copy()
+    for t in range(n_months):
+        buffer = np.where(money[:, t] < 0, previous[:, 0] + money[:, t], np.inf)
+        np.minimum(margin, buffer, out=margin)
+        run_out[(buffer <= 0) & (run_out < 0)] = t
+        np.multiply(previous, rates[:, :, t], out=interests[:, :, t])
+        previous += interests[:, :, t]
+        previous += deposits[:, :, t]
+        balances[:, :, t] = previous
+    return balances, interests, run_out, margin
+
+
+_month_loop = (
+    numba.njit(cache=True)(_month_loop_scalar) if HAS_NUMBA else _month_loop_numpy
+)
+
+
+def month_loop(
+    money: np.ndarray,
+    deposits: np.ndarray,
+    rates: np.ndarray,
+    initial_balances: np.ndarray,
+) -> T.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Settle the savings month by month.
+
+    money (scenarios, months) is the residual deposited in savings[0], which must
+    already be included in deposits (scenarios, savings, months). Returns balances,
+    interests, the first month the bank can't cover a negative residual (-1 if
+    never) and the smallest remaining buffer, like settle().
+    """
+    return _month_loop(
+        *(
+            np.ascontiguousarray(x, dtype=np.float64)
+            for x in (money, deposits, rates, initial_balances)
+        )
+    )
+
+
+if __name__ == "__main__":
+    import datetime as dt
+
+    from cashflow.engines.budget import Budget
+    from cashflow.engines.components import Income, Expense, Saving, Credit
+    from cashflow.engines.vectorized import VectorizedBudget
+
+    def example(engine: str) -> Budget:
+        return Budget(
+            incomes=[
+                Income(
+                    name="Salary",
+                    monthly_amount=35000.0,
+                    change_at_dates=[dt.date(2030, 1, 1)],
+                    change_by_amounts=[3000.0],
+                )
+            ],
+            expenses=[Expense(name="Living", monthly_amount=15000.0)],
+            savings=[
+                Saving(name="Bank", initial_amount=50000.0, interest_rate=0.0),
+                Saving(
+                    name="Stocks",
+                    initial_amount=0.0,
+                    monthly_amount=4000.0,
+                    interest_rate=0.06,
+                    interest_frequency="annually",
+                ),
+            ],
+            credits=[
+                Credit(name="House", credit_amount=2e6, annual_interest_rate=0.04)
+            ],
+            engine=engine,
+        )
+
+    for engine in ["legacy", "vectorized", "kernel"]:
+        start = time.perf_counter()
+        example(engine).run()
+        logger.info(
+            f"KERNEL: Budget.run with engine={engine} took {time.perf_counter() - start:.3f}s."
+        )
+
+    engine = VectorizedBudget(example("legacy"))
+    values = np.linspace(10000, 30000, 10000)
+    for kernel in [False, True]:
+        engine.run({"Living.monthly_amount": values[:10]}, kernel=kernel)  # compile
+        start = time.perf_counter()
+        engine.run({"Living.monthly_amount": values}, kernel=kernel)
+        logger.info(
+            f"KERNEL: {len(values)} scenarios with kernel={kernel} (numba={HAS_NUMBA}) "
+            f"took {time.perf_counter() - start:.3f}s."
+        )
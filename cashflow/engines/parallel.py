@@ -0,0 +1,228 @@
+"""Parallel Monte Carlo and sweeps that return results through shared memory."""
+import dataclasses
+import datetime as dt
+import typing as T
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.drawdown import DrawdownPolicy
+from cashflow.engines.inflation import MONTHLY_SERIES
+from cashflow.engines.vectorized import (
+    VectorizedBudget,
+    VectorizedResult,
+    months_between,
+)
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+Sampler = T.Callable[[np.random.Generator, int], T.Dict[str, np.ndarray]]
+
+
+@dataclasses.dataclass
+class SharedResult:
+    """Results of a parallel run, held in one shared memory block.
+
+    values is shaped (scenarios, months, metrics) with metrics ordered as in
+    `metrics` (e.g. "incomes:Salary", "balances:Bank"). Call close() (or use the
+    result as a context manager) to free the block; views taken from it must not
+    be used afterwards.
+    """
+
+    dates: T.List[dt.date]
+    names: T.Dict[str, T.List[str]]
+    metrics: T.List[str]
+    values: np.ndarray
+    initial_balances: np.ndarray
+    run_out: np.ndarray
+    margin: np.ndarray
+    shm: shared_memory.SharedMemory
+
+    def metric(self, name: str) -> np.ndarray:
+        """(scenarios, months) view of one metric."""
+        return self.values[:, :, self.metrics.index(name)]
+
+    def as_vectorized(self) -> VectorizedResult:
+        """VectorizedResult whose series are (transposed) views of the block."""
+        series, start = {}, 0
+        for name in MONTHLY_SERIES:
+            n = sum(m.startswith(f"{name}:") for m in self.metrics)
+            series[name] = self.values[:, :, start : start + n].transpose(0, 2, 1)
+            start += n
+        return VectorizedResult(
+            dates=self.dates,
+            names=self.names,
+            initial_balances=self.initial_balances,
+            run_out=self.run_out,
+            margin=self.margin,
+            **series,
+        )
+
+    def close(self):
+        self.values = None
+        self.shm.close()
+        self.shm.unlink()
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _metrics(names: T.Dict[str, T.List[str]]) -> T.List[str]:
+    series_names = {
+        "incomes": names["incomes"],
+        "expenses": names["expenses"],
+        "deposits": names["savings"],
+        "interests": names["savings"],
+        "balances": names["savings"],
+        "credits": names["credits"],
+    }
+    return [f"{s}:{n}" for s in MONTHLY_SERIES for n in series_names[s]]
+
+
+_engine: VectorizedBudget | None = None
+
+
+def _init_worker(engine: VectorizedBudget):
+    global _engine
+    _engine = engine
+    pass
+
+
+def _run_chunk(
+    shm_name: str,
+    shape: T.Tuple[int, int, int],
+    start: int,
+    stop: int,
+    parameters: T.Dict[str, np.ndarray],
+    sampler: Sampler | None,
+    seed: np.random.SeedSequence,
+    until: dt.date | None,
+    drawdown: DrawdownPolicy | None = None,
+) -> T.Tuple[int, np.ndarray, np.ndarray, np.ndarray]:
+    """Simulate scenarios start:stop and write them straight into the block."""
+    n = stop - start
+    parameters = dict(parameters)
+    if sampler is not None:
+        parameters.update(sampler(np.random.default_rng(seed), n))
+    parameters = {
+        k: np.broadcast_to(np.asarray(v, dtype=float), (n,))
+        for k, v in parameters.items()
+    }
+    result = _engine.run(parameters=parameters, until=until, drawdown=drawdown)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray(shape, dtype=float, buffer=shm.buf)
+        offset = 0
+        for name in MONTHLY_SERIES:
+            series = getattr(result, name)
+            block[start:stop, :, offset : offset + series.shape[1]] = series.transpose(
+                0, 2, 1
+            )
+            offset += series.shape[1]
+        del block
+    finally:
+        shm.close()
+    return (
+        start,
+        np.broadcast_to(result.initial_balances, (n, result.initial_balances.shape[1])),
+        np.broadcast_to(result.run_out, (n,)),
+        np.broadcast_to(result.margin, (n,)),
+    )
+
+
+def run_parallel(
+    budget: Budget | VectorizedBudget,
+    n_scenarios: int,
+    parameters: T.Dict[str, T.Any] | None = None,
+    sampler: Sampler | None = None,
+    seed: int = 0,
+    until: dt.date | None = None,
+    max_workers: int | None = None,
+    chunk_size: int = 256,
+    drawdown: DrawdownPolicy | None = None,
+) -> SharedResult:
+    """Simulate n_scenarios on a process pool, collecting results in shared memory.
+
+    parameters are scalars or arrays of length n_scenarios (a sweep). sampler, a
+    picklable function (rng, n) -> {parameter: array of n}, draws Monte Carlo
+    parameters on top of those. Scenarios are split into chunks of chunk_size,
+    and chunk k always draws from the k-th stream spawned from seed, so the
+    result only depends on seed and chunk_size, not on the number of workers.
+    Workers write their chunk into the block and only return small arrays.
+    drawdown (a picklable policy) covers shortfalls from other savings.
+    """
+    engine = (
+        budget if isinstance(budget, VectorizedBudget) else VectorizedBudget(budget)
+    )
+    n_months = engine.n_months
+    if until is not None:
+        n_months = max(min(n_months, months_between(engine.start_date, until)), 1)
+    metrics = _metrics(engine.names)
+    shape = (n_scenarios, n_months, len(metrics))
+    parameters = {engine.resolve(k): v for k, v in (parameters or {}).items()}
+    for key, value in parameters.items():
+        assert np.ndim(value) == 0 or np.shape(value) == (
+            n_scenarios,
+        ), f"{key} must be a scalar or have one value per scenario."
+
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+    values = np.ndarray(shape, dtype=float, buffer=shm.buf)
+    initial_balances = np.empty((n_scenarios, len(engine.names["savings"])))
+    run_out = np.empty(n_scenarios, dtype=int)
+    margin = np.empty(n_scenarios)
+    starts = range(0, n_scenarios, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(starts))
+    try:
+        with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker, initargs=(engine,)
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _run_chunk,
+                    shm.name,
+                    shape,
+                    start,
+                    min(start + chunk_size, n_scenarios),
+                    {
+                        k: v if np.ndim(v) == 0 else v[start : start + chunk_size]
+                        for k, v in parameters.items()
+                    },
+                    sampler,
+                    chunk_seed,
+                    until,
+                    drawdown,
+                )
+                for start, chunk_seed in zip(starts, seeds)
+            ]
+            for future in futures:
+                start, balances, chunk_run_out, chunk_margin = future.result()
+                stop = start + len(chunk_run_out)
+                initial_balances[start:stop] = balances
+                run_out[start:stop] = chunk_run_out
+                margin[start:stop] = chunk_margin
+    except BaseException:
+        del values
+        shm.close()
+        shm.unlink()
+        raise
+    logger.info(
+        f"PARALLEL: {n_scenarios} scenarios in {len(starts)} chunks, "
+        f"{shm.size / 1e6:.1f} MB shared."
+    )
+    return SharedResult(
+        dates=list(engine.dates[:n_months]),
+        names=engine.names,
+        metrics=metrics,
+        values=values,
+        initial_balances=initial_balances,
+        run_out=run_out,
+        margin=margin,
+        shm=shm,
+    )
@@ -0,0 +1,222 @@
+"""Check that the fast engines reproduce Budget.run on random budgets.
+
+Every case is a random valid budget (incomes with raises and retirement dates,
+expenses, savings with monthly or annual interests, credits) simulated up to a
+random horizon by the legacy object loop and by each fast engine. The ledgers
+of the legacy components are compared month by month, including the months
+that are dropped after running out of money.
+
+Run with `python -m cashflow.engines.parity --cases 10`.
+"""
+import argparse
+import datetime as dt
+import time
+import typing as T
+
+import numpy as np
+import pandas as pd
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.events import EventDrivenBudget
+from cashflow.engines.portfolio import Portfolio
+from cashflow.engines.protocol import simulate_budget
+from cashflow.engines.serialization import budget_from_dict
+from cashflow.engines.vectorized import VectorizedBudget, VectorizedResult
+from cashflow.utils.colors import colors
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+ENGINES = ["vectorized", "kernel", "events", "schedules", "portfolio"]
+
+
+def _first_of_month(rng: np.random.Generator, start: dt.date, max_years: int) -> str:
+    months = int(rng.integers(1, 12 * max_years))
+    year, month = divmod(start.month - 1 + months, 12)
+    return dt.date(start.year + year, month + 1, 1).isoformat()
+
+
+def random_config(rng: np.random.Generator) -> T.Dict[str, T.List[T.Dict]]:
+    """A random budget (as accepted by budget_from_dict) that fits the palette."""
+    start = dt.date.today().replace(day=1)
+    n_credits = int(rng.integers(0, 2))
+    config = {
+        "incomes": [
+            {
+                "name": f"income {i}",
+                "monthly_amount": float(round(rng.uniform(15000, 50000))),
+                "change_at_dates": [
+                    _first_of_month(rng, start, 30) for _ in range(n_raises)
+                ],
+                "change_by_amounts": [
+                    float(round(rng.uniform(-2000, 5000))) for _ in range(n_raises)
+                ],
+                "last_income_date": _first_of_month(rng, start, 45),
+            }
+            for i, n_raises in enumerate(rng.integers(0, 3, rng.integers(1, 4)))
+        ],
+        "expenses": [
+            {
+                "name": f"expense {i}",
+                "monthly_amount": float(round(rng.uniform(2000, 15000))),
+            }
+            for i in range(rng.integers(0, 4 - n_credits))
+        ],
+        "savings": [
+            {
+                "name": f"saving {i}",
+                "initial_amount": float(round(rng.uniform(0, 500000))),
+                "interest_rate": float(rng.uniform(0, 0.06 if i else 0.002)),
+                "interest_frequency": str(rng.choice(["monthly", "annually"])),
+            }
+            | ({"monthly_amount": float(round(rng.uniform(0, 5000)))} if i else {})
+            for i in range(rng.integers(1, 4))
+        ],
+        "credits": [
+            {
+                "name": f"credit {i}",
+                "credit_amount": float(round(rng.uniform(5e5, 4e6))),
+                "initial_payoff": float(round(rng.uniform(0, 5e5))),
+                "loan_duration": float(rng.choice([10, 20, 30])),
+                "annual_interest_rate": float(rng.uniform(0, 0.07)),
+            }
+            for i in range(n_credits)
+        ],
+    }
+    return config
+
+
+def _release(budget: Budget):
+    for c in budget.incomes + budget.expenses + budget.savings:
+        colors.release(type=c.type.lower(), name=c.name)
+    pass
+
+
+def legacy_ledgers(budget: Budget, dates: T.List[dt.date]) -> T.Dict[str, np.ndarray]:
+    """Monthly series of a run Budget, shaped (components, months) with NaN gaps."""
+
+    def series(df: pd.DataFrame, column: str) -> np.ndarray:
+        return df[column].reindex(dates).to_numpy(dtype=float)
+
+    ledgers = {
+        "incomes": [series(x.monthly_amounts, "amount") for x in budget.incomes],
+        "expenses": [series(x.monthly_expenses, "amount") for x in budget.expenses],
+        "balances": [
+            series(x.cumulative_amount, "cumulative_amount")
+            + series(x.cumulative_interests, "cumulative_interests")
+            for x in budget.savings
+        ],
+        "credits": [series(x.credit, "credit") for x in budget.credits],
+    }
+    return {k: np.array(v).reshape(len(v), len(dates)) for k, v in ledgers.items()}
+
+
+def _error(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Largest difference relative to the size of each series; inf if the dropped
+    months differ."""
+    expected, actual = (np.asarray(x, dtype=float) for x in (expected, actual))
+    if not np.array_equal(np.isnan(expected), np.isnan(actual)):
+        return np.inf
+    if expected.size == 0 or np.isnan(expected).all():
+        return 0.0
+    scale = np.maximum(np.nanmax(np.abs(expected), axis=-1, keepdims=True), 1.0)
+    return float(np.nanmax(np.abs(expected - actual) / scale))
+
+
+def _vectorized_error(expected: T.Dict[str, np.ndarray], result: VectorizedResult):
+    return max(_error(expected[kind], getattr(result, kind)[0]) for kind in expected)
+
+
+def check_case(
+    config: T.Dict[str, T.List[T.Dict]],
+    n_months: int,
+    tolerance: float = 1e-8,
+    engines: T.List[str] = ENGINES,
+) -> T.Dict[str, T.Any]:
+    """Run one budget through the legacy loop and every engine; assert agreement."""
+    budget = budget_from_dict(config)
+    engine = VectorizedBudget(budget)
+    until = engine.dates[n_months - 1]
+    dates = engine.dates[:n_months]
+
+    # the legacy loop always runs 60 years (or until the money runs out), so
+    # speedups compare the time per simulated month
+    start = time.perf_counter()
+    budget.run()
+    legacy_time = time.perf_counter() - start
+    legacy_months = len(budget.incomes[0].monthly_amounts)
+    expected = legacy_ledgers(budget, dates)
+    _release(budget)
+
+    row = {
+        "incomes": len(config["incomes"]),
+        "expenses": len(config["expenses"]),
+        "savings": len(config["savings"]),
+        "credits": len(config["credits"]),
+        "months": n_months,
+        "legacy_ms_per_month": 1000 * legacy_time / legacy_months,
+    }
+    for name in engines:
+        fresh = budget_from_dict(config) if name == "schedules" else None
+        start = time.perf_counter()
+        if name == "schedules":
+            # schedules of the component kinds, loaded into a fresh budget
+            result = simulate_budget(fresh, n_months)
+            elapsed = time.perf_counter() - start
+            error = _vectorized_error(expected, result)
+            _release(fresh)
+        elif name == "portfolio":
+            # the middle household of three, to exercise the unpacking
+            portfolio = Portfolio([engine] * 3)
+            result = portfolio.unpack(portfolio.run(until=until), 1)
+            elapsed = time.perf_counter() - start
+            error = _vectorized_error(expected, result)
+        elif name == "events":
+            result = EventDrivenBudget(engine).run(until=until)
+            elapsed = time.perf_counter() - start
+            months = result.months[1:]
+            error = max(
+                _error(expected["balances"][:, months - 1], result.balances[1:].T),
+                _error(expected["credits"][:, months - 1], result.credits[1:].T),
+            )
+        else:
+            result = engine.run(until=until, kernel=name == "kernel")
+            elapsed = time.perf_counter() - start
+            error = _vectorized_error(expected, result)
+        row[f"{name}_error"] = error
+        row[f"{name}_speedup"] = legacy_time / legacy_months * n_months / elapsed
+        pass
+    run_out = engine.run(until=until).run_out_dates()[0]
+    row["run_out"] = run_out
+    failed = [x for x in engines if not row[f"{x}_error"] <= tolerance]
+    assert not failed, f"Engines {failed} disagree with Budget.run for {config}."
+    return row
+
+
+def parity_report(
+    n_cases: int = 10,
+    seed: int = 0,
+    tolerance: float = 1e-8,
+    engines: T.List[str] = ENGINES,
+) -> pd.DataFrame:
+    """One row per random case with the error and speedup of every engine."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for case in range(n_cases):
+        config = random_config(rng)
+        n_months = int(rng.integers(12, 60 * 12 + 1))
+        rows.append(check_case(config, n_months, tolerance, engines))
+        logger.info(f"PARITY: case {case} agrees within {tolerance}.")
+    return pd.DataFrame(rows).rename_axis("case")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--cases", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=1e-8)
+    args = parser.parse_args()
+    report = parity_report(args.cases, args.seed, args.tolerance)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(report)
+        print(report.filter(like="speedup").describe().loc[["min", "50%", "max"]])
@@ -0,0 +1,357 @@
+"""Simulate many budgets at once along a household axis."""
+import datetime as dt
+import time
+import typing as T
+
+import numpy as np
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.vectorized import (
+    VectorizedBudget,
+    VectorizedResult,
+    credit_schedules,
+    month_dates,
+    months_between,
+    settle,
+)
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+
+def changing_amounts(
+    amounts: np.ndarray, changes: T.Tuple[np.ndarray, ...], n_months: int
+) -> np.ndarray:
+    """Monthly amounts of shape (households, components, months).
+
+    changes holds flat (household, component, month, amount) arrays of every
+    change_dict entry, which are scattered onto the month axis and accumulated.
+    """
+    households, components, months, changes_by = changes
+    keep = months <= n_months
+    deltas = np.zeros(amounts.shape + (n_months,))
+    np.add.at(
+        deltas,
+        (households[keep], components[keep], months[keep] - 1),
+        changes_by[keep],
+    )
+    return amounts[..., None] + np.cumsum(deltas, axis=-1)
+
+
+class Portfolio:
+    """Many budgets packed into padded (households, components, months) arrays.
+
+    Households can have different numbers of incomes, expenses, savings and
+    credits; missing components are padded with zeros and flagged in masks.
+    Flows of further registered kinds (VectorizedBudget.fixed) follow the padded
+    incomes and expenses (after the interests of credits) in padded blocks of
+    their own. All households advance together through the phases of Budget.run (payout, spend,
+    deposit, payoff, bank residual, interests), and unpack() returns the result
+    of a single household in the layout of VectorizedBudget.run.
+    """
+
+    def __init__(
+        self, budgets: T.List[Budget | VectorizedBudget], n_months: int = 60 * 12
+    ):
+        engines = [
+            b if isinstance(b, VectorizedBudget) else VectorizedBudget(b, n_months)
+            for b in budgets
+        ]
+        assert (
+            len({e.start_date for e in engines}) == 1
+        ), "All budgets must start at the same date."
+        self.start_date = engines[0].start_date
+        self.n_months = n_months
+        self.n_households = len(engines)
+        self.dates = list(month_dates(self.start_date, n_months))
+        self.calendar_months = np.array([d.month for d in self.dates])
+        self.households = [e.names for e in engines]
+
+        self.n_credits = np.array([len(e.names["credits"]) for e in engines])
+        self.n_incomes = np.array([len(e.incomes) for e in engines])
+        self.n_expenses = np.array([len(e.expenses) for e in engines])
+        self.n_savings = np.array([len(e.savings) for e in engines]) - self.n_credits
+        self.n_fixed = {
+            group: np.array([len(e.fixed[group]) for e in engines])
+            for group in ["incomes", "expenses"]
+        }
+        n_incomes, n_expenses = self.n_incomes.max(), self.n_expenses.max(initial=0)
+        n_savings, n_credits = self.n_savings.max(), self.n_credits.max(initial=0)
+        n_fixed = {k: v.max(initial=0) for k, v in self.n_fixed.items()}
+        shape = (self.n_households,)
+
+        self.income_amounts = np.zeros(shape + (n_incomes,))
+        self.last_income_months = np.full(shape + (n_incomes,), np.inf)
+        self.expense_amounts = np.zeros(shape + (n_expenses,))
+        self.saving_initial_amounts = np.zeros(shape + (n_savings,))
+        self.saving_monthly_amounts = np.zeros(shape + (n_savings,))
+        self.saving_rates = np.zeros(shape + (n_savings + n_credits,))
+        self.saving_annually = np.zeros(shape + (n_savings + n_credits,), dtype=bool)
+        self.credit_principals = np.zeros(shape + (n_credits,))
+        self.credit_rates = np.zeros(shape + (n_credits,))
+        self.credit_durations = np.ones(shape + (n_credits,))
+        self.fixed_amounts = {
+            k: np.zeros(shape + (n, n_months)) for k, n in n_fixed.items()
+        }
+        self.fixed_counts = {k: np.zeros(shape + (n,)) for k, n in n_fixed.items()}
+        income_changes, expense_changes = [], []
+
+        for h, e in enumerate(engines):
+            p = e.defaults
+            for i, change_months in enumerate(e.incomes):
+                self.income_amounts[h, i] = p[f"incomes[{i}].monthly_amount"]
+                self.last_income_months[h, i] = p[f"incomes[{i}].last_income_date"]
+                income_changes += [
+                    (h, i, m, p[f"incomes[{i}].change_by_amounts[{j}]"])
+                    for j, m in enumerate(change_months)
+                    if m is not None
+                ]
+            for i, change_months in enumerate(e.expenses):
+                if change_months is None:
+                    continue
+                self.expense_amounts[h, i] = p[f"expenses[{i}].monthly_amount"]
+                expense_changes += [
+                    (h, i, m, p[f"expenses[{i}].change_by_amounts[{j}]"])
+                    for j, m in enumerate(change_months)
+                    if m is not None
+                ]
+            for i, annually in enumerate(e.savings):
+                # ownerships of credits are placed after the padded plain savings
+                k = i if i < self.n_savings[h] else n_savings + i - self.n_savings[h]
+                self.saving_rates[h, k] = p[f"savings[{i}].interest_rate"]
+                self.saving_annually[h, k] = annually
+                if i < self.n_savings[h]:
+                    self.saving_initial_amounts[h, k] = p[
+                        f"savings[{i}].initial_amount"
+                    ]
+                    self.saving_monthly_amounts[h, k] = p.get(
+                        f"savings[{i}].monthly_amount", 0
+                    )
+            for i in range(self.n_credits[h]):
+                self.credit_principals[h, i] = (
+                    p[f"credits[{i}].credit_amount"] - p[f"credits[{i}].initial_payoff"]
+                )
+                self.credit_rates[h, i] = p[f"credits[{i}].annual_interest_rate"]
+                self.credit_durations[h, i] = p[f"credits[{i}].loan_duration"]
+            for group, flows in e.fixed.items():
+                for i, (name, amounts, counts) in enumerate(flows):
+                    assert len(amounts) >= n_months, (
+                        f"{name}: compiled for {len(amounts)} months, the portfolio "
+                        f"runs {n_months}."
+                    )
+                    self.fixed_amounts[group][h, i] = amounts[:n_months]
+                    self.fixed_counts[group][h, i] = counts
+                pass
+            pass
+
+        def as_arrays(changes):
+            changes = np.array(changes, dtype=float).reshape(-1, 4).T
+            return tuple(changes[:3].astype(int)) + (changes[3],)
+
+        self.income_changes = as_arrays(income_changes)
+        self.expense_changes = as_arrays(expense_changes)
+        self.masks = {
+            "incomes": np.concatenate(
+                [
+                    np.arange(n_incomes) < self.n_incomes[:, None],
+                    np.arange(n_fixed["incomes"]) < self.n_fixed["incomes"][:, None],
+                ],
+                axis=1,
+            ),
+            "expenses": np.concatenate(
+                [
+                    np.arange(n_expenses) < self.n_expenses[:, None],
+                    np.arange(n_credits) < self.n_credits[:, None],
+                    np.arange(n_fixed["expenses"]) < self.n_fixed["expenses"][:, None],
+                ],
+                axis=1,
+            ),
+            "savings": np.concatenate(
+                [
+                    np.arange(n_savings) < self.n_savings[:, None],
+                    np.arange(n_credits) < self.n_credits[:, None],
+                ],
+                axis=1,
+            ),
+            "credits": np.arange(n_credits) < self.n_credits[:, None],
+        }
+        pass
+
+    def run(
+        self,
+        until: dt.date | None = None,
+        households: slice = slice(None),
+    ) -> VectorizedResult:
+        """Simulate (a slice of) all households; the result is padded and masked."""
+        n_months = self.n_months
+        if until is not None:
+            n_months = max(min(n_months, months_between(self.start_date, until)), 1)
+        h = np.arange(self.n_households)[households]
+        t = np.arange(1, n_months + 1)
+
+        def select(changes):
+            keep = np.isin(changes[0], h)
+            return (np.searchsorted(h, changes[0][keep]),) + tuple(
+                x[keep] for x in changes[1:]
+            )
+
+        # payout
+        incomes = changing_amounts(
+            self.income_amounts[h], select(self.income_changes), n_months
+        )
+        incomes[t > self.last_income_months[h][..., None]] = 0
+        # spend
+        expenses = changing_amounts(
+            self.expense_amounts[h], select(self.expense_changes), n_months
+        )
+        # payoff
+        payments, interests, ownerships, before, after = credit_schedules(
+            principal=self.credit_principals[h],
+            rate=self.credit_rates[h],
+            duration=self.credit_durations[h],
+            n_months=n_months,
+        )
+        # deposit
+        deposits = np.concatenate(
+            [
+                np.repeat(self.saving_monthly_amounts[h][..., None], n_months, -1),
+                ownerships,
+            ],
+            axis=1,
+        )
+        n_savings = self.saving_monthly_amounts.shape[1]
+        fixed = {k: v[h][..., :n_months] for k, v in self.fixed_amounts.items()}
+        # bank residual and interests
+        money = incomes.sum(axis=1) - expenses.sum(axis=1)
+        for sign, group in [(1, "incomes"), (-1, "expenses")]:
+            counts = self.fixed_counts[group][h][..., None]
+            money = money + sign * (fixed[group] * counts).sum(axis=1)
+        money = money - deposits[:, 1:n_savings].sum(axis=1) - payments.sum(axis=1)
+        rates = self.saving_rates[h][..., None] * np.where(
+            self.saving_annually[h][..., None], self.calendar_months[:n_months] == 1, 1
+        )
+        initial_balances = np.concatenate(
+            [self.saving_initial_amounts[h], np.zeros_like(self.credit_rates[h])],
+            axis=1,
+        )
+        return settle(
+            money=money,
+            incomes=np.concatenate([incomes, fixed["incomes"]], axis=1),
+            expenses=np.concatenate([expenses, interests, fixed["expenses"]], axis=1),
+            deposits=deposits,
+            initial_balances=initial_balances,
+            rates=rates,
+            credits=after,
+            credits_before_interests=before,
+            dates=self.dates[:n_months],
+            names={
+                k: [f"{k}[{i}]" for i in range(m.shape[1])]
+                for k, m in self.masks.items()
+            },
+        )
+
+    def run_in_chunks(
+        self, chunk_size: int = 1000, until: dt.date | None = None
+    ) -> T.Iterator[T.Tuple[int, VectorizedResult]]:
+        """Simulate households in chunks to bound memory; yields (offset, result)."""
+        for offset in range(0, self.n_households, chunk_size):
+            yield offset, self.run(
+                until=until, households=slice(offset, offset + chunk_size)
+            )
+
+    def unpack(
+        self, result: VectorizedResult, household: int, offset: int = 0
+    ) -> VectorizedResult:
+        """Strip the padding of one household from a (chunk) result."""
+        h = household
+        i = h - offset
+        n_incomes = self.income_amounts.shape[1]
+        n_expenses = self.expense_amounts.shape[1]
+        n_credits = self.masks["credits"].shape[1]
+        n_savings = self.masks["savings"].shape[1] - n_credits
+        incomes = np.r_[
+            : self.n_incomes[h], n_incomes : n_incomes + self.n_fixed["incomes"][h]
+        ]
+        fixed = n_expenses + n_credits
+        expenses = np.r_[
+            : self.n_expenses[h],
+            n_expenses : n_expenses + self.n_credits[h],
+            fixed : fixed + self.n_fixed["expenses"][h],
+        ]
+        savings = np.r_[: self.n_savings[h], n_savings : n_savings + self.n_credits[h]]
+        return VectorizedResult(
+            dates=result.dates,
+            names=self.households[h],
+            incomes=result.incomes[i : i + 1, incomes],
+            expenses=result.expenses[i : i + 1, expenses],
+            deposits=result.deposits[i : i + 1, savings],
+            interests=result.interests[i : i + 1, savings],
+            balances=result.balances[i : i + 1, savings],
+            initial_balances=result.initial_balances[i : i + 1, savings],
+            credits=result.credits[i : i + 1, : self.n_credits[h]],
+            run_out=result.run_out[i : i + 1],
+            margin=result.margin[i : i + 1],
+        )
+
+
+if __name__ == "__main__":
+    from cashflow.engines.components import Income, Expense, Saving, Credit
+
+    rng = np.random.default_rng(0)
+    n_households = 5000
+    # building Budget objects is slow, so households share a pool of 50 budgets
+    budgets = []
+    for _ in range(50):
+        budgets.append(
+            VectorizedBudget(
+                Budget(
+                    incomes=[
+                        Income(
+                            name=f"income {i}",
+                            monthly_amount=float(rng.uniform(20000, 50000)),
+                            change_at_dates=[dt.date(2030, 1, 1)],
+                            change_by_amounts=[float(rng.uniform(0, 5000))],
+                        )
+                        for i in range(rng.integers(1, 3))
+                    ],
+                    expenses=[
+                        Expense(
+                            name=f"expense {i}",
+                            monthly_amount=float(rng.uniform(1000, 8000)),
+                        )
+                        for i in range(rng.integers(0, 3))
+                    ],
+                    savings=[
+                        Saving(
+                            name=f"saving {i}",
+                            initial_amount=float(rng.uniform(0, 300000)),
+                            monthly_amount=float(rng.uniform(0, 5000))
+                            if i > 0
+                            else 0.0,
+                            interest_rate=float(rng.uniform(0, 0.04)),
+                            interest_frequency="annually",
+                        )
+                        for i in range(rng.integers(1, 4))
+                    ],
+                    credits=[
+                        Credit(
+                            name=f"credit {i}",
+                            credit_amount=float(rng.uniform(1e6, 4e6)),
+                            annual_interest_rate=float(rng.uniform(0.01, 0.06)),
+                        )
+                        for i in range(rng.integers(0, 2))
+                    ],
+                )
+            )
+        )
+
+    start = time.perf_counter()
+    portfolio = Portfolio([budgets[i % 50] for i in range(n_households)])
+    packed = time.perf_counter()
+    for offset, result in portfolio.run_in_chunks(chunk_size=500):
+        pass
+    simulated = time.perf_counter()
+    logger.info(
+        f"PORTFOLIO: packed {n_households / (packed - start):.0f} and simulated "
+        f"{n_households / (simulated - packed):.0f} households per second per core."
+    )
@@ -0,0 +1,372 @@
+"""Component kinds: how Budget simulates each kind of component.
+
+Every kind declares the sign of its cash flow (+1 pays into the bank account,
+-1 is paid from it), the kinds it depends on and two ways of simulating it:
+step()/settle() for the month by month loop of Budget.run, and schedule(), which
+computes all months at once from a Calendar. Budget dispatches through the
+registry, so new kinds (pensions, taxes, child benefits, ...) are added with
+register_kind() and work with both the legacy loop and the array engines.
+"""
+import abc
+import datetime as dt
+import typing as T
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from cashflow.engines.components import Income, Expense, Saving, Credit
+from cashflow.engines.drawdown import DrawdownPolicy
+from cashflow.engines.vectorized import (
+    VectorizedResult,
+    credit_schedules,
+    month_dates,
+    months_between,
+    settle,
+)
+
+
+@dataclass(frozen=True)
+class Calendar:
+    """The months simulated from start_date; t is 1 in the first simulated month."""
+
+    start_date: dt.date
+    dates: T.Tuple[dt.date, ...]
+    t: np.ndarray
+    calendar_months: np.ndarray
+
+    @classmethod
+    def from_start(cls, start_date: dt.date, n_months: int = 60 * 12) -> "Calendar":
+        dates = month_dates(start_date, n_months)
+        return cls(
+            start_date=start_date,
+            dates=dates,
+            t=np.arange(1, n_months + 1),
+            calendar_months=np.array([d.month for d in dates]),
+        )
+
+    @property
+    def n_months(self) -> int:
+        return len(self.dates)
+
+    def month(self, date: dt.date) -> int:
+        return months_between(self.start_date, date)
+
+    def changes(self, change_dict: T.Dict[dt.date, float]) -> np.ndarray:
+        """Cumulative change of a monthly amount (changes fire on exact 1st dates)."""
+        amounts = np.zeros(self.n_months)
+        for date, amount in change_dict.items():
+            month = self.month(date)
+            if (date.day == 1) and (month >= 1):
+                amounts += amount * (self.t >= month)
+            pass
+        return amounts
+
+
+@dataclass
+class Schedule:
+    """Monthly arrays of one component.
+
+    amounts is what is paid or received every month (before the kind's sign).
+    Accounts also have interest rates and an initial balance, and their amounts
+    are deposits. Amounts of components controlled by another one (e.g. the
+    interests of a Credit) don't count towards the bank residual; the owner's do.
+    series holds further outputs (e.g. the outstanding credit) and derived the
+    schedules of owned components.
+    """
+
+    amounts: np.ndarray
+    rates: np.ndarray | None = None
+    initial_balance: float = 0.0
+    counts: bool = True
+    series: T.Dict[str, np.ndarray] = field(default_factory=dict)
+    derived: T.Dict[int, "Schedule"] = field(default_factory=dict)
+
+
+class ComponentKind(abc.ABC):
+    """Base class of the component kinds in the registry."""
+
+    name: str = ""
+    component_type: type = object
+    sign: int = 1
+    is_account: bool = False
+    depends_on: T.Tuple[str, ...] = ()
+    has_summary: bool = True
+
+    def expand(self, component) -> T.Dict[str, T.List]:
+        """Components owned by component, by the name of their kind."""
+        return {}
+
+    def step(self, budget, component) -> float | None:
+        """Amount paid or received this month in Budget.run (None to skip)."""
+        return None
+
+    def settle(self, budget, component):
+        """Called after the residual is deposited in the bank account."""
+        pass
+
+    @abc.abstractmethod
+    def schedule(self, component, calendar: Calendar) -> Schedule:
+        """Amounts of all months of the calendar at once."""
+
+    def load(
+        self,
+        component,
+        dates: T.List[dt.date],
+        amounts: np.ndarray,
+        interests: np.ndarray | None,
+        series: T.Dict[str, np.ndarray],
+    ):
+        """Fill the component's ledgers with simulated arrays."""
+        component.load(dates, amounts)
+
+
+KINDS: T.Dict[str, ComponentKind] = {}
+
+
+def register_kind(kind: ComponentKind) -> ComponentKind:
+    """Add a kind to the registry; Budget steps through kinds in this order."""
+    assert kind.name not in KINDS, f"A kind named {kind.name} is already registered."
+    KINDS[kind.name] = kind
+    return kind
+
+
+def kind_of(component) -> ComponentKind:
+    """The most specific registered kind of a component."""
+    kinds = [x for x in KINDS.values() if isinstance(component, x.component_type)]
+    assert kinds, f"{type(component).__name__} is not a registered component kind."
+    return max(kinds, key=lambda x: len(x.component_type.__mro__))
+
+
+def scheduling_order() -> T.List[ComponentKind]:
+    """Kinds sorted such that every kind comes after the kinds it depends on."""
+    ordered, visiting = [], set()
+
+    def visit(name: str):
+        if any(x.name == name for x in ordered):
+            return
+        assert name not in visiting, f"Circular dependency of {name}."
+        visiting.add(name)
+        for dependency in KINDS[name].depends_on:
+            visit(dependency)
+        ordered.append(KINDS[name])
+        pass
+
+    for name in KINDS:
+        visit(name)
+    return ordered
+
+
+class IncomeKind(ComponentKind):
+    name = "incomes"
+    component_type = Income
+    sign = 1
+
+    def step(self, budget, component: Income) -> float | None:
+        return component.payout()
+
+    def schedule(self, component: Income, calendar: Calendar) -> Schedule:
+        amounts = component.monthly_amount + calendar.changes(component.change_dict)
+        last = calendar.month(component.last_income_date)
+        return Schedule(amounts=np.where(calendar.t > last, 0.0, amounts))
+
+
+class ExpenseKind(ComponentKind):
+    name = "expenses"
+    component_type = Expense
+    sign = -1
+    depends_on = ("credits",)
+
+    def step(self, budget, component: Expense) -> float | None:
+        return None if component.is_credit_controlled else component.spend()
+
+    def schedule(self, component: Expense, calendar: Calendar) -> Schedule:
+        assert (
+            component.monthly_amount is not None
+        ), f"{component.name}: You must specify a monthly amount in the constructor."
+        return Schedule(
+            amounts=component.monthly_amount + calendar.changes(component.change_dict)
+        )
+
+
+class SavingKind(ComponentKind):
+    name = "savings"
+    component_type = Saving
+    sign = -1
+    is_account = True
+    depends_on = ("credits",)
+
+    def step(self, budget, component: Saving) -> float | None:
+        if (component is budget.savings[0]) or component.is_credit_controlled:
+            return None
+        return component.deposit()
+
+    def settle(self, budget, component: Saving):
+        component.get_interests()
+
+    def rates(self, component: Saving, calendar: Calendar) -> np.ndarray:
+        annually = component.interest_frequency == "annually"
+        return component.interest_rate * (
+            (calendar.calendar_months == 1) if annually else np.ones(calendar.n_months)
+        )
+
+    def schedule(self, component: Saving, calendar: Calendar) -> Schedule:
+        return Schedule(
+            amounts=np.full(calendar.n_months, float(component.monthly_amount or 0)),
+            rates=self.rates(component, calendar),
+            initial_balance=component.initial_amount,
+        )
+
+    def load(self, component, dates, amounts, interests, series):
+        component.load(dates, amounts, interests)
+
+
+class CreditKind(ComponentKind):
+    name = "credits"
+    component_type = Credit
+    sign = -1
+    has_summary = False
+
+    def expand(self, component: Credit) -> T.Dict[str, T.List]:
+        return {"expenses": [component.interests], "savings": [component.ownership]}
+
+    def step(self, budget, component: Credit) -> float | None:
+        return component.payoff()
+
+    def settle(self, budget, component: Credit):
+        component.add_interests()
+
+    def schedule(self, component: Credit, calendar: Calendar) -> Schedule:
+        payment, interests, ownership, before, after = (
+            x[0]
+            for x in credit_schedules(
+                principal=np.array(
+                    [component.credit_amount - component.initial_amount]
+                ),
+                rate=np.array([component.annual_interest_rate]),
+                duration=np.array([component.loan_duration]),
+                n_months=calendar.n_months,
+            )
+        )
+        return Schedule(
+            amounts=payment,
+            series={"credit": after, "credit_before_interests": before},
+            derived={
+                id(component.interests): Schedule(amounts=interests, counts=False),
+                id(component.ownership): Schedule(
+                    amounts=ownership,
+                    rates=KINDS["savings"].rates(component.ownership, calendar),
+                    counts=False,
+                ),
+            },
+        )
+
+    def load(self, component, dates, amounts, interests, series):
+        component.load(dates, series["credit"])
+
+
+for kind in [IncomeKind(), ExpenseKind(), SavingKind(), CreditKind()]:
+    register_kind(kind)
+
+
+def budget_schedules(budget, calendar: Calendar) -> T.Dict[int, Schedule]:
+    """Schedules of all components of a budget by id, owned ones included."""
+    schedules: T.Dict[int, Schedule] = {}
+    for kind in scheduling_order():
+        for component in budget.components[kind.name]:
+            if id(component) not in schedules:
+                schedules[id(component)] = kind.schedule(component, calendar)
+                schedules.update(schedules[id(component)].derived)
+            pass
+    return schedules
+
+
+def group_schedules(
+    budget, schedules: T.Dict[int, Schedule]
+) -> T.Dict[str, T.List[T.Tuple[ComponentKind, T.Any, Schedule]]]:
+    """Components grouped like the arrays of VectorizedResult.
+
+    Flows with sign +1 are grouped as incomes and the other flows as expenses,
+    accounts as savings (the first being the bank account, which receives the
+    residual) and components with an outstanding "credit" series as credits.
+    """
+    groups = {"incomes": [], "expenses": [], "savings": [], "credits": []}
+    for kind in KINDS.values():
+        for component in budget.components[kind.name]:
+            schedule = schedules[id(component)]
+            if kind.is_account:
+                group = "savings"
+            elif "credit" in schedule.series:
+                group = "credits"
+            else:
+                group = "incomes" if kind.sign > 0 else "expenses"
+            groups[group].append((kind, component, schedule))
+            pass
+    return groups
+
+
+def load_result(groups, result: VectorizedResult):
+    """Fill the ledgers of grouped components with a single scenario result."""
+    for group, amounts, interests, series in [
+        ("incomes", result.incomes, None, None),
+        ("expenses", result.expenses, None, None),
+        ("savings", result.deposits, result.interests, None),
+        ("credits", None, None, result.credits),
+    ]:
+        for i, (kind, component, _) in enumerate(groups[group]):
+            kind.load(
+                component,
+                result.dates,
+                amounts[0, i] if amounts is not None else None,
+                interests[0, i] if interests is not None else None,
+                {"credit": series[0, i]} if series is not None else {},
+            )
+            pass
+    pass
+
+
+def simulate_budget(
+    budget,
+    n_months: int = 60 * 12,
+    kernel: bool = False,
+    drawdown: DrawdownPolicy | None = None,
+) -> VectorizedResult:
+    """Simulate a (not yet run) Budget through the schedules of its kinds.
+
+    The bank account receives the residual of all flows that count (and the
+    withdrawals of drawdown), and the simulated months are loaded into the
+    components' ledgers.
+    """
+    calendar = Calendar.from_start(budget.savings[0].current_date, n_months)
+    groups = group_schedules(budget, budget_schedules(budget, calendar))
+    money = np.zeros(n_months)
+    bank = budget.savings[0]
+    for kind, component, schedule in [x for v in groups.values() for x in v]:
+        if schedule.counts and (component is not bank):
+            money += kind.sign * schedule.amounts
+        pass
+
+    def stack(group: str, get: T.Callable[[Schedule], np.ndarray]) -> np.ndarray:
+        return np.array([get(s) for _, _, s in groups[group]], dtype=float).reshape(
+            1, len(groups[group]), n_months
+        )
+
+    result = settle(
+        money=money[None],
+        incomes=stack("incomes", lambda s: s.amounts),
+        expenses=stack("expenses", lambda s: s.amounts),
+        deposits=stack("savings", lambda s: s.amounts),
+        initial_balances=np.array(
+            [[s.initial_balance for _, _, s in groups["savings"]]], dtype=float
+        ),
+        rates=stack("savings", lambda s: s.rates),
+        credits=stack("credits", lambda s: s.series["credit"]),
+        credits_before_interests=stack(
+            "credits", lambda s: s.series["credit_before_interests"]
+        ),
+        dates=list(calendar.dates),
+        names={k: [c.name for _, c, _ in v] for k, v in groups.items()},
+        kernel=kernel,
+        drawdown=drawdown,
+    )
+    load_result(groups, result)
+    return result
@@ -0,0 +1,181 @@
+"""Streaming, mergeable percentiles of monthly series over many scenarios."""
+import datetime as dt
+import math
+import typing as T
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+class ExactQuantiles:
+    """Keep every value (months are columns) and compute exact percentiles."""
+
+    def __init__(self, n_months: int):
+        self.n_months = n_months
+        self.blocks: T.List[np.ndarray] = []
+        self.count = 0
+        pass
+
+    def update(self, block: np.ndarray):
+        """Add a (scenarios, months) block; NaN (months after a run-out) are skipped."""
+        block = np.asarray(block, dtype=float).reshape(-1, self.n_months)
+        self.blocks.append(block)
+        self.count += block.shape[0]
+        pass
+
+    def merge(self, other: "ExactQuantiles"):
+        self.blocks += other.blocks
+        self.count += other.count
+        pass
+
+    def quantiles(self, qs: T.Sequence[float]) -> np.ndarray:
+        """(len(qs), months) percentiles, with qs in [0, 1]."""
+        if self.count == 0:
+            return np.full((len(qs), self.n_months), np.nan)
+        values = np.concatenate(self.blocks)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.nanquantile(values, qs, axis=0)
+
+
+class QuantileSketch:
+    """Log-bucketed histogram per month with a bounded relative error.
+
+    Amounts are counted in buckets (min_value * gamma ** (k - 1), min_value * gamma
+    ** k] for positive and negative values, and |x| < min_value is counted as zero.
+    Percentiles are within about relative_accuracy of the exact ones, memory is fixed
+    (months x buckets counts) and sketches are merged by adding their counts.
+    """
+
+    def __init__(
+        self,
+        n_months: int,
+        relative_accuracy: float = 0.01,
+        min_value: float = 1.0,
+        max_value: float = 1e12,
+    ):
+        self.n_months = n_months
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.n_keys = math.ceil(math.log(max_value / min_value) / math.log(self.gamma))
+        self.counts = np.zeros((n_months, 2 * self.n_keys + 1), dtype=np.int64)
+        self.count = 0
+        keys = np.arange(1, self.n_keys + 1)
+        magnitudes = min_value * 2 * self.gamma**keys / (self.gamma + 1)
+        self.values = np.concatenate([-magnitudes[::-1], [0], magnitudes])
+        pass
+
+    def _buckets(self, block: np.ndarray) -> np.ndarray:
+        with np.errstate(divide="ignore"):
+            keys = np.ceil(
+                np.log(np.abs(block) / self.min_value) / math.log(self.gamma)
+            )
+        keys = np.where(
+            np.abs(block) < self.min_value, 0, np.clip(keys, 1, self.n_keys)
+        )
+        return (self.n_keys + np.sign(block) * keys).astype(np.int64)
+
+    def update(self, block: np.ndarray):
+        """Add a (scenarios, months) block; NaN (months after a run-out) are skipped."""
+        block = np.asarray(block, dtype=float).reshape(-1, self.n_months)
+        months = np.broadcast_to(np.arange(self.n_months), block.shape)
+        valid = ~np.isnan(block)
+        width = self.counts.shape[1]
+        self.counts += np.bincount(
+            (months[valid] * width + self._buckets(block[valid])),
+            minlength=self.counts.size,
+        ).reshape(self.counts.shape)
+        self.count += block.shape[0]
+        pass
+
+    def merge(self, other: "QuantileSketch"):
+        assert (self.n_months, self.gamma, self.min_value, self.max_value) == (
+            other.n_months,
+            other.gamma,
+            other.min_value,
+            other.max_value,
+        ), "Only sketches with the same months and buckets can be merged."
+        self.counts += other.counts
+        self.count += other.count
+        pass
+
+    def quantiles(self, qs: T.Sequence[float]) -> np.ndarray:
+        """(len(qs), months) percentiles, with qs in [0, 1]."""
+        cumulative = np.cumsum(self.counts, axis=1)
+        n = cumulative[:, -1]
+        out = np.full((len(qs), self.n_months), np.nan)
+        for i, q in enumerate(qs):
+            rank = q * (n - 1)
+            buckets = (cumulative <= rank[:, None]).sum(axis=1)
+            out[i] = np.where(
+                n > 0, self.values[np.minimum(buckets, len(self.values) - 1)], np.nan
+            )
+        return out
+
+
+class StreamingQuantiles:
+    """Percentiles that are exact up to exact_limit scenarios, then sketched.
+
+    Blocks of scenarios (e.g. chunks from run_parallel, or results computed by
+    different workers) are added with update() or merged with merge(); once more
+    than exact_limit scenarios have been seen, the kept values are moved into a
+    QuantileSketch and only its fixed size counts are kept from then on.
+    """
+
+    def __init__(self, n_months: int, exact_limit: int = 10_000, **sketch_kwargs):
+        self.n_months = n_months
+        self.exact_limit = exact_limit
+        self.sketch_kwargs = sketch_kwargs
+        self.aggregator: ExactQuantiles | QuantileSketch = ExactQuantiles(n_months)
+        pass
+
+    @property
+    def count(self) -> int:
+        return self.aggregator.count
+
+    @property
+    def is_exact(self) -> bool:
+        return isinstance(self.aggregator, ExactQuantiles)
+
+    def _to_sketch(self):
+        sketch = QuantileSketch(self.n_months, **self.sketch_kwargs)
+        for block in self.aggregator.blocks:
+            sketch.update(block)
+        self.aggregator = sketch
+        pass
+
+    def update(self, block: np.ndarray):
+        self.aggregator.update(block)
+        if self.is_exact and self.count > self.exact_limit:
+            self._to_sketch()
+        pass
+
+    def merge(self, other: "StreamingQuantiles"):
+        if self.is_exact and other.is_exact:
+            self.aggregator.merge(other.aggregator)
+            if self.count > self.exact_limit:
+                self._to_sketch()
+            return
+        if self.is_exact:
+            self._to_sketch()
+        if other.is_exact:
+            for block in other.aggregator.blocks:
+                self.aggregator.update(block)
+        else:
+            self.aggregator.merge(other.aggregator)
+        pass
+
+    def quantiles(self, qs: T.Sequence[float]) -> np.ndarray:
+        return self.aggregator.quantiles(qs)
+
+    def to_frame(
+        self,
+        dates: T.Sequence[dt.date],
+        percentiles: T.Sequence[float] = (5, 25, 50, 75, 95),
+    ) -> pd.DataFrame:
+        """Percentiles (columns) by date (index), as used by plot_fan_chart."""
+        values = self.quantiles([p / 100 for p in percentiles])
+        return pd.DataFrame(values.T, index=list(dates), columns=list(percentiles))
@@ -0,0 +1,131 @@
+"""Keep components alive across app reruns and only rebuild what changed."""
+import typing as T
+
+import numpy as np
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.components import Income, Expense, Saving, Credit
+from cashflow.engines.vectorized import VectorizedBudget, VectorizedResult
+from cashflow.utils.colors import colors
+from cashflow.utils.logging_utils import init_logger
+from cashflow.utils.metrics import timed
+
+logger = init_logger()
+
+
+def _colored(component) -> T.List[Income | Expense | Saving]:
+    """Components holding a color (a credit owns its interests and ownership)."""
+    if isinstance(component, Credit):
+        return [component.interests, component.ownership]
+    return [component]
+
+
+class ComponentRegistry:
+    """Session scoped store of components, keyed by their place in the sidebar.
+
+    Each rerun calls begin(), get() for every component with its current inputs and
+    end(). Components whose inputs are unchanged are returned as is, so they keep
+    their color and computed series; replaced or removed components give their
+    color back. simulate() runs the vectorized engine and only reloads the ledgers
+    (and summaries) of components whose series changed, which is typically the
+    edited components and the bank account receiving the residual.
+    """
+
+    def __init__(self):
+        self.entries: T.Dict[str, T.Tuple[type, T.Dict[str, T.Any], T.Any]] = {}
+        self.series: T.Dict[int, T.Tuple[np.ndarray, ...]] = {}
+        self.summaries = {}
+        self.seen = set()
+        self.changed = set()
+        pass
+
+    def begin(self):
+        self.seen = set()
+        self.changed = set()
+        pass
+
+    def get(self, key: str, cls: type, **params):
+        """Return the component stored under key, rebuilding it if params changed."""
+        self.seen.add(key)
+        entry = self.entries.get(key)
+        if (entry is not None) and (entry[0] is cls) and (entry[1] == params):
+            return entry[2]
+        component = cls(**params)
+        if entry is not None:
+            self._forget(entry[2])
+        self.entries[key] = (cls, params, component)
+        self._release_unused(entry[2] if entry is not None else None)
+        self.changed.add(key)
+        return component
+
+    def end(self):
+        """Drop the components that were not requested during this rerun."""
+        for key in set(self.entries) - self.seen:
+            _, _, component = self.entries.pop(key)
+            self._forget(component)
+            self._release_unused(component)
+            logger.info(f"REGISTRY: dropped {key}.")
+        pass
+
+    def _forget(self, component):
+        for c in _colored(component) + [component]:
+            self.series.pop(id(c), None)
+            self.summaries.pop(id(c), None)
+        pass
+
+    def _release_unused(self, component):
+        if component is None:
+            return
+        in_use = {
+            (c.type, c.name) for _, _, x in self.entries.values() for c in _colored(x)
+        }
+        for c in _colored(component):
+            if (c.type, c.name) not in in_use:
+                colors.release(type=c.type.lower(), name=c.name)
+        pass
+
+    def _reload(self, component, dates, *series) -> bool:
+        cached = self.series.get(id(component))
+        if (cached is not None) and all(
+            np.array_equal(a, b, equal_nan=True) for a, b in zip(cached, series)
+        ):
+            return False
+        component.load(dates, *series)
+        self.series[id(component)] = series
+        self.summaries.pop(id(component), None)
+        return True
+
+    @timed(
+        "cashflow_registry_simulate_seconds",
+        "Duration of simulating and reloading the app's budget.",
+    )
+    def simulate(self, budget: Budget, n_months: int = 60 * 12) -> VectorizedResult:
+        """Simulate the budget and refresh only the components whose series changed."""
+        return self.load(budget, VectorizedBudget(budget, n_months).run())
+
+    def load(self, budget: Budget, result: VectorizedResult) -> VectorizedResult:
+        """Refresh the components whose series differ from a (single) result."""
+        dates = result.dates
+        reloaded = 0
+        for i, c in enumerate(budget.incomes):
+            reloaded += self._reload(c, dates, result.incomes[0, i])
+        for i, c in enumerate(budget.expenses):
+            reloaded += self._reload(c, dates, result.expenses[0, i])
+        for i, c in enumerate(budget.savings):
+            reloaded += self._reload(
+                c, dates, result.deposits[0, i], result.interests[0, i]
+            )
+        for i, c in enumerate(budget.credits):
+            self._reload(c, dates, result.credits[0, i])
+
+        # summaries are rebuilt for reloaded components only; the others get
+        # their cached summary back (the app may have replaced it, e.g. deflated)
+        for c in budget.incomes + budget.expenses + budget.savings:
+            if id(c) not in self.summaries:
+                self.summaries[id(c)] = c.get_summary()
+            c.summary = self.summaries[id(c)]
+        n_components = len(budget.incomes + budget.expenses + budget.savings)
+        logger.info(f"REGISTRY: reloaded {reloaded} of {n_components} components.")
+        if (result.run_out >= 0).any():
+            logger.error(f"{result.run_out_dates()[0]}: You've run out of money!")
+        return result
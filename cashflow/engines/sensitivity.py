@@ -0,0 +1,89 @@
+"""Sensitivity of simulation outcomes with respect to every numeric input."""
+import datetime as dt
+import typing as T
+
+import numpy as np
+import pandas as pd
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.vectorized import VectorizedBudget, VectorizedResult
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+Outcome = T.Callable[[VectorizedResult], np.ndarray]
+
+
+def final_wealth(saving: int | None = None) -> Outcome:
+    """Final balance of one saving, or of all savings combined if saving is None."""
+
+    def outcome(result: VectorizedResult) -> np.ndarray:
+        balances = result.final_balances()
+        return balances.sum(axis=1) if saving is None else balances[:, saving]
+
+    return outcome
+
+
+def sensitivity(
+    budget: Budget | VectorizedBudget,
+    outcome: Outcome = final_wealth(),
+    parameters: T.List[str] | None = None,
+    relative_step: float = 0.1,
+    until: dt.date | None = None,
+) -> pd.DataFrame:
+    """Perturb every parameter by +/- relative_step and measure the outcome.
+
+    All 2k perturbations (plus the baseline) are simulated as one batch along the
+    scenario axis. By default every non-zero parameter except last income dates is
+    perturbed. The elasticity is the central difference of the outcome relative to
+    the baseline outcome, divided by the relative step.
+    """
+    engine = (
+        budget
+        if isinstance(budget, VectorizedBudget)
+        else VectorizedBudget(budget=budget)
+    )
+    if parameters is None:
+        parameters = [
+            k
+            for k, v in engine.defaults.items()
+            if (v != 0) and not k.endswith("last_income_date")
+        ]
+    keys = [engine.resolve(p) for p in parameters]
+    defaults = np.array([engine.defaults[k] for k in keys])
+
+    # scenario 0 is the baseline, scenarios 2i+1 and 2i+2 move parameter i down/up
+    n_scenarios = 2 * len(keys) + 1
+    overrides = {}
+    for i, key in enumerate(keys):
+        values = np.full(n_scenarios, defaults[i])
+        values[2 * i + 1] *= 1 - relative_step
+        values[2 * i + 2] *= 1 + relative_step
+        overrides[key] = values
+        pass
+    result = engine.run(parameters=overrides, until=until)
+    outcomes = outcome(result)
+    baseline = outcomes[0]
+
+    df = pd.DataFrame(
+        {
+            "parameter": keys,
+            "label": [engine.labels[k] for k in keys],
+            "value": defaults,
+            "low": defaults * (1 - relative_step),
+            "high": defaults * (1 + relative_step),
+            "outcome": baseline,
+            "outcome_low": outcomes[1::2],
+            "outcome_high": outcomes[2::2],
+        }
+    )
+    df["swing"] = (df["outcome_high"] - df["outcome_low"]).abs()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["elasticity"] = (df["outcome_high"] - df["outcome_low"]) / (
+            2 * relative_step * baseline
+        )
+    df = df.sort_values("swing", ascending=False).set_index("parameter")
+    logger.info(
+        f"SENSITIVITY: simulated {n_scenarios} scenarios for {len(keys)} parameters."
+    )
+    return df
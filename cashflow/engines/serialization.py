@@ -0,0 +1,91 @@
+"""Build budgets from plain (JSON compatible) dictionaries."""
+import datetime as dt
+import typing as T
+
+import numpy as np
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.components import Income, Expense, Saving, Credit
+from cashflow.engines.vectorized import VectorizedBudget, VectorizedResult
+from cashflow.utils.colors import colors
+
+DATE_KEYS = ["change_at_dates", "last_income_date"]
+
+
+def _parse(component: T.Dict[str, T.Any]) -> T.Dict[str, T.Any]:
+    """Parse ISO dates and turn integer amounts into floats."""
+    kwargs = {}
+    for key, value in component.items():
+        if key in DATE_KEYS:
+            value = (
+                [dt.date.fromisoformat(x) for x in value]
+                if isinstance(value, list)
+                else dt.date.fromisoformat(value)
+            )
+        elif isinstance(value, list):
+            value = [float(x) for x in value]
+        elif isinstance(value, int) and not isinstance(value, bool):
+            value = float(value)
+        kwargs[key] = value
+    return kwargs
+
+
+def budget_from_dict(config: T.Dict[str, T.List[T.Dict[str, T.Any]]]) -> Budget:
+    """Budget from a dict with lists of "incomes", "expenses", "savings", "credits".
+
+    Each component is given by its constructor arguments, with dates as ISO strings.
+    """
+    return Budget(
+        incomes=[Income(**_parse(x)) for x in config.get("incomes", [])],
+        expenses=[Expense(**_parse(x)) for x in config.get("expenses", [])],
+        savings=[Saving(**_parse(x)) for x in config.get("savings", [])],
+        credits=[Credit(**_parse(x)) for x in config.get("credits", [])],
+    )
+
+
+def compile_dict(
+    config: T.Dict[str, T.List[T.Dict[str, T.Any]]], n_months: int = 60 * 12
+) -> VectorizedBudget:
+    """VectorizedBudget from a dict; the components' colors are released again.
+
+    Long running processes (services, batch workers) compile many budgets, which
+    would otherwise exhaust the color palette. Colors are released whether or not
+    the config compiles, so invalid configs don't use them up either.
+    """
+    assigned = colors.assigned()
+    try:
+        return VectorizedBudget(budget_from_dict(config), n_months)
+    finally:
+        for type, name in colors.assigned() - assigned:
+            colors.release(type=type, name=name)
+
+
+def _values(x: np.ndarray) -> T.List:
+    """Nested lists with NaN replaced by None."""
+    return np.where(np.isnan(x), None, x).tolist()
+
+
+def result_to_dict(result: VectorizedResult, monthly: bool = False) -> T.Dict:
+    """JSON compatible summary of a result, with one entry per scenario."""
+    final_balances = result.final_balances()
+    out = {
+        "run_out_dates": [
+            d.isoformat() if d is not None else None for d in result.run_out_dates()
+        ],
+        "final_balances": {
+            name: _values(final_balances[:, i])
+            for i, name in enumerate(result.names["savings"])
+        },
+    }
+    if monthly:
+        out["dates"] = [d.isoformat() for d in result.dates]
+        for kind, series in [
+            ("incomes", result.incomes),
+            ("expenses", result.expenses),
+            ("savings", result.balances),
+            ("credits", result.credits),
+        ]:
+            out[kind] = {
+                name: _values(series[:, i]) for i, name in enumerate(result.names[kind])
+            }
+    return out
@@ -0,0 +1,201 @@
+"""Goal seeking on top of the vectorized engine, e.g. maximum sustainable spending."""
+import datetime as dt
+import typing as T
+
+import numpy as np
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.vectorized import (
+    VectorizedBudget,
+    VectorizedResult,
+    months_between,
+)
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+Constraint = T.Callable[[VectorizedResult], np.ndarray]
+
+
+def no_run_out(result: VectorizedResult) -> np.ndarray:
+    """Positive if the bank account never runs dry (the default constraint)."""
+    return result.margin
+
+
+def min_balance(amount: float, saving: int = 0) -> Constraint:
+    """Positive if the given saving never drops below amount (and money lasts)."""
+
+    def constraint(result: VectorizedResult) -> np.ndarray:
+        lowest = np.nanmin(result.balances[:, saving], axis=1, initial=np.inf)
+        return np.minimum(result.margin, lowest - amount)
+
+    return constraint
+
+
+def final_balance(amount: float, saving: int = 0) -> Constraint:
+    """Positive if the given saving holds at least amount at the end of the run."""
+
+    def constraint(result: VectorizedResult) -> np.ndarray:
+        final = result.balances[:, saving, -1]
+        return np.minimum(result.margin, np.nan_to_num(final, nan=-np.inf) - amount)
+
+    return constraint
+
+
+class Solver:
+    """Find the value of one or more parameters where a budget stops being feasible.
+
+    The budget is compiled once into a VectorizedBudget, so every evaluation is a
+    single array simulation cut off at the until date. Parameters given as a list
+    are all set to the same value (e.g. the last income date of every income).
+    """
+
+    def __init__(
+        self,
+        budget: Budget | VectorizedBudget,
+        parameter: str | T.List[str],
+        constraint: Constraint = no_run_out,
+        until: dt.date | None = None,
+    ):
+        self.engine = (
+            budget
+            if isinstance(budget, VectorizedBudget)
+            else VectorizedBudget(budget=budget)
+        )
+        parameters = [parameter] if isinstance(parameter, str) else parameter
+        self.keys = [self.engine.resolve(p) for p in parameters]
+        self.constraint = constraint
+        self.until = until
+        self.n_evaluations = 0
+        pass
+
+    def margin(self, value: float) -> float:
+        """Evaluate the constraint for a single parameter value (positive if met)."""
+        self.n_evaluations += 1
+        result = self.engine.run(
+            parameters={key: value for key in self.keys}, until=self.until
+        )
+        return float(self.constraint(result)[0])
+
+    def solve(
+        self,
+        lower: float,
+        upper: float,
+        method: str = "bisection",
+        tolerance: float = 1.0,
+        max_iterations: int = 100,
+        integer: bool = False,
+    ) -> float:
+        """Locate the boundary within [lower, upper] and return its feasible side.
+
+        The constraint must be met at exactly one end of the interval. "bisection"
+        halves the bracket; "secant" uses regula falsi (Illinois variant) on the
+        constraint margin, which needs far fewer evaluations when it is smooth.
+        """
+        assert method in ["bisection", "secant"], f"Unknown method: {method}."
+        if integer:
+            lower, upper, tolerance, method = int(lower), int(upper), 1, "bisection"
+        margin_lower, margin_upper = self.margin(lower), self.margin(upper)
+        assert (margin_lower > 0) != (
+            margin_upper > 0
+        ), f"The constraint must be met at exactly one of {lower} and {upper}."
+        side = None
+        for _ in range(max_iterations):
+            if abs(upper - lower) <= tolerance:
+                break
+            if integer:
+                x = (lower + upper) // 2
+            elif method == "secant" and np.isfinite([margin_lower, margin_upper]).all():
+                x = upper - margin_upper * (upper - lower) / (
+                    margin_upper - margin_lower
+                )
+                # stay strictly inside the bracket
+                if not min(lower, upper) < x < max(lower, upper):
+                    x = (lower + upper) / 2
+            else:
+                x = (lower + upper) / 2
+            margin_x = self.margin(x)
+            if (margin_x > 0) == (margin_lower > 0):
+                lower, margin_lower = x, margin_x
+                if side == "lower":
+                    margin_upper /= 2
+                side = "lower"
+            else:
+                upper, margin_upper = x, margin_x
+                if side == "upper":
+                    margin_lower /= 2
+                side = "upper"
+        else:
+            logger.warning(
+                f"SOLVER: no convergence after {max_iterations} iterations "
+                f"(bracket [{lower}, {upper}])."
+            )
+        logger.info(f"SOLVER: converged after {self.n_evaluations} evaluations.")
+        return lower if margin_lower > 0 else upper
+
+
+def max_sustainable_amount(
+    budget: Budget,
+    parameter: str = "expenses[0].monthly_amount",
+    until: dt.date | None = None,
+    constraint: Constraint = no_run_out,
+    tolerance: float = 1.0,
+    method: str = "secant",
+) -> float | None:
+    """Highest value of an amount (e.g. "Leisure.monthly_amount") that is sustainable.
+
+    The upper end of the bracket is doubled until the constraint is violated.
+    """
+    solver = Solver(
+        budget=budget, parameter=parameter, constraint=constraint, until=until
+    )
+    lower = 0.0
+    if solver.margin(lower) <= 0:
+        logger.error(f"SOLVER: the budget is not sustainable even at {lower}.")
+        return None
+    upper = max(abs(solver.engine.defaults[solver.keys[0]]), 1.0)
+    for _ in range(64):
+        if solver.margin(upper) <= 0:
+            break
+        lower, upper = upper, 2 * upper
+    else:
+        logger.error("SOLVER: the budget stays sustainable for any amount.")
+        return None
+    return solver.solve(lower=lower, upper=upper, method=method, tolerance=tolerance)
+
+
+def earliest_retirement(
+    budget: Budget,
+    until: dt.date | None = None,
+    constraint: Constraint = no_run_out,
+) -> int | None:
+    """Earliest year where stopping all incomes on January 1st is still sustainable."""
+    engine = VectorizedBudget(budget=budget)
+    solver = Solver(
+        budget=engine,
+        parameter=[
+            f"incomes[{i}].last_income_date" for i in range(len(budget.incomes))
+        ],
+        constraint=constraint,
+        until=until,
+    )
+    first_year = engine.start_date.year
+    last_year = engine.dates[-1].year
+
+    def months_until(year: int) -> int:
+        return months_between(engine.start_date, dt.date(year, 1, 1))
+
+    if solver.margin(months_until(first_year)) > 0:
+        return first_year
+    if solver.margin(months_until(last_year)) <= 0:
+        logger.error(f"SOLVER: retiring in {last_year} is still not sustainable.")
+        return None
+    # search over years and map back to the last income date of each year
+    lower, upper = first_year, last_year
+    while upper - lower > 1:
+        year = (lower + upper) // 2
+        if solver.margin(months_until(year)) > 0:
+            upper = year
+        else:
+            lower = year
+    return upper
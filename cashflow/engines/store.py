@@ -0,0 +1,441 @@
+"""Local SQLite database of simulated scenarios, queried into DataFrames.
+
+Every scenario of a run (a sweep, a Monte Carlo batch or a household of a client
+book) is stored with its budget configuration and parameters, one row per year
+and component with the aggregated flows and balances, and its key events: the
+month the money runs out and the month each credit is paid off. Inserts are
+batched with executemany inside one transaction per run, and the columns used to
+filter (events by date, yearly rows by component and year) are indexed.
+
+Run with `python -m cashflow.engines.store` to benchmark a sweep.
+"""
+import datetime as dt
+import itertools
+import json
+import sqlite3
+import time
+import typing as T
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cashflow.engines.vectorized import VectorizedResult
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    label TEXT,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scenarios (
+    scenario_id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    household TEXT,
+    config TEXT,
+    parameters TEXT,
+    run_out_date TEXT,
+    final_wealth REAL
+);
+CREATE TABLE IF NOT EXISTS yearly (
+    scenario_id INTEGER NOT NULL REFERENCES scenarios (scenario_id),
+    year INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    amount REAL,
+    interests REAL,
+    balance REAL,
+    min_balance REAL
+);
+CREATE TABLE IF NOT EXISTS events (
+    scenario_id INTEGER NOT NULL REFERENCES scenarios (scenario_id),
+    event TEXT NOT NULL,
+    name TEXT,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scenarios_run ON scenarios (run_id);
+CREATE INDEX IF NOT EXISTS scenarios_run_out ON scenarios (run_out_date);
+CREATE INDEX IF NOT EXISTS yearly_component ON yearly (kind, name, year);
+CREATE INDEX IF NOT EXISTS yearly_scenario ON yearly (scenario_id);
+CREATE INDEX IF NOT EXISTS events_date ON events (event, date);
+CREATE INDEX IF NOT EXISTS events_scenario ON events (scenario_id);
+"""
+
+
+def _float(x: float) -> float | None:
+    return None if np.isnan(x) else float(x)
+
+
+def _yearly_rows(
+    result: VectorizedResult, scenario_ids: T.List[int]
+) -> T.Iterator[T.Tuple]:
+    """(scenario_id, year, kind, name, amount, interests, balance, min_balance).
+
+    Flows are summed over the simulated months of each year, balances are taken
+    at the last simulated month of the year. Years after running out are skipped.
+    Columns are gathered with NumPy and zipped into rows; SQLite stores NaN as
+    NULL.
+    """
+    years = np.array([d.year for d in result.dates])
+    starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+    ends = np.r_[starts[1:], len(years)] - 1
+    ids = np.asarray(scenario_ids)
+    for kind, amounts in [
+        ("incomes", result.incomes),
+        ("expenses", result.expenses),
+        ("savings", result.deposits),
+    ]:
+        valid = np.add.reduceat(~np.isnan(amounts), starts, axis=-1) > 0
+        s, k, y = np.nonzero(valid)
+        sums = np.add.reduceat(np.nan_to_num(amounts), starts, axis=-1)[s, k, y]
+        if kind == "savings":
+            interests = np.add.reduceat(
+                np.nan_to_num(result.interests), starts, axis=-1
+            )[s, k, y]
+            balances = result.balances[..., ends][s, k, y]
+            min_balances = np.fmin.reduceat(result.balances, starts, axis=-1)[s, k, y]
+        else:
+            interests = balances = min_balances = np.full(len(s), np.nan)
+        yield from zip(
+            ids[s].tolist(),
+            years[starts][y].tolist(),
+            itertools.repeat(kind),
+            np.array(result.names[kind], dtype=object)[k].tolist(),
+            sums.tolist(),
+            interests.tolist(),
+            balances.tolist(),
+            min_balances.tolist(),
+        )
+        pass
+
+
+def _event_rows(
+    result: VectorizedResult, scenario_ids: T.List[int]
+) -> T.Iterator[T.Tuple]:
+    """(scenario_id, event, name, date) of running out (of the bank account) and
+    paying off credits."""
+    bank = result.names["savings"][0]
+    for s, date in enumerate(result.run_out_dates()):
+        if date is not None:
+            yield scenario_ids[s], "run_out", bank, date.isoformat()
+        pass
+    # a credit is paid off once less than half an øre is outstanding
+    paid_off = result.credits < 0.005
+    first = paid_off.argmax(axis=-1)
+    for s, k in zip(*np.nonzero(paid_off.any(axis=-1))):
+        date = result.dates[first[s, k]].isoformat()
+        yield scenario_ids[s], "loan_payoff", result.names["credits"][k], date
+    pass
+
+
+class ScenarioStore:
+    """SQLite backed store of simulation runs; queries return DataFrames.
+
+    path is a database file (created if missing) or ":memory:".
+    """
+
+    def __init__(self, path: str | Path = ":memory:"):
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        if str(path) != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        pass
+
+    def close(self):
+        self.connection.close()
+        pass
+
+    def __enter__(self) -> "ScenarioStore":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        pass
+
+    def add(
+        self,
+        result: VectorizedResult,
+        configs: T.Dict | T.List[T.Dict] | None = None,
+        parameters: T.Dict[str, T.Any] | None = None,
+        households: T.List[str] | None = None,
+        label: str | None = None,
+    ) -> int:
+        """Store all scenarios of a result as one run and return its run_id.
+
+        configs is the budget configuration (as accepted by budget_from_dict) of
+        all scenarios or a list with one per scenario, parameters the overrides
+        passed to VectorizedBudget.run (scalars or one value per scenario).
+        """
+        return self.add_many([result], configs, parameters, households, label)
+
+    def add_many(
+        self,
+        results: T.List[VectorizedResult],
+        configs: T.Dict | T.List[T.Dict] | None = None,
+        parameters: T.Dict[str, T.Any] | None = None,
+        households: T.List[str] | None = None,
+        label: str | None = None,
+    ) -> int:
+        """Like add for several results (e.g. the households of a Portfolio,
+        unpacked) whose scenarios are numbered consecutively in one run."""
+        n_scenarios = sum(x.n_scenarios for x in results)
+        if not isinstance(configs, list):
+            configs = [configs] * n_scenarios
+        assert len(configs) == n_scenarios, "Give one config per scenario."
+        assert (households is None) or (
+            len(households) == n_scenarios
+        ), "Give one household per scenario."
+        parameters = {
+            k: np.broadcast_to(np.asarray(v), (n_scenarios,))
+            for k, v in (parameters or {}).items()
+        }
+
+        start = time.perf_counter()
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO runs (label, created) VALUES (?, ?)",
+                (label, dt.datetime.now().isoformat(timespec="seconds")),
+            )
+            run_id = cursor.lastrowid
+            first = self.connection.execute(
+                "SELECT COALESCE(MAX(scenario_id), 0) + 1 FROM scenarios"
+            ).fetchone()[0]
+            scenario_rows, yearly_rows, event_rows = [], [], []
+            offset = first
+            for result in results:
+                ids = list(range(offset, offset + result.n_scenarios))
+                final_wealth = result.final_balances().sum(axis=1)
+                for s, (scenario_id, date) in enumerate(
+                    zip(ids, result.run_out_dates())
+                ):
+                    i = scenario_id - first
+                    scenario_rows.append(
+                        (
+                            scenario_id,
+                            run_id,
+                            households[i] if households is not None else None,
+                            json.dumps(configs[i]) if configs[i] is not None else None,
+                            json.dumps(
+                                {k: _json_value(v[i]) for k, v in parameters.items()}
+                            )
+                            if parameters
+                            else None,
+                            date.isoformat() if date is not None else None,
+                            _float(final_wealth[s]),
+                        )
+                    )
+                    pass
+                yearly_rows.extend(_yearly_rows(result, ids))
+                event_rows.extend(_event_rows(result, ids))
+                offset += result.n_scenarios
+                pass
+            self.connection.executemany(
+                "INSERT INTO scenarios VALUES (?, ?, ?, ?, ?, ?, ?)", scenario_rows
+            )
+            self.connection.executemany(
+                "INSERT INTO yearly VALUES (?, ?, ?, ?, ?, ?, ?, ?)", yearly_rows
+            )
+            self.connection.executemany(
+                "INSERT INTO events VALUES (?, ?, ?, ?)", event_rows
+            )
+        logger.info(
+            f"STORE: run {run_id} with {n_scenarios} scenarios, {len(yearly_rows)} "
+            f"yearly rows and {len(event_rows)} events stored in "
+            f"{time.perf_counter() - start:.2f}s."
+        )
+        return run_id
+
+    def query(self, sql: str, params: T.Sequence | T.Dict = ()) -> pd.DataFrame:
+        """Any SELECT over the runs, scenarios, yearly and events tables."""
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def runs(self) -> pd.DataFrame:
+        return self.query(
+            "SELECT runs.*, COUNT(scenario_id) AS scenarios FROM runs "
+            "LEFT JOIN scenarios USING (run_id) GROUP BY run_id"
+        ).set_index("run_id")
+
+    def scenarios(
+        self, run_id: int | None = None, scenario_ids: T.List[int] | None = None
+    ) -> pd.DataFrame:
+        """Scenarios with their parsed configs and parameters."""
+        where, params = _where(run_id=run_id, scenario_ids=scenario_ids)
+        df = self.query(f"SELECT * FROM scenarios {where}", params)
+        for column in ["config", "parameters"]:
+            df[column] = [json.loads(x) if x is not None else None for x in df[column]]
+        return df.set_index("scenario_id")
+
+    def events(
+        self,
+        event: str | None = None,
+        before: dt.date | None = None,
+        after: dt.date | None = None,
+        run_id: int | None = None,
+    ) -> pd.DataFrame:
+        """Events ("run_out", "loan_payoff") in [after, before) joined with their
+        scenario."""
+        where, params = _where(event=event, before=before, after=after, run_id=run_id)
+        return self.query(
+            "SELECT events.*, run_id, household FROM events "
+            f"JOIN scenarios USING (scenario_id) {where} ORDER BY date",
+            params,
+        )
+
+    def run_out_before(self, date: dt.date, run_id: int | None = None) -> pd.DataFrame:
+        """Scenarios that run out of money before date."""
+        return self.events(event="run_out", before=date, run_id=run_id)
+
+    def yearly(
+        self,
+        kind: str | None = None,
+        name: str | None = None,
+        years: T.Tuple[int, int] | None = None,
+        run_id: int | None = None,
+    ) -> pd.DataFrame:
+        """Yearly aggregates, optionally of one kind/component and years [from, to)."""
+        where, params = _where(kind=kind, name=name, years=years, run_id=run_id)
+        return self.query(
+            "SELECT yearly.*, run_id, household FROM yearly "
+            f"JOIN scenarios USING (scenario_id) {where} "
+            "ORDER BY scenario_id, year",
+            params,
+        )
+
+    def balance_below(
+        self,
+        amount: float = 0.0,
+        before: int | None = None,
+        name: str | None = None,
+        run_id: int | None = None,
+    ) -> pd.DataFrame:
+        """Scenarios where a saving (all if name is None) drops below amount in a
+        year before before, with the first such year.
+
+        Balances aren't simulated from the month the money runs out, so the bank
+        account never drops below 0 in the yearly rows: for amount >= 0, running
+        out counts as the bank account dropping below amount in the year of
+        running out (min_balance is then NULL unless a stored balance is lower).
+        """
+        yearly, params = _where(
+            kind="savings", name=name, years=(None, before), run_id=run_id
+        )
+        sql = (
+            "SELECT scenario_id, name, year, min_balance FROM yearly "
+            f"JOIN scenarios USING (scenario_id) {yearly} "
+            f"{'AND' if yearly else 'WHERE'} min_balance < :amount"
+        )
+        if amount >= 0:
+            run_out, run_out_params = _where(
+                event="run_out",
+                name=name,
+                before=dt.date(before, 1, 1) if before is not None else None,
+                run_id=run_id,
+            )
+            sql += (
+                " UNION ALL SELECT scenario_id, name, "
+                "CAST(substr(date, 1, 4) AS INTEGER) AS year, NULL AS min_balance "
+                f"FROM events JOIN scenarios USING (scenario_id) {run_out}"
+            )
+            params.update(run_out_params)
+        return self.query(
+            "SELECT scenario_id, household, name, MIN(year) AS year, "
+            f"MIN(min_balance) AS min_balance FROM ({sql}) "
+            "JOIN scenarios USING (scenario_id) "
+            "GROUP BY scenario_id, name ORDER BY scenario_id",
+            {**params, "amount": amount},
+        )
+
+
+def _json_value(x: T.Any) -> T.Any:
+    if isinstance(x, (dt.date, np.datetime64)):
+        return str(x)
+    return x.item() if isinstance(x, np.generic) else x
+
+
+def _where(
+    run_id: int | None = None,
+    scenario_ids: T.List[int] | None = None,
+    event: str | None = None,
+    before: dt.date | None = None,
+    after: dt.date | None = None,
+    kind: str | None = None,
+    name: str | None = None,
+    years: T.Tuple[int | None, int | None] | None = None,
+) -> T.Tuple[str, T.Dict[str, T.Any]]:
+    """WHERE clause with named parameters for the given filters."""
+    clauses, params = [], {}
+    for column, key, value in [
+        ("run_id", "run_id", run_id),
+        ("event", "event", event),
+        ("kind", "kind", kind),
+        ("name", "name", name),
+    ]:
+        if value is not None:
+            clauses.append(f"{column} = :{key}")
+            params[key] = value
+        pass
+    if scenario_ids is not None:
+        ids = {f"id{i}": int(x) for i, x in enumerate(scenario_ids)}
+        clauses.append(f"scenario_id IN ({', '.join(':' + k for k in ids) or 'NULL'})")
+        params.update(ids)
+    if before is not None:
+        clauses.append("date < :before")
+        params["before"] = before.isoformat()
+    if after is not None:
+        clauses.append("date >= :after")
+        params["after"] = after.isoformat()
+    if (years is not None) and (years[0] is not None):
+        clauses.append("year >= :from_year")
+        params["from_year"] = years[0]
+    if (years is not None) and (years[1] is not None):
+        clauses.append("year < :to_year")
+        params["to_year"] = years[1]
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+if __name__ == "__main__":
+    from cashflow.engines.serialization import compile_dict
+
+    config = {
+        "incomes": [
+            {
+                "name": "Salary",
+                "monthly_amount": 35000,
+                "last_income_date": "2055-01-01",
+            }
+        ],
+        "expenses": [{"name": "Living", "monthly_amount": 15000}],
+        "savings": [
+            {"name": "Bank", "initial_amount": 50000, "interest_rate": 0.0},
+            {
+                "name": "Stocks",
+                "initial_amount": 0,
+                "monthly_amount": 4000,
+                "interest_rate": 0.06,
+                "interest_frequency": "annually",
+            },
+        ],
+        "credits": [
+            {"name": "House", "credit_amount": 2000000, "annual_interest_rate": 0.04}
+        ],
+    }
+    engine = compile_dict(config)
+    parameters = {"Living.monthly_amount": np.linspace(5000, 25000, 10000)}
+    result = engine.run(parameters)
+
+    with ScenarioStore() as store:
+        run_id = store.add(result, config, parameters, label="living sweep")
+        start = time.perf_counter()
+        run_out = store.run_out_before(dt.date(2045, 1, 1), run_id=run_id)
+        negative = store.balance_below(0.0, before=2045, name="Bank")
+        logger.info(
+            f"STORE: {len(run_out)} scenarios run out and {len(negative)} bank "
+            f"accounts go negative before 2045, queried in "
+            f"{1000 * (time.perf_counter() - start):.1f}ms."
+        )
+        print(store.runs())
+        print(run_out.head())
@@ -0,0 +1,477 @@
+"""Alternative futures of a budget as a tree of branches sharing their history.
+
+A branch forks from its parent after a given number of simulated months, e.g.
+"buy the apartment in 2028" or "retire at 62", and overrides some parameters
+from then on. Up to the fork it is its parent, so only the months after the fork
+are simulated, starting from the parent's balances at the fork. A branch's
+ledger is the chain of segments from the root down to it: views into the results
+of its ancestors, concatenated only when a series is asked for. Siblings forking
+at the same month with the same parameters overridden are simulated as one batch.
+
+Run with `python -m cashflow.engines.tree` to compare branches of an example.
+"""
+import datetime as dt
+import time
+import typing as T
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.vectorized import (
+    VectorizedBudget,
+    VectorizedResult,
+    months_between,
+)
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+
+@dataclass(eq=False)
+class Branch:
+    """A future that equals its parent for the first fork months.
+
+    values are all parameters of the branch (the parent's plus overrides).
+    result holds the months after the fork of one or more siblings, the branch
+    being scenario index of it; it is None for the root before running and for
+    branches whose parent ran out of money before the fork. credit_terms maps
+    credits taken out or refinanced on the path to (month, principal, duration,
+    monthly interests shown in the first year).
+    """
+
+    name: str
+    parent: "Branch | None"
+    fork: int
+    overrides: T.Dict[str, float]
+    values: T.Dict[str, float]
+    children: T.List["Branch"] = field(default_factory=list)
+    result: VectorizedResult | None = None
+    index: int = 0
+    credit_terms: T.Dict[int, T.Tuple[int, float, float, float]] = field(
+        default_factory=dict
+    )
+
+    def path(self) -> T.List["Branch"]:
+        """The branches from the root down to this one."""
+        branches = [self]
+        while branches[-1].parent is not None:
+            branches.append(branches[-1].parent)
+        return branches[::-1]
+
+    def segments(self) -> T.List[T.Tuple["Branch", int, int]]:
+        """(branch, first, stop) months of the ledger simulated by each ancestor.
+
+        Months are counted from the start of the budget; first is the fork of the
+        branch whose result covers [first, stop).
+        """
+        simulated = [b for b in self.path() if b.result is not None]
+        stops = [b.fork for b in simulated[1:]] + [None]
+        segments = []
+        for branch, stop in zip(simulated, stops):
+            end = branch.fork + len(branch.result.dates)
+            segments.append((branch, branch.fork, end if stop is None else stop))
+        return segments
+
+    @property
+    def run_out(self) -> int:
+        """Month (from the start) the money runs out in, -1 if it never does."""
+        for branch, first, stop in self.segments():
+            run_out = branch.result.run_out[branch.index]
+            if 0 <= run_out < stop - first:
+                return first + run_out
+        return -1
+
+    def series(self, kind: str = "balances") -> np.ndarray:
+        """A (components, months) result array over the whole ledger.
+
+        Each segment is a view into the result that simulated it; the only copy is
+        the concatenation.
+        """
+        return np.concatenate(
+            [
+                getattr(branch.result, kind)[branch.index][..., : stop - first]
+                for branch, first, stop in self.segments()
+            ],
+            axis=-1,
+        )
+
+    def dates(self) -> T.List[dt.date]:
+        return [
+            date
+            for branch, first, stop in self.segments()
+            for date in branch.result.dates[: stop - first]
+        ]
+
+    def balances_at(self, month: int) -> np.ndarray:
+        """Balance of every saving after month months (the initial ones at 0)."""
+        for branch, first, stop in self.segments():
+            if first <= month <= stop:
+                if month == first:
+                    return branch.result.initial_balances[branch.index]
+                return branch.result.balances[branch.index][:, month - first - 1]
+        raise ValueError(f"{self.name} was not simulated up to month {month}.")
+
+    def at(self, kind: str, month: int) -> np.ndarray:
+        """A result array (e.g. "credits") in month month (0 < month)."""
+        for branch, first, stop in self.segments():
+            if first < month <= stop:
+                return getattr(branch.result, kind)[branch.index][:, month - first - 1]
+        raise ValueError(f"{self.name} was not simulated up to month {month}.")
+
+
+class ScenarioTree:
+    """Branches of a (not yet run) budget, simulated suffix by suffix.
+
+    fork() adds a branch that overrides parameters (keys or labels, as in
+    VectorizedBudget) after a date or a number of months. Overriding the
+    credit_amount or initial_payoff of a credit takes that loan out at the fork,
+    e.g. buying a home with a credit whose credit_amount is 0 at the root; the
+    initial payoff is paid from the bank account into the credit's ownership.
+    Overriding only the rate or duration of a loan refinances what is
+    outstanding at the fork (over the remaining duration unless it is
+    overridden). Initial amounts of savings cannot be overridden after the start.
+    """
+
+    def __init__(
+        self,
+        budget: Budget | VectorizedBudget,
+        n_months: int = 60 * 12,
+        parameters: T.Dict[str, T.Any] | None = None,
+        name: str = "base",
+    ):
+        self.engine = (
+            budget
+            if isinstance(budget, VectorizedBudget)
+            else VectorizedBudget(budget, n_months)
+        )
+        overrides = self._resolve(parameters)
+        self.root = Branch(
+            name=name,
+            parent=None,
+            fork=0,
+            overrides=overrides,
+            values=self.engine.defaults | overrides,
+        )
+        self.branches: T.Dict[str, Branch] = {name: self.root}
+        pass
+
+    def _resolve(self, parameters: T.Dict[str, T.Any] | None) -> T.Dict[str, float]:
+        values = {}
+        for key, value in (parameters or {}).items():
+            if isinstance(value, dt.date):
+                value = months_between(self.engine.start_date, value)
+            values[self.engine.resolve(key)] = float(value)
+        return values
+
+    def fork(
+        self,
+        name: str,
+        at: dt.date | int,
+        parameters: T.Dict[str, T.Any],
+        parent: str | None = None,
+    ) -> Branch:
+        """Add a branch of parent (the root by default) diverging after the month
+        of a date or after a number of months."""
+        assert name not in self.branches, f"There is already a branch {name}."
+        parent = self.branches[parent] if parent is not None else self.root
+        fork = (
+            months_between(self.engine.start_date, at)
+            if isinstance(at, dt.date)
+            else at
+        )
+        assert (
+            parent.fork <= fork < self.engine.n_months
+        ), f"{name} must fork between month {parent.fork} and {self.engine.n_months}."
+        overrides = self._resolve(parameters)
+        initial = [k for k in overrides if k.endswith(".initial_amount")]
+        assert not initial, f"Initial amounts cannot change at a fork: {initial}."
+        branch = Branch(
+            name=name,
+            parent=parent,
+            fork=fork,
+            overrides=overrides,
+            values=parent.values | overrides,
+        )
+        parent.children.append(branch)
+        self.branches[name] = branch
+        return branch
+
+    def run(self, **kwargs) -> "ScenarioTree":
+        """Simulate every branch after its fork; kwargs go to VectorizedBudget.run.
+
+        Children are simulated after their parent, batched by fork month and the
+        parameters they override.
+        """
+        start = time.perf_counter()
+        self.root.result = self._simulate([self.root], **kwargs)
+        n_runs, n_months = 1, len(self.root.result.dates)
+        queue = [self.root]
+        while queue:
+            parent = queue.pop(0)
+            batches = defaultdict(list)
+            run_out = parent.run_out
+            for child in parent.children:
+                child.result = None
+                queue.append(child)
+                if 0 <= run_out < child.fork:
+                    continue
+                batches[(child.fork, frozenset(child.overrides))].append(child)
+                pass
+            for (fork, _), children in batches.items():
+                result = self._simulate(children, fork, parent, **kwargs)
+                for i, child in enumerate(children):
+                    child.result, child.index = result, i
+                n_runs += 1
+                n_months += len(children) * len(result.dates)
+            pass
+        logger.info(
+            f"TREE: {len(self.branches)} branches simulated in {n_runs} runs of "
+            f"{n_months} months in total, took {time.perf_counter() - start:.3f}s."
+        )
+        return self
+
+    def _simulate(
+        self,
+        branches: T.List[Branch],
+        fork: int = 0,
+        parent: Branch | None = None,
+        **kwargs,
+    ) -> VectorizedResult:
+        defaults = self.engine.defaults
+        parameters = {
+            k: np.array([b.values[k] for b in branches])
+            for k in defaults
+            if any(b.values[k] != defaults[k] for b in branches)
+        }
+        if parent is None:
+            return self.engine.run(parameters, **kwargs)
+        balances = np.repeat(parent.balances_at(fork)[None], len(branches), axis=0)
+        for b, branch in enumerate(branches):
+            branch.credit_terms = dict(parent.credit_terms)
+            for i, terms in self._credit_terms(branch, parent, fork).items():
+                payoff = branch.values[f"credits[{i}].initial_payoff"]
+                if self._takes_out(branch, i):
+                    balances[b, 0] -= payoff
+                    balances[b, self._n_savings + i] += payoff
+                branch.credit_terms[i] = terms
+            pass
+        # credits run from the month they were last taken out or refinanced in
+        terms = [b.credit_terms for b in branches]
+        for i in terms[0]:
+            for key, k in [("credit_amount", 1), ("loan_duration", 2)]:
+                parameters[f"credits[{i}].{key}"] = np.array([x[i][k] for x in terms])
+            parameters[f"credits[{i}].initial_payoff"] = np.zeros(len(branches))
+        return self.engine.run(
+            parameters,
+            start=fork,
+            initial_balances=balances,
+            credit_starts={i: x[0] for i, x in terms[0].items()},
+            credit_interests={i: np.array([x[i][3] for x in terms]) for i in terms[0]},
+            **kwargs,
+        )
+
+    @property
+    def _n_savings(self) -> int:
+        names = self.engine.names
+        return len(names["savings"]) - len(names["credits"])
+
+    @staticmethod
+    def _takes_out(branch: Branch, i: int) -> bool:
+        return any(
+            f"credits[{i}].{x}" in branch.overrides
+            for x in ["credit_amount", "initial_payoff"]
+        )
+
+    def _credit_terms(
+        self, branch: Branch, parent: Branch, fork: int
+    ) -> T.Dict[int, T.Tuple[int, float, float, float]]:
+        """(month, principal, duration, interests) of the credits branch
+        overrides."""
+        overridden = {
+            int(key[len("credits[") : key.index("]")])
+            for key in branch.overrides
+            if key.startswith("credits[")
+        }
+        outstanding = parent.at("credits", fork) if fork > 0 else None
+        n_expenses = len(self.engine.expenses)
+        terms = {}
+        for i in sorted(overridden):
+            key = f"credits[{i}]"
+            duration = branch.values[f"{key}.loan_duration"]
+            interests = 0.0
+            if self._takes_out(branch, i):
+                assert outstanding is None or outstanding[i] <= 0.01, (
+                    f"{branch.name} takes out {self.engine.names['credits'][i]} "
+                    f"while it is outstanding; override its rate or duration to "
+                    f"refinance it."
+                )
+                principal = (
+                    branch.values[f"{key}.credit_amount"]
+                    - branch.values[f"{key}.initial_payoff"]
+                )
+            elif outstanding is None:
+                principal = (
+                    parent.values[f"{key}.credit_amount"]
+                    - parent.values[f"{key}.initial_payoff"]
+                )
+            else:
+                principal = max(outstanding[i], 0.0)
+                # what the loan would have shown in the month after the fork
+                interests = parent.at("expenses", fork + 1)[n_expenses + i]
+                if f"{key}.loan_duration" not in branch.overrides:
+                    start, _, duration, _ = parent.credit_terms.get(
+                        i, (0, None, parent.values[f"{key}.loan_duration"], None)
+                    )
+                    duration -= (fork - start) / 12
+            terms[i] = (fork, principal, duration, interests)
+        return terms
+
+    def fork_date(self, branch: Branch) -> dt.date | None:
+        """Date of the last month a branch shares with its parent."""
+        return self.engine.dates[branch.fork - 1] if branch.fork > 0 else None
+
+    def fork_dates(self) -> T.Dict[str, dt.date]:
+        """Fork date of every branch but the root, e.g. for plot_scenario_tree."""
+        return {k: self.fork_date(x) for k, x in self.branches.items() if x.parent}
+
+    def frame(self, kind: str = "wealth") -> pd.DataFrame:
+        """One column per branch, indexed by date, of the bank balance ("bank"),
+        the balances of all savings ("wealth", including the ownership of
+        credits) or the outstanding credits ("credits")."""
+        columns = {}
+        for name, branch in self.branches.items():
+            if kind == "bank":
+                values = branch.series("balances")[0]
+            else:
+                values = branch.series("balances" if kind == "wealth" else kind)
+                values = values.sum(axis=0)
+            columns[name] = pd.Series(values, index=branch.dates())
+        return pd.DataFrame(columns).rename_axis("date")
+
+    def comparison(self, years: T.Sequence[int] = ()) -> pd.DataFrame:
+        """One row per branch: where it forks, when it runs out of money, its
+        final balances and its wealth at the end of the given years."""
+        wealth = self.frame("wealth")
+        year_ends = wealth.groupby([d.year for d in wealth.index]).last()
+        rows = []
+        for name, branch in self.branches.items():
+            run_out = branch.run_out
+            balances = branch.series("balances")
+            credits = branch.series("credits")
+            # the balances of the last month before running out
+            last = run_out - 1 if run_out >= 0 else balances.shape[-1] - 1
+            final = balances[:, last] if last >= 0 else branch.balances_at(0)
+            rows.append(
+                {
+                    "branch": name,
+                    "parent": branch.parent.name if branch.parent else None,
+                    "fork_date": self.fork_date(branch),
+                    "simulated_months": (
+                        len(branch.result.dates) if branch.result is not None else 0
+                    ),
+                    "run_out_date": (
+                        self.engine.dates[run_out] if run_out >= 0 else None
+                    ),
+                    "final_bank": final[0],
+                    "final_wealth": final.sum(),
+                    "final_credits": credits[:, last].sum() if last >= 0 else 0.0,
+                }
+                | {
+                    f"wealth_{year}": (
+                        year_ends.loc[year, name] if year in year_ends.index else np.nan
+                    )
+                    for year in years
+                }
+            )
+            pass
+        return pd.DataFrame(rows).set_index("branch")
+
+
+if __name__ == "__main__":
+    from cashflow.engines.components import Income, Expense, Saving, Credit
+    from cashflow.engines.parity import _error, _release
+    from cashflow.utils.plotting import plot_scenario_tree
+
+    def example(retirement: int) -> Budget:
+        return Budget(
+            incomes=[
+                Income(
+                    name="Salary",
+                    monthly_amount=55000.0,
+                    last_income_date=dt.date(retirement, 1, 1),
+                )
+            ],
+            expenses=[Expense(name="Living", monthly_amount=18000.0)],
+            savings=[
+                Saving(name="Bank", initial_amount=200000.0, interest_rate=0.0),
+                Saving(
+                    name="Stocks",
+                    initial_amount=0.0,
+                    monthly_amount=4000.0,
+                    interest_rate=0.06,
+                    interest_frequency="annually",
+                ),
+            ],
+            credits=[
+                Credit(
+                    name="Apartment",
+                    credit_amount=0.0,
+                    initial_payoff=0.0,
+                    annual_interest_rate=0.04,
+                )
+            ],
+        )
+
+    year = dt.date.today().year
+    budget = example(year + 30)
+    tree = ScenarioTree(budget)
+    for buy in [2, 4]:
+        tree.fork(
+            f"buy in {year + buy}",
+            at=dt.date(year + buy, 1, 1),
+            parameters={
+                "Apartment.credit_amount": 3e6,
+                "Apartment.initial_payoff": 3e5,
+            },
+        )
+        for age in [62, 65, 67]:
+            tree.fork(
+                f"buy in {year + buy}, retire at {age}",
+                parent=f"buy in {year + buy}",
+                at=dt.date(year + 20, 1, 1),
+                parameters={
+                    "Salary.last_income_date": dt.date(year + 30 + age - 65, 1, 1)
+                },
+            )
+    tree.fork(
+        f"buy in {year + 2}, refinance at 2%",
+        parent=f"buy in {year + 2}",
+        at=dt.date(year + 10, 1, 1),
+        parameters={"Apartment.annual_interest_rate": 0.02},
+    )
+    tree.run()
+    _release(budget)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(tree.comparison(years=[year + 10, year + 30]).round(0))
+    plot_scenario_tree(tree.frame(), tree.fork_dates())
+
+    # the suffix of a branch matches a full run with the branch's inputs, where a
+    # loan taken out at the fork is not expressible, so compare a retirement fork
+    tree = ScenarioTree(example(year + 30))
+    branch = tree.fork(
+        "retire early",
+        at=dt.date(year + 20, 1, 1),
+        parameters={"Salary.last_income_date": dt.date(year + 25, 1, 1)},
+    )
+    tree.run()
+    budget = example(year + 25)
+    start = time.perf_counter()
+    expected = VectorizedBudget(budget).run()
+    logger.info(
+        f"TREE: a full run took {time.perf_counter() - start:.3f}s, the forked "
+        f"branch differs by {_error(expected.balances[0], branch.series()):.1e}."
+    )
+    _release(budget)
@@ -0,0 +1,138 @@
+"""Credit schedules with rate resets (F1/F3/F5 loans) and refinancings."""
+import typing as T
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+def annuity(principal: np.ndarray, rate: np.ndarray, n_years: np.ndarray) -> np.ndarray:
+    """Yearly payment that pays off principal in n_years (as in Credit)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            rate == 0,
+            principal / n_years,
+            (1 + rate) ** (n_years - 1)
+            / ((1 + rate) ** n_years - 1)
+            * principal
+            * rate,
+        )
+
+
+@dataclass
+class Refinancing:
+    """Replace a loan by a new one in a given loan year.
+
+    The outstanding credit plus cost is financed at the rate of that year over
+    duration years (the remaining term if None).
+    """
+
+    year: int
+    duration: float | None = None
+    cost: float = 0.0
+
+
+@dataclass
+class RateSchedule:
+    """Rates of a credit that are reset every reset_every years.
+
+    rates holds the annual rate of every loan year, shaped (years,) or
+    (scenarios, years), e.g. Monte Carlo rate paths; the last rate is kept for
+    later years. At each reset (and refinancing) the rate of that year is fixed
+    until the next one and the annuity is recomputed for the outstanding credit
+    over the remaining term.
+    """
+
+    rates: np.ndarray
+    reset_every: int = 1
+    refinancings: T.List[Refinancing] = field(default_factory=list)
+
+    def segments(self, n_years: int) -> T.List[T.Tuple[int, int]]:
+        """(start, stop) loan years between two resets or refinancings."""
+        starts = {0}
+        loan_start = 0
+        refinancing_years = {x.year for x in self.refinancings}
+        for year in range(1, n_years):
+            if year in refinancing_years:
+                loan_start = year
+                starts.add(year)
+            elif (year - loan_start) % self.reset_every == 0:
+                starts.add(year)
+            pass
+        starts = sorted(starts)
+        return list(zip(starts, starts[1:] + [n_years]))
+
+
+def variable_credit_schedules(
+    principal: np.ndarray,
+    duration: np.ndarray,
+    schedule: RateSchedule,
+    n_months: int,
+) -> T.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Like credit_schedules, for a credit following a RateSchedule.
+
+    principal and duration are shaped (scenarios,). Within a segment between two
+    resets the rate and payment are constant, so the outstanding credit at every
+    anniversary of the segment is solved in closed form for all scenarios at once;
+    only the segments are visited in order. Returns (payment, interests,
+    ownership, credit before and after capitalisation) shaped (scenarios, months).
+    """
+    n_years = n_months // 12 + 2
+    principal = np.atleast_1d(np.asarray(principal, dtype=float))
+    duration = np.atleast_1d(np.asarray(duration, dtype=float))
+    rates = np.asarray(schedule.rates, dtype=float)
+    rates = rates[None] if rates.ndim == 1 else rates
+    if rates.shape[1] < n_years:
+        rates = np.pad(rates, ((0, 0), (0, n_years - rates.shape[1])), mode="edge")
+    (n_scenarios,) = np.broadcast_shapes(
+        principal.shape, duration.shape, rates.shape[:1]
+    )
+    principal, duration = (
+        np.broadcast_to(x, (n_scenarios,)) for x in (principal, duration)
+    )
+    rates = np.broadcast_to(rates, (n_scenarios, rates.shape[1]))
+    refinancings = {x.year: x for x in schedule.refinancings}
+
+    # one extra anniversary for the capitalisation at the end of the last year
+    credit_at_anniversary = np.zeros((n_scenarios, n_years + 1))
+    anniversary_interests = np.zeros((n_scenarios, n_years + 1))
+    yearly_payments = np.zeros((n_scenarios, n_years))
+    credit_at_anniversary[:, 0] = principal
+    payment = np.zeros(n_scenarios)
+    rate = rates[:, 0]
+    loan_end = duration
+    for start, stop in schedule.segments(n_years):
+        credit = credit_at_anniversary[:, start]
+        if start in refinancings:
+            credit = credit + refinancings[start].cost
+            credit_at_anniversary[:, start] = credit
+            if refinancings[start].duration is not None:
+                loan_end = np.full(n_scenarios, start + refinancings[start].duration)
+        # past the end of the term payments continue unchanged, like in Credit
+        active = start < loan_end
+        rate = np.where(active, rates[:, start], rate)
+        payment = np.where(active, annuity(credit, rate, loan_end - start), payment)
+        # the credit is paid off during a year and interests are capitalised after it
+        growth = (1 + rate[:, None]) ** np.arange(1, stop - start + 1)
+        credits = growth * credit[:, None] - payment[:, None] * np.cumsum(
+            growth, axis=1
+        )
+        credit_at_anniversary[:, start + 1 : stop + 1] = credits
+        anniversary_interests[:, start + 1 : stop + 1] = (
+            credits * rate[:, None] / (1 + rate[:, None])
+        )
+        yearly_payments[:, start:stop] = payment[:, None]
+        pass
+
+    t = np.arange(1, n_months + 1)
+    year = (t - 1) // 12
+    month_of_year = t - 12 * year
+    monthly_payment = yearly_payments[:, year] / 12
+    monthly_interests = anniversary_interests[:, year] / 12
+    credit = credit_at_anniversary[:, year] - month_of_year * monthly_payment
+    return (
+        monthly_payment,
+        monthly_interests,
+        monthly_payment - monthly_interests,
+        credit,
+        credit + (month_of_year == 12) * anniversary_interests[:, year + 1],
+    )
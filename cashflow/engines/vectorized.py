@@ -0,0 +1,604 @@
+"""Array based replica of Budget.run, batched along a leading scenario axis."""
+import datetime as dt
+import functools
+import typing as T
+from dataclasses import dataclass
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+from cashflow.engines.drawdown import DrawdownPolicy, drawdown_loop
+from cashflow.engines.kernel import month_loop
+from cashflow.engines.tax import IncomeTax
+from cashflow.engines.variable_rates import RateSchedule, variable_credit_schedules
+from cashflow.utils.logging_utils import init_logger
+
+if T.TYPE_CHECKING:
+    from cashflow.engines.budget import Budget
+
+logger = init_logger()
+
+# kinds compiled into parameters; further kinds are fixed flows
+BUILTIN_KINDS = ("incomes", "expenses", "savings", "credits")
+
+
+def months_between(start: dt.date, date: dt.date) -> int:
+    """Number of monthly updates needed to get from start to the month of date."""
+    return (date.year - start.year) * 12 + date.month - start.month
+
+
+@functools.lru_cache(maxsize=None)
+def month_dates(start: dt.date, n_months: int) -> T.Tuple[dt.date, ...]:
+    """Dates visited by n_months monthly updates from start (cached)."""
+    return tuple(start + relativedelta(months=+t) for t in range(1, n_months + 1))
+
+
+def accumulate(
+    initial: np.ndarray, deposits: np.ndarray, rates: np.ndarray
+) -> np.ndarray:
+    """Solve the recurrence b_t = b_{t-1} * (1 + r_t) + d_t along the last axis."""
+    growth = np.cumprod(1 + rates, axis=-1)
+    return growth * (initial[..., None] + np.cumsum(deposits / growth, axis=-1))
+
+
+@dataclass
+class VectorizedResult:
+    """Monthly results of a batched simulation, shaped (scenarios, components, months)."""
+
+    dates: T.List[dt.date]
+    names: T.Dict[str, T.List[str]]
+    incomes: np.ndarray
+    expenses: np.ndarray
+    deposits: np.ndarray
+    interests: np.ndarray
+    balances: np.ndarray
+    initial_balances: np.ndarray
+    credits: np.ndarray
+    run_out: np.ndarray
+    margin: np.ndarray
+    taxes: np.ndarray | None = None
+    withdrawals: np.ndarray | None = None
+
+    @property
+    def n_scenarios(self) -> int:
+        return self.run_out.shape[0]
+
+    def run_out_dates(self) -> T.List[dt.date | None]:
+        """Date at which each scenario runs out of money (None if it never does)."""
+        return [self.dates[i] if i >= 0 else None for i in self.run_out]
+
+    def final_balances(self) -> np.ndarray:
+        """Balance of every saving in the last month before the run stopped."""
+        last = np.where(self.run_out >= 0, self.run_out, len(self.dates))
+        balances = np.concatenate(
+            [self.initial_balances[..., None], self.balances], axis=-1
+        )
+        return balances[np.arange(self.n_scenarios), :, last]
+
+
+def credit_schedules(
+    principal: np.ndarray,
+    rate: np.ndarray,
+    duration: np.ndarray,
+    n_months: int,
+    interests: np.ndarray | float = 0.0,
+) -> T.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Monthly payment, interests, ownership and outstanding credit of Credits.
+
+    Inputs of any shape get a trailing month axis. Interests are capitalised once
+    a year (as in Credit.add_interests), so the outstanding credit is solved in
+    closed form at every anniversary. The outstanding credit is returned both
+    before and after the capitalisation of the month. interests are the monthly
+    interests shown in the first year, 0 for a new loan as in Credit; a loan
+    that refinances another one carries on with the interests of that one.
+    """
+    principal, rate, duration = (
+        np.asarray(x, dtype=float)[..., None] for x in (principal, rate, duration)
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        payment = np.where(
+            rate == 0,
+            principal / duration / 12,
+            (1 + rate) ** (duration - 1)
+            / ((1 + rate) ** duration - 1)
+            * principal
+            * rate
+            / 12,
+        )
+    years = np.arange(n_months // 12 + 2)
+    growth = (1 + rate) ** years
+    paid = 12 * payment * np.cumsum(growth, axis=-1) - 12 * payment
+    credit_at_anniversary = growth * principal - paid
+    anniversary_interests = credit_at_anniversary / (1 + rate) * rate
+    anniversary_interests[..., 0] = 12 * np.asarray(interests, dtype=float)
+    t = np.arange(1, n_months + 1)
+    year = (t - 1) // 12
+    month_of_year = t - 12 * year
+    monthly_interests = anniversary_interests[..., year] / 12
+    credit = credit_at_anniversary[..., year] - month_of_year * payment
+    return (
+        payment + np.zeros_like(monthly_interests),
+        monthly_interests,
+        payment - monthly_interests,
+        credit,
+        credit + (month_of_year == 12) * anniversary_interests[..., year + 1],
+    )
+
+
+def settle(
+    money: np.ndarray,
+    incomes: np.ndarray,
+    expenses: np.ndarray,
+    deposits: np.ndarray,
+    initial_balances: np.ndarray,
+    rates: np.ndarray,
+    credits: np.ndarray,
+    credits_before_interests: np.ndarray,
+    dates: T.List[dt.date],
+    names: T.Dict[str, T.List[str]],
+    kernel: bool = False,
+    taxes: np.ndarray | None = None,
+    drawdown: DrawdownPolicy | None = None,
+) -> VectorizedResult:
+    """Deposit the residual in the bank account (savings[0]) and add interests.
+
+    Also finds the first month where the bank account can't cover a negative
+    monthly balance, and drops everything from there on like Budget.run does.
+    With kernel, the month loop of cashflow.engines.kernel is used instead of
+    the closed form solution. taxes (scenarios, months), already subtracted from
+    money, are passed on to the result. With drawdown, shortfalls are covered by
+    withdrawals from other savings (see cashflow.engines.drawdown), which are
+    netted into the deposits and returned as withdrawals; their tax is added to
+    taxes.
+    """
+    n_months = len(dates)
+    deposits[:, 0] = money
+    withdrawals = None
+    if drawdown is not None:
+        (
+            balances,
+            interests,
+            run_out,
+            margin,
+            withdrawals,
+            withdrawal_taxes,
+        ) = drawdown_loop(
+            money, deposits, rates, initial_balances, drawdown, dates, names["savings"]
+        )
+        deposits -= withdrawals
+        deposits[:, 0] += withdrawals.sum(axis=1) - withdrawal_taxes
+        taxes = withdrawal_taxes if taxes is None else taxes + withdrawal_taxes
+    elif kernel:
+        balances, interests, run_out, margin = month_loop(
+            money, deposits, rates, initial_balances
+        )
+    else:
+        balances = accumulate(initial_balances, deposits, rates)
+        previous_balances = np.concatenate(
+            [initial_balances[..., None], balances[..., :-1]], axis=-1
+        )
+        interests = previous_balances * rates
+
+        buffer = np.where(money < 0, previous_balances[:, 0] + money, np.inf)
+        ran_out = buffer <= 0
+        run_out = np.where(ran_out.any(axis=1), ran_out.argmax(axis=1), -1)
+        margin = buffer.min(axis=1)
+
+    # the bank deposit and all interests are skipped in the month the money runs
+    # out, everything after is dropped
+    if (run_out >= 0).any():
+        stop = np.where(run_out >= 0, run_out, n_months)[:, None, None]
+        month = np.arange(n_months)
+        after, at = month > stop, month == stop
+        credits = np.where(at, credits_before_interests, credits)
+        for x in [incomes, expenses, deposits[:, 1:], credits]:
+            x[np.broadcast_to(after, x.shape)] = np.nan
+        if taxes is not None:
+            taxes[after[:, 0]] = np.nan
+        if withdrawals is not None:
+            withdrawals[np.broadcast_to(after, withdrawals.shape)] = np.nan
+        for x in [interests, balances, deposits[:, :1]]:
+            x[np.broadcast_to(after | at, x.shape)] = np.nan
+
+    return VectorizedResult(
+        dates=dates,
+        names=names,
+        incomes=incomes,
+        expenses=expenses,
+        deposits=deposits,
+        interests=interests,
+        balances=balances,
+        initial_balances=initial_balances,
+        credits=credits,
+        run_out=run_out,
+        margin=margin,
+        taxes=taxes,
+        withdrawals=withdrawals,
+    )
+
+
+class VectorizedBudget:
+    """Compile a (not yet run) Budget into arrays and simulate it with NumPy.
+
+    Every numeric input is exposed as a named parameter, e.g.
+    "expenses[1].monthly_amount" or "credits[0].annual_interest_rate". Passing
+    arrays of values to run() simulates all of them at once along a scenario axis.
+    The bank account (savings[0]) receives the monthly residual and the run stops
+    at the first month where it cannot cover a negative balance, as in Budget.run.
+    """
+
+    def __init__(self, budget: "Budget", n_months: int = 60 * 12):
+        for x in budget.incomes + budget.expenses + budget.savings:
+            assert (
+                x.current_date == x.last_date
+            ), f"{x.name}: Only budgets that have not been run can be vectorized."
+        assert (
+            len(budget.savings) > len(budget.credits)
+            and not budget.savings[0].is_credit_controlled
+        ), "The first saving must be a bank account."
+        self.start_date = budget.incomes[0].current_date
+        self.n_months = n_months
+        self.dates = list(month_dates(self.start_date, n_months))
+        self.calendar_months = np.array([d.month for d in self.dates])
+        self.defaults: T.Dict[str, float] = {}
+        self.labels: T.Dict[str, str] = {}
+        n_expenses = len(budget.expenses) - len(budget.credits)
+        n_savings = len(budget.savings) - len(budget.credits)
+
+        self.incomes = []
+        for i, income in enumerate(budget.incomes):
+            key = f"incomes[{i}]"
+            self._add(key, income.name, "monthly_amount", income.monthly_amount)
+            self._add(
+                key,
+                income.name,
+                "last_income_date",
+                months_between(self.start_date, income.last_income_date),
+            )
+            self.incomes.append(self._add_changes(key, income))
+            pass
+
+        self.expenses = []
+        for i, expense in enumerate(budget.expenses[:n_expenses]):
+            key = f"expenses[{i}]"
+            if expense.is_credit_controlled:
+                self.expenses.append(None)
+                continue
+            assert (
+                expense.monthly_amount is not None
+            ), f"{expense.name}: You must specify a monthly amount in the constructor."
+            self._add(key, expense.name, "monthly_amount", expense.monthly_amount)
+            self.expenses.append(self._add_changes(key, expense))
+            pass
+
+        self.savings = []
+        for i, saving in enumerate(budget.savings):
+            key = f"savings[{i}]"
+            self._add(key, saving.name, "interest_rate", saving.interest_rate)
+            self.savings.append(saving.interest_frequency == "annually")
+            if i >= n_savings:
+                continue
+            self._add(key, saving.name, "initial_amount", saving.initial_amount)
+            if (i > 0) and not saving.is_credit_controlled:
+                assert (
+                    saving.monthly_amount is not None
+                ), f"{saving.name}: You must specify a monthly amount in the constructor."
+                self._add(key, saving.name, "monthly_amount", saving.monthly_amount)
+            pass
+
+        for i, credit in enumerate(budget.credits):
+            key = f"credits[{i}]"
+            self._add(key, credit.name, "credit_amount", credit.credit_amount)
+            self._add(key, credit.name, "initial_payoff", credit.initial_amount)
+            self._add(key, credit.name, "loan_duration", credit.loan_duration)
+            self._add(
+                key, credit.name, "annual_interest_rate", credit.annual_interest_rate
+            )
+            pass
+
+        self.fixed = self._fixed_flows(budget)
+        self.names = {
+            "incomes": [x.name for x in budget.incomes]
+            + [name for name, _, _ in self.fixed["incomes"]],
+            "expenses": [x.name for x in budget.expenses]
+            + [name for name, _, _ in self.fixed["expenses"]],
+            "savings": [x.name for x in budget.savings],
+            "credits": [x.name for x in budget.credits],
+        }
+        pass
+
+    def _fixed_flows(
+        self, budget: "Budget"
+    ) -> T.Dict[str, T.List[T.Tuple[str, np.ndarray, bool]]]:
+        """(name, amounts, counts) of the components of further registered kinds.
+
+        They are compiled through the schedule() of their kind into monthly
+        amounts that are the same in every scenario and follow the built-in
+        incomes and expenses. Accounts and credits of further kinds are not
+        supported.
+        """
+        from cashflow.engines.protocol import KINDS, Calendar
+
+        fixed = {"incomes": [], "expenses": []}
+        others = [
+            (KINDS[name], component)
+            for name, components in getattr(budget, "components", {}).items()
+            if name not in BUILTIN_KINDS
+            for component in components
+        ]
+        calendar = Calendar.from_start(self.start_date, self.n_months)
+        for kind, component in others:
+            schedule = kind.schedule(component, calendar)
+            assert not (
+                kind.is_account or "credit" in schedule.series or schedule.derived
+            ), (
+                f"{component.name}: VectorizedBudget only supports flows of further "
+                f"kinds, not accounts or credits ({kind.name})."
+            )
+            group = "incomes" if kind.sign > 0 else "expenses"
+            fixed[group].append((component.name, schedule.amounts, schedule.counts))
+            pass
+        return fixed
+
+    def _add(self, key: str, name: str, attribute: str, value: float):
+        self.defaults[f"{key}.{attribute}"] = float(value)
+        self.labels[f"{key}.{attribute}"] = f"{name}.{attribute}"
+
+    def _add_changes(self, key: str, component) -> T.List[int | None]:
+        """Register change amounts as parameters and return the month of each change."""
+        change_months = []
+        for j, (date, amount) in enumerate(component.change_dict.items()):
+            self._add(key, component.name, f"change_by_amounts[{j}]", amount)
+            month = months_between(self.start_date, date)
+            # changes only fire if the date is hit exactly by a monthly update
+            change_months.append(month if (date.day == 1) and (month >= 1) else None)
+            pass
+        return change_months
+
+    def resolve(self, parameter: str) -> str:
+        """Map a parameter key or label (e.g. "Leisure.monthly_amount") to its key."""
+        if parameter in self.defaults:
+            return parameter
+        keys = [k for k, label in self.labels.items() if label == parameter]
+        assert len(keys) == 1, f"Unknown or ambiguous parameter: {parameter}."
+        return keys[0]
+
+    def _parameter_values(
+        self, parameters: T.Dict[str, T.Any] | None
+    ) -> T.Tuple[int, T.Dict[str, np.ndarray]]:
+        overrides = {self.resolve(k): v for k, v in (parameters or {}).items()}
+        values = {}
+        for key, default in self.defaults.items():
+            value = overrides.get(key, default)
+            if isinstance(value, dt.date):
+                value = months_between(self.start_date, value)
+            values[key] = np.asarray(value, dtype=float)
+            pass
+        shape = np.broadcast_shapes(*[v.shape for v in values.values()])
+        assert len(shape) <= 1, "Parameters must be scalars or 1d arrays of scenarios."
+        n_scenarios = shape[0] if len(shape) == 1 else 1
+        values = {
+            k: np.broadcast_to(v, (n_scenarios,))[:, None] for k, v in values.items()
+        }
+        return n_scenarios, values
+
+    def _changing_amounts(
+        self,
+        key: str,
+        values: T.Dict[str, np.ndarray],
+        change_months: T.List[int | None],
+        t: np.ndarray,
+    ) -> np.ndarray:
+        amounts = values[f"{key}.monthly_amount"] + np.zeros_like(t, dtype=float)
+        for j, month in enumerate(change_months):
+            if month is not None:
+                amounts = amounts + values[f"{key}.change_by_amounts[{j}]"] * (
+                    t >= month
+                )
+            pass
+        return amounts
+
+    def _rate_paths(
+        self, rate_paths: T.Dict[str, np.ndarray] | None, n_months: int
+    ) -> T.Dict[str, np.ndarray]:
+        paths = {}
+        for key, path in (rate_paths or {}).items():
+            key = self.resolve(key)
+            assert key.startswith("savings[") and key.endswith(
+                ".interest_rate"
+            ), f"Only savings interest rates can follow a path, not {key}."
+            path = np.asarray(path, dtype=float)
+            path = path[None] if path.ndim == 1 else path
+            assert path.shape[-1] >= n_months, f"The path of {key} is too short."
+            paths[key] = path[:, :n_months]
+        return paths
+
+    def run(
+        self,
+        parameters: T.Dict[str, T.Any] | None = None,
+        until: dt.date | None = None,
+        rate_paths: T.Dict[str, np.ndarray] | None = None,
+        rate_schedules: T.Dict[str, RateSchedule] | None = None,
+        kernel: bool = False,
+        tax: IncomeTax | None = None,
+        start: int = 0,
+        initial_balances: np.ndarray | None = None,
+        credit_starts: T.Dict[int, int] | None = None,
+        credit_interests: T.Dict[int, np.ndarray] | None = None,
+        drawdown: DrawdownPolicy | None = None,
+    ) -> VectorizedResult:
+        """Simulate all scenarios, optionally only up to (and including) until.
+
+        rate_paths replaces the interest rate of savings by a rate per month, shaped
+        (months,) or (scenarios, months); annual savings still only use January.
+        rate_schedules replaces the fixed rate of credits (keyed by their
+        annual_interest_rate parameter) by resets and refinancings. kernel settles
+        the bank account with the (compiled) month loop of cashflow.engines.kernel.
+        tax withholds income taxes, assessed per taxpayer and calendar year,
+        from the residual, with deposits into its pension savings deducted; the
+        monthly total is returned as taxes. Incomes of further kinds are not taxed.
+
+        With start, only the months after the first start are simulated (the
+        suffix of a scenario tree branch), from initial_balances (scenarios,
+        savings) instead of the initial amounts. credit_starts maps indices into
+        credits to the month (at most start) they are taken out in, 0 by default,
+        and credit_interests to the monthly interests (scenarios,) they show in
+        their first year (see credit_schedules).
+        drawdown covers shortfalls of the bank account from other savings.
+        """
+        n_scenarios, values = self._parameter_values(parameters)
+        n_months = self.n_months
+        if until is not None:
+            n_months = max(min(n_months, months_between(self.start_date, until)), 1)
+        assert 0 <= start < n_months, f"Cannot start after {n_months} months."
+        paths = {
+            k: v[:, start:] for k, v in self._rate_paths(rate_paths, n_months).items()
+        }
+        schedules = {self.resolve(k): v for k, v in (rate_schedules or {}).items()}
+        credit_starts = credit_starts or {}
+        for key in schedules:
+            assert key.startswith("credits[") and key.endswith(
+                ".annual_interest_rate"
+            ), f"Only credit rates can follow a rate schedule, not {key}."
+            assert not credit_starts.get(
+                int(key[len("credits[") : key.index("]")])
+            ), f"Credits taken out later cannot follow a rate schedule ({key})."
+        n_paths = [x.shape[0] for x in paths.values()] + [
+            np.atleast_2d(x.rates).shape[0] for x in schedules.values()
+        ]
+        if n_paths:
+            n_scenarios = np.broadcast_shapes((n_scenarios,), *[(n,) for n in n_paths])[
+                0
+            ]
+            values = {
+                k: np.broadcast_to(v, (n_scenarios, 1)) for k, v in values.items()
+            }
+            values.update(paths)
+        t = np.arange(start + 1, n_months + 1)
+        n_steps = len(t)
+        empty = np.zeros((n_scenarios, 0, n_steps))
+
+        incomes = [
+            np.where(
+                t > values[f"incomes[{i}].last_income_date"],
+                0.0,
+                self._changing_amounts(f"incomes[{i}]", values, change_months, t),
+            )
+            for i, change_months in enumerate(self.incomes)
+        ]
+        fixed = {
+            group: [
+                (
+                    np.broadcast_to(amounts[start:n_months], (n_scenarios, n_steps)),
+                    counts,
+                )
+                for _, amounts, counts in flows
+            ]
+            for group, flows in self.fixed.items()
+        }
+        incomes = incomes + [x for x, _ in fixed["incomes"]]
+        incomes = np.stack(incomes, axis=1) if incomes else empty
+
+        expenses = [
+            np.zeros((n_scenarios, n_steps))
+            if change_months is None
+            else self._changing_amounts(f"expenses[{i}]", values, change_months, t)
+            for i, change_months in enumerate(self.expenses)
+        ]
+        # credit schedules run from the month they are taken out in
+        horizons = [
+            n_months - credit_starts.get(i, 0)
+            for i in range(len(self.names["credits"]))
+        ]
+        assert all(h >= n_steps for h in horizons), "Credits must start by start."
+        credits = [
+            variable_credit_schedules(
+                principal=values[f"credits[{i}].credit_amount"][:, 0]
+                - values[f"credits[{i}].initial_payoff"][:, 0],
+                duration=values[f"credits[{i}].loan_duration"][:, 0],
+                schedule=schedules[f"credits[{i}].annual_interest_rate"],
+                n_months=horizon,
+            )
+            if f"credits[{i}].annual_interest_rate" in schedules
+            else credit_schedules(
+                principal=values[f"credits[{i}].credit_amount"][:, 0]
+                - values[f"credits[{i}].initial_payoff"][:, 0],
+                rate=values[f"credits[{i}].annual_interest_rate"][:, 0],
+                duration=values[f"credits[{i}].loan_duration"][:, 0],
+                n_months=horizon,
+                interests=(credit_interests or {}).get(i, 0.0),
+            )
+            for i, horizon in enumerate(horizons)
+        ]
+        credits = [tuple(x[..., -n_steps:] for x in schedule) for schedule in credits]
+        payments = [x[0] for x in credits]
+        expenses = (
+            expenses + [x[1] for x in credits] + [x for x, _ in fixed["expenses"]]
+        )
+        expenses = np.stack(expenses, axis=1) if expenses else empty
+
+        n_savings = len(self.savings) - len(credits)
+        deposits = [
+            values.get(f"savings[{i}].monthly_amount", np.zeros((n_scenarios, 1)))
+            + np.zeros(n_steps)
+            for i in range(n_savings)
+        ] + [x[2] for x in credits]
+        deposits = np.stack(deposits, axis=1)
+        if initial_balances is None:
+            initial_balances = np.concatenate(
+                [values[f"savings[{i}].initial_amount"] for i in range(n_savings)]
+                + [np.zeros((n_scenarios, len(credits)))],
+                axis=1,
+            )
+        else:
+            initial_balances = np.broadcast_to(
+                initial_balances, (n_scenarios, len(self.savings))
+            ).astype(float)
+        rates = np.stack(
+            [
+                values[f"savings[{i}].interest_rate"]
+                * ((self.calendar_months[start:n_months] == 1) if annually else 1)
+                + np.zeros((n_scenarios, n_steps))
+                for i, annually in enumerate(self.savings)
+            ],
+            axis=1,
+        )
+
+        # the bank account receives whatever is left after all other flows
+        money = incomes[:, : len(self.incomes)].sum(axis=1)
+        money = money - expenses[:, : len(self.expenses)].sum(axis=1)
+        for sign, group in [(1, "incomes"), (-1, "expenses")]:
+            for amounts, counts in fixed[group]:
+                if counts:
+                    money += sign * amounts
+        money = money - deposits[:, 1:n_savings].sum(axis=1)
+        money = money - sum(payments, np.zeros((n_scenarios, n_steps)))
+        taxes = None
+        if tax is not None:
+            taxes = tax.withheld(
+                incomes,
+                deposits,
+                np.array([d.year for d in self.dates[start:n_months]]),
+                tax.taxpayer_indices(
+                    self.names["incomes"][: len(self.incomes)],
+                    self.names["savings"][:n_savings],
+                ),
+            )
+            money -= taxes
+        return settle(
+            money=money,
+            incomes=incomes,
+            expenses=expenses,
+            deposits=deposits,
+            initial_balances=initial_balances,
+            rates=rates,
+            credits=np.stack([x[4] for x in credits], axis=1) if credits else empty,
+            credits_before_interests=(
+                np.stack([x[3] for x in credits], axis=1) if credits else empty
+            ),
+            dates=self.dates[start:n_months],
+            names=self.names,
+            kernel=kernel,
+            taxes=taxes,
+            drawdown=drawdown,
+        )
@@ -0,0 +1,394 @@
+"""Precompute neighbouring scenarios in the background and serve them by lookup.
+
+A WhatIfGrid simulates the budget as it is (the base) and then, in a background
+thread, one batch of scenarios per axis: an input the user is likely to tweak
+next (a monthly amount, an interest rate, the retirement date) moved through a
+range of values around its current one, everything else fixed. When the next
+budget differs from a base along a single axis by the offset of a grid point,
+its result is that point of the batch, the very simulation a direct run would
+do. Anything else is simulated synchronously (a few milliseconds) and becomes
+the new base; values between grid points are not interpolated, so amounts step
+in round numbers that typed inputs tend to land on.
+
+Grids are kept by the base they were computed at, so serving a result from one
+doesn't invalidate the others, and returning to an earlier base finds its grids.
+
+Run with `python -m cashflow.engines.whatif` to compare lookups with simulations.
+"""
+import math
+import threading
+import time
+import typing as T
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+
+from cashflow.engines.budget import Budget
+from cashflow.engines.vectorized import VectorizedBudget, VectorizedResult
+from cashflow.utils.logging_utils import init_logger
+from cashflow.utils.metrics import REGISTRY
+
+logger = init_logger()
+
+# distance between grid points: a tenth of the order of magnitude of amounts
+# (1000 for 30000), an absolute step for rates and whole years (in months) for
+# the last income date
+STEPS = {
+    "monthly_amount": ("round", 0.1),
+    "interest_rate": ("absolute", 0.0025),
+    "annual_interest_rate": ("absolute", 0.0025),
+    "last_income_date": ("absolute", 12),
+}
+
+Values = T.Tuple[T.Tuple[str, float], ...]
+
+
+@dataclass
+class Axis:
+    """Offsets added to the current value of one or more parameters.
+
+    Parameters on the same axis move together, e.g. the last income date of every
+    income when the retirement age changes.
+    """
+
+    keys: T.Tuple[str, ...]
+    offsets: np.ndarray
+
+
+@dataclass
+class Grid:
+    """Simulated points of an axis around origin, with the base they were run at."""
+
+    axis: Axis
+    base: T.Dict[str, float]
+    result: VectorizedResult
+
+    def matches(self, values: T.Dict[str, float]) -> float | None:
+        """Offset of values along the axis, None if they differ off the axis."""
+        if any(values[k] != v for k, v in self.base.items() if k not in self.axis.keys):
+            return None
+        offsets = {values[k] - self.base[k] for k in self.axis.keys}
+        if len(offsets) > 1:
+            return None
+        return offsets.pop()
+
+    def covers(self, offset: float) -> bool:
+        """Whether offset lies in the middle half of the grid."""
+        low, high = self.axis.offsets[0], self.axis.offsets[-1]
+        return low + (high - low) / 4 <= offset <= high - (high - low) / 4
+
+
+def structure(engine: VectorizedBudget) -> T.Tuple:
+    """Everything about a budget that isn't a numeric parameter.
+
+    Adding or removing components, renaming them, moving a raise or changing how
+    often interests are paid changes the structure and invalidates every grid.
+    """
+    return (
+        engine.start_date,
+        engine.n_months,
+        tuple(engine.labels.items()),
+        tuple(tuple(x) for x in engine.incomes),
+        tuple(None if x is None else tuple(x) for x in engine.expenses),
+        tuple(engine.savings),
+    )
+
+
+def default_axes(engine: VectorizedBudget, n_points: int = 21) -> T.List[Axis]:
+    """One axis per parameter in STEPS, plus the retirement date of all incomes."""
+    steps = np.arange(n_points) - n_points // 2
+    axes = []
+    for key, value in engine.defaults.items():
+        attribute = key.split(".")[-1]
+        if attribute not in STEPS:
+            continue
+        kind, step = STEPS[attribute]
+        if kind == "round":
+            step = step * 10 ** math.floor(math.log10(abs(value))) if value else 1000.0
+        axes.append(Axis(keys=(key,), offsets=step * steps))
+        pass
+    retirement = tuple(k for k in engine.defaults if k.endswith(".last_income_date"))
+    if len(retirement) > 1:
+        step = STEPS["last_income_date"][1]
+        axes.append(Axis(keys=retirement, offsets=step * steps))
+    return axes
+
+
+def grid_point(
+    result: VectorizedResult, offsets: np.ndarray, offset: float
+) -> VectorizedResult | None:
+    """The scenario simulated at offset, None if offset is not a grid point."""
+    tolerance = 1e-9 * max(abs(offsets[-1] - offsets[0]), 1.0)
+    (hits,) = np.nonzero(np.abs(offsets - offset) <= tolerance)
+    if len(hits) == 0:
+        return None
+    i = hits[0]
+
+    def pick(x: np.ndarray | None) -> np.ndarray | None:
+        return x[i : i + 1].copy() if x is not None else None
+
+    return VectorizedResult(
+        dates=result.dates,
+        names=result.names,
+        incomes=pick(result.incomes),
+        expenses=pick(result.expenses),
+        deposits=pick(result.deposits),
+        interests=pick(result.interests),
+        balances=pick(result.balances),
+        initial_balances=pick(result.initial_balances),
+        credits=pick(result.credits),
+        run_out=pick(result.run_out),
+        margin=pick(result.margin),
+        taxes=pick(result.taxes),
+        withdrawals=pick(result.withdrawals),
+    )
+
+
+class WhatIfGrid:
+    """Session scoped store of precomputed neighbouring scenarios.
+
+    result() returns the simulation of a budget, served from a grid when possible.
+    Axes are precomputed most recently moved first (the user tends to keep
+    dragging the same slider), then in the order of default_axes, up to max_axes
+    per base. Only a simulated result moves the base; an axis whose grid still
+    covers the new base (in its middle half) isn't recomputed. Up to max_grids
+    grids are kept, least recently used first out. A change of structure, e.g.
+    adding a credit, drops all grids and pending work.
+    """
+
+    def __init__(
+        self,
+        n_points: int = 21,
+        max_axes: int = 8,
+        max_grids: int = 32,
+        n_months: int = 60 * 12,
+        max_workers: int = 1,
+    ):
+        self.n_points = n_points
+        self.max_axes = max_axes
+        self.max_grids = max_grids
+        self.n_months = n_months
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="whatif"
+        )
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.signature = None
+        self.engine: VectorizedBudget | None = None
+        self.base: T.Dict[str, float] = {}
+        self.base_result: VectorizedResult | None = None
+        self.axes: T.List[Axis] = []
+        self.grids: T.OrderedDict[
+            T.Tuple[Values, T.Tuple[str, ...]], Grid
+        ] = OrderedDict()
+        self.futures: T.Dict[T.Tuple[Values, T.Tuple[str, ...]], Future] = {}
+        self.recent: T.List[T.Tuple[str, ...]] = []
+        self.stats = Counter()
+        pass
+
+    def result(self, budget: Budget) -> VectorizedResult:
+        """Simulation of a (not yet run) budget, from a grid if possible."""
+        engine = VectorizedBudget(budget, self.n_months)
+        signature = structure(engine)
+        values = dict(engine.defaults)
+        with self.lock:
+            if signature != self.signature:
+                self._cancel()
+                self.signature = signature
+                self.engine = engine
+                self.axes = default_axes(engine, self.n_points)
+                self.base = {}
+                self.grids = OrderedDict()
+                self.recent = []
+                self._count("structural")
+            elif values == self.base:
+                self._count("hits")
+                return self.base_result
+            else:
+                result = self._lookup(values)
+                if result is not None:
+                    self._count("hits")
+                    return result
+                pass
+        result = self.engine.run(values)
+        self._count("misses")
+        self._move(values, result)
+        return result
+
+    def _count(self, outcome: str):
+        self.stats[outcome] += 1
+        REGISTRY.inc(
+            "cashflow_whatif_results_total",
+            "What-if results, served from a grid (hits) or simulated.",
+            outcome=outcome,
+        )
+        pass
+
+    def _lookup(self, values: T.Dict[str, float]) -> VectorizedResult | None:
+        for key, grid in self.grids.items():
+            offset = grid.matches(values)
+            if offset is None:
+                continue
+            result = grid_point(grid.result, grid.axis.offsets, offset)
+            if result is not None:
+                self.grids.move_to_end(key)
+                return result
+            pass
+        return None
+
+    def _move(self, values: T.Dict[str, float], result: VectorizedResult):
+        """Make values the base and reprioritise the precomputation around it."""
+        with self.lock:
+            changed = {k for k, v in values.items() if self.base.get(k) != v}
+            self.base = values
+            self.base_result = result
+            moved = [a.keys for a in self.axes if changed & set(a.keys)]
+            moved.sort(key=lambda keys: set(keys) != changed)
+            self.recent = moved + [x for x in self.recent if x not in moved]
+            # grids being computed are kept, the ones not started yet may wait
+            for key in [k for k, x in self.futures.items() if x.cancel()]:
+                self.futures.pop(key)
+            self._schedule()
+        pass
+
+    def _cancel(self):
+        """Drop pending grids; running ones finish but are discarded."""
+        self.generation += 1
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+        pass
+
+    def _covered(self, axis: Axis) -> bool:
+        """Whether a grid of axis (of any base) covers the base."""
+        for grid in self.grids.values():
+            if grid.axis.keys == axis.keys:
+                offset = grid.matches(self.base)
+                if (offset is not None) and grid.covers(offset):
+                    return True
+            pass
+        return False
+
+    def _schedule(self):
+        rank = {keys: i for i, keys in enumerate(self.recent)}
+        axes = sorted(
+            self.axes, key=lambda a: rank.get(a.keys, len(rank) + self.axes.index(a))
+        )
+        base = tuple(sorted(self.base.items()))
+        for axis in axes[: self.max_axes]:
+            key = (base, axis.keys)
+            if (key in self.futures) or self._covered(axis):
+                continue
+            self.futures[key] = self.executor.submit(
+                self._compute, self.generation, self.engine, axis, dict(self.base)
+            )
+            pass
+        pass
+
+    def _compute(
+        self,
+        generation: int,
+        engine: VectorizedBudget,
+        axis: Axis,
+        base: T.Dict[str, float],
+    ):
+        if generation != self.generation:
+            return
+        start = time.perf_counter()
+        result = engine.run(base | {k: base[k] + axis.offsets for k in axis.keys})
+        key = (tuple(sorted(base.items())), axis.keys)
+        with self.lock:
+            if generation != self.generation:
+                self.stats["discarded"] += 1
+                return
+            self.grids[key] = Grid(axis=axis, base=base, result=result)
+            while len(self.grids) > self.max_grids:
+                self.grids.popitem(last=False)
+            self.futures.pop(key, None)
+            self.stats["grids"] += 1
+        logger.info(
+            f"WHATIF: {len(axis.offsets)} points of {'+'.join(axis.keys)} took "
+            f"{time.perf_counter() - start:.3f}s."
+        )
+        pass
+
+    def wait(self, timeout: float | None = None):
+        """Block until the pending grids are computed."""
+        with self.lock:
+            futures = list(self.futures.values())
+        for future in futures:
+            if not future.cancelled():
+                future.exception(timeout=timeout)
+            pass
+        pass
+
+    def close(self):
+        with self.lock:
+            self._cancel()
+        self.executor.shutdown(wait=False)
+        pass
+
+
+if __name__ == "__main__":
+    import datetime as dt
+
+    from cashflow.engines.components import Income, Expense, Saving, Credit
+    from cashflow.engines.parity import _error, _release
+
+    def example(living: float, rate: float, retirement: int) -> Budget:
+        return Budget(
+            incomes=[
+                Income(
+                    name="Salary",
+                    monthly_amount=35000.0,
+                    last_income_date=dt.date(retirement, 1, 1),
+                )
+            ],
+            expenses=[Expense(name="Living", monthly_amount=living)],
+            savings=[
+                Saving(name="Bank", initial_amount=50000.0, interest_rate=0.0),
+                Saving(
+                    name="Stocks",
+                    initial_amount=0.0,
+                    monthly_amount=4000.0,
+                    interest_rate=rate,
+                    interest_frequency="annually",
+                ),
+            ],
+            credits=[
+                Credit(name="House", credit_amount=2e6, annual_interest_rate=0.04)
+            ],
+        )
+
+    grid = WhatIfGrid()
+    year = dt.date.today().year
+    budget = example(15000.0, 0.06, year + 30)
+    grid.result(budget)
+    _release(budget)
+    grid.wait()
+
+    for living, rate, retirement in [
+        (16000.0, 0.06, year + 30),
+        (17000.0, 0.06, year + 30),
+        (17500.0, 0.06, year + 30),
+        (17500.0, 0.0625, year + 30),
+        (17500.0, 0.0625, year + 32),
+    ]:
+        budget = example(living, rate, retirement)
+        start = time.perf_counter()
+        served = grid.result(budget)
+        lookup = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = VectorizedBudget(budget).run()
+        simulation = time.perf_counter() - start
+        _release(budget)
+        logger.info(
+            f"WHATIF: living={living}, rate={rate}, retirement={retirement} served in "
+            f"{1000 * lookup:.1f}ms (simulation {1000 * simulation:.1f}ms), error "
+            f"{_error(expected.balances, served.balances):.1e}."
+        )
+        grid.wait()
+    logger.info(f"WHATIF: {dict(grid.stats)}")
+    grid.close()
@@ -0,0 +1,89 @@
+"""Load test a running simulation service and report latency percentiles and RPS.
+
+Run with: python -m cashflow.service.loadtest --url http://127.0.0.1:8000
+"""
+import argparse
+import json
+import random
+import time
+import typing as T
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def random_request(rng: random.Random) -> dict:
+    """Request body for a small budget with rounded (so partly repeated) amounts."""
+    return {
+        "budget": {
+            "incomes": [
+                {
+                    "name": "Salary",
+                    "monthly_amount": rng.randrange(20, 40) * 1000,
+                    "change_by_amounts": [1000],
+                    "change_at_dates": ["2030-01-01"],
+                    "last_income_date": "2060-01-01",
+                }
+            ],
+            "expenses": [
+                {"name": "Living", "monthly_amount": rng.randrange(10, 25) * 1000}
+            ],
+            "savings": [
+                {"name": "Bank", "initial_amount": 50000, "interest_rate": 0.0},
+                {
+                    "name": "Pension",
+                    "initial_amount": 0,
+                    "monthly_amount": 3000,
+                    "interest_rate": 0.05,
+                    "interest_frequency": "annually",
+                },
+            ],
+        },
+        "until": "2070-01-01",
+    }
+
+
+def post(url: str, body: bytes) -> T.Tuple[float, int]:
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": "application/json"}
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return time.perf_counter() - start, status
+
+
+def load_test(url: str, n_requests: int, concurrency: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    bodies = [json.dumps(random_request(rng)).encode() for _ in range(n_requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda b: post(f"{url}/simulate", b), bodies))
+    elapsed = time.perf_counter() - start
+    latencies = np.array([x for x, status in results if status == 200]) * 1000
+    return {
+        "requests": n_requests,
+        "ok": len(latencies),
+        "rps": n_requests / elapsed,
+        "p50_ms": np.percentile(latencies, 50) if len(latencies) else None,
+        "p99_ms": np.percentile(latencies, 99) if len(latencies) else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    report = load_test(args.url, args.requests, args.concurrency, args.seed)
+    with urllib.request.urlopen(f"{args.url}/stats") as response:
+        report["server"] = json.loads(response.read())
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,228 @@
+"""Local JSON HTTP service that simulates budgets on a bounded process pool.
+
+POST /simulate with a body like
+    {"budget": {"incomes": [...], "savings": [...]}, "parameters": {...},
+     "until": "2080-01-01", "monthly": false}
+returns run-out dates and final balances (and monthly series if asked for).
+GET /health and GET /stats report liveness and cache/coalescing counters.
+
+Run with: python -m cashflow.service.server --port 8000
+"""
+import argparse
+import collections
+import datetime as dt
+import hashlib
+import json
+import threading
+import typing as T
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cashflow.engines.serialization import compile_dict, result_to_dict
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+KINDS = ["incomes", "expenses", "savings", "credits"]
+
+
+def simulate_request(request: T.Dict[str, T.Any]) -> bytes:
+    """Simulate one request body and return the JSON encoded response (in a worker)."""
+    engine = compile_dict(request["budget"])
+    until = request.get("until")
+    result = engine.run(
+        parameters=request.get("parameters"),
+        until=dt.date.fromisoformat(until) if until is not None else None,
+    )
+    return json.dumps(
+        result_to_dict(result, monthly=request.get("monthly", False))
+    ).encode()
+
+
+def validate_request(request: T.Any):
+    """Assert the shape of a request body before it is sent to a worker."""
+    assert isinstance(request, dict), "The request must be a JSON object."
+    budget = request.get("budget")
+    assert isinstance(budget, dict), "The request must hold a budget object."
+    unknown = set(budget) - set(KINDS)
+    assert not unknown, f"Unknown components: {sorted(unknown)}."
+    for kind, components in budget.items():
+        assert isinstance(components, list) and all(
+            isinstance(x, dict) for x in components
+        ), f"The {kind} must be a list of objects."
+    # the bank account is the first saving and the calendar starts at the incomes
+    for kind in ["incomes", "savings"]:
+        assert budget.get(kind), f"The budget must hold at least one of {kind}."
+    assert isinstance(
+        request.get("parameters", {}), (dict, type(None))
+    ), "The parameters must be an object."
+    assert isinstance(
+        request.get("until", ""), (str, type(None))
+    ), "until must be an ISO date."
+    pass
+
+
+class Overloaded(Exception):
+    pass
+
+
+class SimulationService:
+    """Process pool with request coalescing and an LRU cache of responses.
+
+    Identical requests (same canonical JSON) that arrive while one is being
+    computed wait for that computation instead of submitting their own, and
+    finished responses are served from the cache. At most max_pending distinct
+    computations are queued; beyond that requests are rejected. If a worker dies,
+    the pool is recreated at the next submission.
+    """
+
+    def __init__(
+        self, max_workers: int = 2, max_pending: int = 64, cache_size: int = 1024
+    ):
+        self.max_workers = max_workers
+        self.pool = ProcessPoolExecutor(max_workers=max_workers)
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.cache: T.OrderedDict[str, bytes] = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.in_flight: T.Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.stats = collections.Counter()
+        pass
+
+    def simulate(self, request: T.Dict[str, T.Any]) -> bytes:
+        key = hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+        submitted = False
+        with self.lock:
+            self.stats["requests"] += 1
+            if key in self.cache:
+                self.stats["cache_hits"] += 1
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+            else:
+                if not self.pending.acquire(blocking=False):
+                    self.stats["rejected"] += 1
+                    raise Overloaded()
+                try:
+                    future = self._submit(request)
+                except BaseException:
+                    self.pending.release()
+                    raise
+                self.stats["computed"] += 1
+                self.in_flight[key] = future
+                submitted = True
+        if submitted:
+            # runs _done right away if the worker already finished, so not under
+            # the lock _done takes
+            future.add_done_callback(lambda f: self._done(key, f))
+        return future.result()
+
+    def _submit(self, request: T.Dict[str, T.Any]) -> Future:
+        """Submit to the pool, recreating it once if a worker died (under the lock)."""
+        try:
+            return self.pool.submit(simulate_request, request)
+        except BrokenProcessPool:
+            logger.warning("SERVICE: a worker died, recreating the process pool.")
+            self.stats["restarts"] += 1
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self.pool.submit(simulate_request, request)
+
+    def _done(self, key: str, future: Future):
+        with self.lock:
+            self.in_flight.pop(key, None)
+            self.pending.release()
+            if future.exception() is None:
+                self.cache[key] = future.result()
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        pass
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def make_handler(service: SimulationService) -> T.Type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: bytes):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status: int, message: str):
+            self._send(status, json.dumps({"error": message}).encode())
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, b'{"status": "ok"}')
+            elif self.path == "/stats":
+                with service.lock:
+                    stats = dict(service.stats, cached=len(service.cache))
+                self._send(200, json.dumps(stats).encode())
+            else:
+                self._error(404, f"Unknown path: {self.path}")
+
+        def do_POST(self):
+            if self.path != "/simulate":
+                self._error(404, f"Unknown path: {self.path}")
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+                validate_request(request)
+            except (ValueError, AssertionError) as e:
+                self._error(400, str(e))
+                return
+            try:
+                self._send(200, service.simulate(request))
+            except Overloaded:
+                self._error(503, "Too many pending simulations, try again later.")
+            except BrokenProcessPool:
+                self._error(503, "The simulation worker died, try again later.")
+            except (AssertionError, TypeError, ValueError, KeyError) as e:
+                self._error(400, f"Invalid budget: {e!r}")
+            except Exception as e:
+                logger.exception(f"SERVICE: simulation failed: {e!r}")
+                self._error(500, f"Simulation failed: {e!r}")
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000, **kwargs):
+    service = SimulationService(**kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    logger.info(f"SERVICE: listening on http://{host}:{server.server_port}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--cache-size", type=int, default=1024)
+    args = parser.parse_args()
+    serve(
+        host=args.host,
+        port=args.port,
+        max_workers=args.workers,
+        max_pending=args.max_pending,
+        cache_size=args.cache_size,
+    )
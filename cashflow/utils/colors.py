@@ -1,3 +1,4 @@
+import typing as T
 import pandas as pd
 import numpy as np
 from cashflow.utils.logging_utils import init_logger
@@ -29,15 +30,12 @@ class Colors:
         pass
 
     def get_color(self, type: str, name: str):
-        if len(self.df_color.query(f"(type == '{type}') and (name == '{name}')")) > 0:
-            assigned_color = self.df_color.query(
-                f"(type == '{type}') and (name == '{name}')"
-            ).index[0]
-            return assigned_color
+        of_type = self.df_color["type"] == type
+        assigned = self.df_color.index[of_type & (self.df_color["name"] == name)]
+        if len(assigned) > 0:
+            return assigned[0]
         else:
-            available_colors = self.df_color.query(
-                f'(type == "{type}") and (not used)'
-            ).index
+            available_colors = self.df_color.index[of_type & ~self.df_color["used"]]
             if len(available_colors) == 0:
                 logger.error(f"No more colors of type {type}!")
             chosen_color = available_colors[0]
@@ -45,5 +43,17 @@ class Colors:
             self.df_color.loc[chosen_color, "name"] = name
             return chosen_color
 
+    def assigned(self) -> T.Set[T.Tuple[str, str]]:
+        """(type, name) of every color in use."""
+        used = self.df_color[self.df_color["used"]]
+        return set(zip(used["type"], used["name"]))
+
+    def release(self, type: str, name: str):
+        """Make the color assigned to name available again."""
+        assigned = (self.df_color["type"] == type) & (self.df_color["name"] == name)
+        self.df_color.loc[assigned, "used"] = False
+        self.df_color.loc[assigned, "name"] = None
+        pass
+
 
 colors = Colors()
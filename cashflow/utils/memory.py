@@ -0,0 +1,252 @@
+"""Opt-in memory report of budgets, their components' tables and summaries.
+
+Tables are measured with DataFrame.memory_usage(deep=True), allocations during
+Budget.run and Budget.get_summary with tracemalloc. Nothing is measured unless
+one of these functions is called.
+
+Run with `python -m cashflow.utils.memory` to track bytes per simulated month.
+"""
+import time
+import tracemalloc
+import typing as T
+from dataclasses import dataclass
+
+import pandas as pd
+
+from cashflow.utils.logging_utils import init_logger
+
+logger = init_logger()
+
+
+def frame_bytes(df: pd.DataFrame | None) -> int:
+    """Deep size of a DataFrame including its index (0 for None)."""
+    return 0 if df is None else int(df.memory_usage(index=True, deep=True).sum())
+
+
+def component_tables(component) -> T.Dict[str, pd.DataFrame | None]:
+    """History tables of a component and its (cached, possibly unbuilt) summary."""
+    tables = {
+        k: v
+        for k, v in vars(component).items()
+        if isinstance(v, pd.DataFrame) and not k.startswith("_")
+    }
+    tables["summary"] = getattr(component, "_summary", None)
+    return tables
+
+
+def component_memory(component, prefix: str = "") -> T.List[T.Dict[str, T.Any]]:
+    """One row per table of a component and of the components it owns (e.g. the
+    interests and ownership of a Credit)."""
+    name = prefix + component.name
+    rows = [
+        {
+            "component": name,
+            "type": type(component).__name__,
+            "table": table,
+            "summary": table == "summary",
+            "rows": 0 if df is None else len(df),
+            "bytes": frame_bytes(df),
+        }
+        for table, df in component_tables(component).items()
+    ]
+    for attribute, owned in vars(component).items():
+        if (owned is not component) and hasattr(owned, "_summary"):
+            rows += component_memory(owned, prefix=f"{name}/")
+        pass
+    return rows
+
+
+def memory_report(budget) -> pd.DataFrame:
+    """Bytes held by every table of every component of a budget.
+
+    Components owned by another one (e.g. a Credit's interests) are reported
+    once, under their owner.
+    """
+    owned = {
+        id(x)
+        for components in budget.components.values()
+        for c in components
+        for x in vars(c).values()
+        if hasattr(x, "_summary") and (x is not c)
+    }
+    rows = []
+    for kind, components in budget.components.items():
+        for c in components:
+            if id(c) not in owned:
+                rows += [row | {"kind": kind} for row in component_memory(c)]
+            pass
+        pass
+    return pd.DataFrame(
+        rows, columns=["kind", "component", "type", "table", "summary", "rows", "bytes"]
+    )
+
+
+class PeakAllocation:
+    """Context manager measuring the net and peak bytes allocated in its block.
+
+    Starts tracemalloc if it isn't tracing yet (and stops it again). With top > 0
+    the largest allocation sites of the block are kept in top_lines.
+    """
+
+    def __init__(self, top: int = 0):
+        self.top = top
+        self.net = 0
+        self.peak = 0
+        self.seconds = 0.0
+        self.top_lines: T.List[str] = []
+        pass
+
+    def __enter__(self) -> "PeakAllocation":
+        self.started = not tracemalloc.is_tracing()
+        if self.started:
+            tracemalloc.start()
+        self.snapshot = tracemalloc.take_snapshot() if self.top else None
+        tracemalloc.reset_peak()
+        self.before = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.seconds = time.perf_counter() - self.start
+        current, peak = tracemalloc.get_traced_memory()
+        self.net = current - self.before
+        self.peak = peak - self.before
+        if self.top:
+            stats = tracemalloc.take_snapshot().compare_to(self.snapshot, "lineno")
+            self.top_lines = [str(x) for x in stats[: self.top]]
+        if self.started:
+            tracemalloc.stop()
+        pass
+
+
+@dataclass
+class MemoryProfile:
+    """Allocations of Budget.run and Budget.get_summary and the resulting tables."""
+
+    run: PeakAllocation
+    summary: PeakAllocation
+    report: pd.DataFrame
+    n_months: int
+    engine: str = ""
+
+    @property
+    def total_bytes(self) -> int:
+        return int(self.report["bytes"].sum())
+
+    @property
+    def bytes_per_month(self) -> float:
+        return self.total_bytes / max(self.n_months, 1)
+
+    def by_component(self) -> pd.DataFrame:
+        """Bytes of history tables and of summaries per component."""
+        return (
+            self.report.pivot_table(
+                index=["kind", "component"],
+                columns="summary",
+                values="bytes",
+                aggfunc="sum",
+                fill_value=0,
+            )
+            .rename(columns={False: "history", True: "summary"})
+            .rename_axis(columns=None)
+        )
+
+    def by_table(self) -> pd.DataFrame:
+        return self.report.groupby("table")[["rows", "bytes"]].sum()
+
+    def to_dict(self) -> T.Dict[str, T.Any]:
+        return {
+            "engine": self.engine,
+            "months": self.n_months,
+            "bytes": self.total_bytes,
+            "bytes_per_month": self.bytes_per_month,
+            "summary_bytes": int(
+                self.report.loc[self.report["summary"], "bytes"].sum()
+            ),
+            "run_peak": self.run.peak,
+            "run_seconds": self.run.seconds,
+            "summary_peak": self.summary.peak,
+        }
+
+
+def simulated_months(budget) -> int:
+    """Months in the bank account's history (fewer after running out)."""
+    return len(budget.savings[0].cumulative_amount) - 1
+
+
+def profile_budget(budget, top: int = 0) -> MemoryProfile:
+    """Run a budget and build its summaries while tracing allocations."""
+    with PeakAllocation(top) as run:
+        budget.run()
+    with PeakAllocation(top) as summary:
+        budget.get_summary()
+    profile = MemoryProfile(
+        run=run,
+        summary=summary,
+        report=memory_report(budget),
+        n_months=simulated_months(budget),
+        engine=budget.engine,
+    )
+    logger.info(
+        f"MEMORY: {budget.engine} budget holds {profile.total_bytes / 1e6:.2f}MB "
+        f"({profile.bytes_per_month / 1e3:.1f}kB per month); run peaked at "
+        f"{run.peak / 1e6:.2f}MB, summaries at {summary.peak / 1e6:.2f}MB."
+    )
+    return profile
+
+
+if __name__ == "__main__":
+    from cashflow.engines.budget import Budget, ENGINES
+    from cashflow.engines.components import Income, Expense, Saving, Credit
+    from cashflow.engines.protocol import simulate_budget
+    from cashflow.engines.parity import _release
+
+    def example(engine: str) -> Budget:
+        return Budget(
+            incomes=[Income(name="Salary", monthly_amount=35000.0)],
+            expenses=[Expense(name="Living", monthly_amount=15000.0)],
+            savings=[
+                Saving(name="Bank", initial_amount=50000.0, interest_rate=0.0),
+                Saving(
+                    name="Stocks",
+                    initial_amount=0.0,
+                    monthly_amount=4000.0,
+                    interest_rate=0.06,
+                    interest_frequency="annually",
+                ),
+            ],
+            credits=[
+                Credit(name="House", credit_amount=2e6, annual_interest_rate=0.04)
+            ],
+            engine=engine,
+        )
+
+    rows = []
+    for engine in ENGINES:
+        budget = example(engine)
+        profile = profile_budget(budget)
+        rows.append(profile.to_dict())
+        if engine == "legacy":
+            print(profile.by_component())
+            print(profile.by_table())
+        _release(budget)
+
+    # bytes per simulated month of the compiled schedules over growing horizons
+    for n_months in [60, 120, 240, 480, 720]:
+        budget = example("kernel")
+        with PeakAllocation() as run:
+            simulate_budget(budget, n_months, kernel=True)
+        with PeakAllocation() as summary:
+            budget.get_summary()
+        profile = MemoryProfile(
+            run=run,
+            summary=summary,
+            report=memory_report(budget),
+            n_months=simulated_months(budget),
+            engine=f"schedules ({n_months} months)",
+        )
+        rows.append(profile.to_dict())
+        _release(budget)
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(pd.DataFrame(rows).set_index("engine"))
@@ -7,11 +7,22 @@ from matplotlib import pyplot as plt
 from cashflow.engines.budget import Budget
 from cashflow.engines.components import Income, Saving, Expense
 from cashflow.utils.logging_utils import init_logger
+from cashflow.utils.metrics import timed
 import matplotlib.pyplot as plt
 
 logger = init_logger()
 
 
+def _rendered(figure: str):
+    """Observe the duration of a plotting entry point (see cashflow.utils.metrics)."""
+    return timed(
+        "cashflow_figure_render_seconds",
+        "Duration of building a figure or chart spec.",
+        figure=figure,
+    )
+
+
+@_rendered("plot_budget_across_time")
 def plot_budget_across_time(
     budget: Budget,
     from_date: dt.date | None = None,
@@ -165,6 +176,7 @@ def plot_bars(stacked: bool = True, **kwargs):
 
 
 # TODO: adjust plotting to allow for negative values of account_savings counting towards incomes.
+@_rendered("plot_aggregated_budget")
 def plot_aggregated_budget(
     budget: Budget,
     from_date: dt.date,
@@ -274,6 +286,7 @@ def plot_curves(stacked: bool = True, **kwargs):
     )
 
 
+@_rendered("plot_components_across_time")
 def plot_components_across_time(
     components: T.List[Income | Saving | Expense],
     from_date: dt.date | None = None,
@@ -332,3 +345,402 @@ def plot_components_across_time(
     fig.tight_layout()
 
     return fig
+
+
+@_rendered("plot_fan_chart")
+def plot_fan_chart(
+    percentiles: T.Dict[str, pd.DataFrame],
+    colors: T.Dict[str, str] | None = None,
+    from_date: dt.date | None = None,
+    to_date: dt.date | None = None,
+    title: str = "balances across scenarios",
+):
+    """Fan chart of percentiles across time, e.g. from StreamingQuantiles.to_frame.
+
+    Each series (e.g. a saving) is a DataFrame with dates as index and percentiles
+    as columns; bands are drawn between symmetric percentiles (5-95, 25-75, ...)
+    and the median as a line.
+    """
+    fig, ax = plt.subplots(figsize=(10, 3))
+    for i, (name, df) in enumerate(percentiles.items()):
+        df = df[
+            (df.index >= (from_date if from_date is not None else df.index[0]))
+            & (df.index <= (to_date if to_date is not None else df.index[-1]))
+        ]
+        color = (colors or {}).get(name, f"C{i}")
+        columns = sorted(df.columns)
+        bands = [
+            (low, high)
+            for low, high in zip(columns, columns[::-1])
+            if low < high and (100 - high) == low
+        ]
+        for j, (low, high) in enumerate(bands):
+            ax.fill_between(
+                x=df.index,
+                y1=df[low],
+                y2=df[high],
+                color=color,
+                alpha=0.15 + 0.5 * j / max(len(bands), 1),
+                linewidth=0,
+                label=f"{name} ({low:g}-{high:g}%)",
+            )
+        if 50 in df.columns:
+            ax.plot(df[50], color=color, label=f"{name} (median)")
+        pass
+    ax.axhline(y=0, ls="--", c="black", lw=1)
+    ax.set_ylabel("Amount (DKK)")
+    ax.set_title(title)
+    ax.legend()
+    fig.tight_layout()
+
+    return fig
+
+
+@_rendered("plot_tornado")
+def plot_tornado(
+    sensitivities: pd.DataFrame,
+    top: int | None = 15,
+    title: str = "sensitivity of outcome",
+):
+    """Tornado chart of the output of cashflow.engines.sensitivity.sensitivity."""
+    df = sensitivities.sort_values("swing", ascending=False)
+    df = df.head(top) if top is not None else df
+    df = df.iloc[::-1]
+    baseline = df["outcome"].iloc[0] if len(df) > 0 else 0
+
+    fig, ax = plt.subplots(figsize=(10, max(2, 0.4 * len(df) + 1)))
+    positions = range(len(df))
+    ax.barh(
+        y=positions,
+        width=df["outcome_low"] - baseline,
+        left=baseline,
+        color="#EB2F2F",
+        label="parameter decreased",
+    )
+    ax.barh(
+        y=positions,
+        width=df["outcome_high"] - baseline,
+        left=baseline,
+        color="#3C7AFD",
+        label="parameter increased",
+    )
+    ax.axvline(x=baseline, ls="--", c="black", lw=1)
+    ax.set_yticks(list(positions))
+    ax.set_yticklabels(
+        [
+            f"{label} (e={elasticity:.2f})"
+            for label, elasticity in zip(df["label"], df["elasticity"])
+        ]
+    )
+    ax.set_xlabel("Amount (DKK)")
+    ax.set_title(title)
+    ax.legend()
+    fig.tight_layout()
+
+    return fig
+
+
+@_rendered("plot_scenario_tree")
+def plot_scenario_tree(
+    branches: pd.DataFrame,
+    forks: T.Dict[str, dt.date] | None = None,
+    from_date: dt.date | None = None,
+    to_date: dt.date | None = None,
+    title: str = "wealth across branches",
+):
+    """Overlay of branches, e.g. from ScenarioTree.frame, with their fork dates.
+
+    branches has dates as index and one column per branch. Each branch is drawn
+    from its fork date (its shared history is its parent's line), with a marker
+    where it forks.
+    """
+    df = branches[
+        (branches.index >= (from_date if from_date is not None else branches.index[0]))
+        & (branches.index <= (to_date if to_date is not None else branches.index[-1]))
+    ]
+    fig, ax = plt.subplots(figsize=(10, 3))
+    for i, name in enumerate(df.columns):
+        fork = (forks or {}).get(name)
+        series = df[name] if fork is None else df.loc[df.index >= fork, name]
+        ax.plot(series, color=f"C{i}", label=name)
+        if (fork is not None) and len(series.dropna()) > 0:
+            ax.plot(series.index[0], series.iloc[0], "o", color=f"C{i}")
+        pass
+    ax.axhline(y=0, ls="--", c="black", lw=1)
+    ax.set_ylabel("Amount (DKK)")
+    ax.set_title(title)
+    ax.legend()
+    fig.tight_layout()
+
+    return fig
+
+
+#################
+# VEGA-LITE SPECS
+#################
+
+VEGA_LITE_SCHEMA = "https://vega.github.io/schema/vega-lite/v5.json"
+
+
+def _series_frame(
+    components: T.List,
+    date_range: T.List,
+    sign: int = 1,
+    add_interests: bool = False,
+    offset: int = 0,
+) -> T.Tuple[pd.DataFrame, T.List[T.Dict[str, T.Any]]]:
+    """Monthly values of every series as columns s0, s1, ... and their styling."""
+    columns, meta = {}, []
+    for c in components:
+        for value in ["amount", "interest"] if add_interests else ["amount"]:
+            key = f"s{offset + len(meta)}"
+            columns[key] = sign * c.summary[value].reindex(date_range).to_numpy()
+            meta.append(
+                {
+                    "key": key,
+                    "label": c.name if value == "amount" else c.name + " (interests)",
+                    "group": c.type + "s",
+                    "position": c.plot_position,
+                    "order": offset + len(meta),
+                    "color": c.color,
+                    "opacity": 1 if value == "amount" else 0.5,
+                    "dash": [1, 0] if value == "amount" else [4, 2],
+                }
+            )
+            pass
+        pass
+    return pd.DataFrame(columns, index=pd.Index(date_range, name="date")), meta
+
+
+def _time_and_bars_spec(
+    meta: T.List[T.Dict[str, T.Any]],
+    cumulative: bool,
+    stacked: bool,
+    agg: str,
+    title: str,
+    bars_title: str,
+    bars_by_group: bool,
+    zero_line: bool = False,
+) -> T.Dict[str, T.Any]:
+    """Curves across time next to aggregated bars, computed in the browser.
+
+    The data holds one column per series; it is folded into long form, styled by
+    a lookup into meta and (for cumulative curves) summed up client side. Dragging
+    over the curves selects a date range that the bars are aggregated over, shift
+    + wheel zooms and shift + drag pans.
+    """
+    assert agg in ["sum", "mean"], "Unknown aggregation"
+    labels = [x["label"] for x in meta]
+    legend = {
+        "color": {
+            "field": "label",
+            "type": "nominal",
+            "sort": labels,
+            "scale": {"domain": labels, "range": [x["color"] for x in meta]},
+            "legend": {"title": None},
+        },
+        "opacity": {
+            "field": "label",
+            "type": "nominal",
+            "scale": {"domain": labels, "range": [x["opacity"] for x in meta]},
+            "legend": None,
+        },
+        "order": {"field": "order", "type": "quantitative"},
+    }
+    long_form = [
+        {"fold": [x["key"] for x in meta], "as": ["key", "amount"]},
+        {
+            "lookup": "key",
+            "from": {
+                "data": {"values": meta},
+                "key": "key",
+                "fields": ["label", "group", "position", "order"],
+            },
+        },
+    ]
+    y = "cumulative_amount" if cumulative else "amount"
+    curves = {
+        "transform": long_form
+        + (
+            [
+                {
+                    "window": [{"op": "sum", "field": "amount", "as": y}],
+                    "groupby": ["key"],
+                    "sort": [{"field": "date"}],
+                    "frame": [None, 0],
+                }
+            ]
+            if cumulative
+            else []
+        ),
+        "mark": {"type": "area", "line": False} if stacked else {"type": "line"},
+        "params": [
+            {"name": "range", "select": {"type": "interval", "encodings": ["x"]}},
+            {
+                "name": "zoom",
+                "select": {
+                    "type": "interval",
+                    "encodings": ["x"],
+                    "zoom": "wheel![event.shiftKey]",
+                    "translate": "[mousedown[event.shiftKey], window:mouseup] > window:mousemove!",
+                },
+                "bind": "scales",
+            },
+        ],
+        "encoding": {
+            "x": {"field": "date", "type": "temporal", "title": None},
+            "y": {
+                "field": y,
+                "type": "quantitative",
+                "stack": "zero" if stacked else None,
+                "title": "Amount (DKK)",
+            },
+            **legend,
+            **(
+                {}
+                if stacked
+                else {
+                    "strokeDash": {
+                        "field": "label",
+                        "type": "nominal",
+                        "scale": {"domain": labels, "range": [x["dash"] for x in meta]},
+                        "legend": None,
+                    }
+                }
+            ),
+            "tooltip": [
+                {"field": "date", "type": "temporal", "format": "%Y-%m"},
+                {"field": "label", "type": "nominal", "title": "name"},
+                {"field": y, "type": "quantitative", "format": ",.0f"},
+            ],
+        },
+    }
+    layers = [curves]
+    if zero_line:
+        layers.append(
+            {
+                "mark": {"type": "rule", "strokeDash": [4, 4], "color": "black"},
+                "encoding": {"y": {"datum": 0}},
+            }
+        )
+    bars = {
+        "title": bars_title,
+        "width": 150,
+        "height": 200,
+        "transform": long_form
+        + [
+            {"filter": {"param": "range"}},
+            {
+                "aggregate": [{"op": agg, "field": "amount", "as": "amount"}],
+                "groupby": ["label", "group", "position", "order"],
+            },
+        ],
+        "mark": {"type": "bar"},
+        "encoding": {
+            "x": {
+                "field": "group" if bars_by_group else "label",
+                "type": "nominal",
+                "sort": {"field": "position" if bars_by_group else "order"},
+                "title": None,
+            },
+            "y": {"field": "amount", "type": "quantitative", "stack": "zero"},
+            **legend,
+            "tooltip": [
+                {"field": "label", "type": "nominal", "title": "name"},
+                {"field": "amount", "type": "quantitative", "format": ",.0f"},
+            ],
+        },
+    }
+    return {
+        "$schema": VEGA_LITE_SCHEMA,
+        "hconcat": [
+            {"title": title, "width": 450, "height": 200, "layer": layers},
+            bars,
+        ],
+        "resolve": {"scale": {"y": "shared"}},
+    }
+
+
+def _date_range(
+    component, from_date: dt.date | None, to_date: dt.date | None, first: int
+) -> T.List:
+    index = component.summary.index
+    from_date = index[first] if from_date is None else from_date
+    to_date = index[-1] if to_date is None else to_date
+    return index[(index >= from_date) & (index <= to_date)].drop_duplicates()
+
+
+def _columnar(data: pd.DataFrame) -> pd.DataFrame:
+    data = data.reset_index()
+    data["date"] = [x.isoformat() for x in data["date"]]
+    return data
+
+
+@_rendered("chart_budget_across_time")
+def chart_budget_across_time(
+    budget: Budget,
+    from_date: dt.date | None = None,
+    to_date: dt.date | None = None,
+    cumulative: bool = False,
+) -> T.Tuple[T.Dict[str, T.Any], pd.DataFrame]:
+    """Vega-Lite version of plot_budget_across_time: (spec, data).
+
+    Incomes are stacked on the positive half and expenses and savings on the
+    negative one, next to the aggregated budget. Render with e.g.
+    st.vega_lite_chart(data, spec), or inline_data(spec, data) for vega-embed.
+    """
+    date_range = _date_range(budget.incomes[0], from_date, to_date, first=1)
+    incomes, incomes_meta = _series_frame(budget.incomes, date_range, sign=1)
+    others, others_meta = _series_frame(
+        budget.expenses + budget.savings,
+        date_range,
+        sign=-1,
+        offset=len(incomes_meta),
+    )
+    spec = _time_and_bars_spec(
+        meta=incomes_meta + others_meta,
+        cumulative=cumulative,
+        stacked=True,
+        agg="sum" if cumulative else "mean",
+        title="budget across time" + (" (cumulative)" if cumulative else ""),
+        bars_title=f"aggregated budget ({'sum' if cumulative else 'mean'})",
+        bars_by_group=True,
+        zero_line=True,
+    )
+    return spec, _columnar(pd.concat([incomes, others], axis=1))
+
+
+@_rendered("chart_components_across_time")
+def chart_components_across_time(
+    components: T.List[Income | Saving | Expense],
+    from_date: dt.date | None = None,
+    to_date: dt.date | None = None,
+    cumulative: bool = True,
+    stacked: bool = True,
+    agg: str = "sum",
+    add_interests: bool = False,
+) -> T.Tuple[T.Dict[str, T.Any], pd.DataFrame]:
+    """Vega-Lite version of plot_components_across_time: (spec, data)."""
+    date_range = _date_range(components[0], from_date, to_date, first=0)
+    data, meta = _series_frame(components, date_range, add_interests=add_interests)
+    type = components[0].type
+    spec = _time_and_bars_spec(
+        meta=meta,
+        cumulative=cumulative,
+        stacked=stacked,
+        agg=agg,
+        title=f"Monthly {type.lower()}s across time"
+        + (" (cumulative)" if cumulative else ""),
+        bars_title=f"Aggregated {type}s ({agg})",
+        bars_by_group=stacked,
+    )
+    return spec, _columnar(data)
+
+
+def inline_data(spec: T.Dict[str, T.Any], data: pd.DataFrame) -> T.Dict[str, T.Any]:
+    """A self contained spec with the data embedded (one record per month)."""
+    values = [
+        {k: (None if pd.isna(v) else v) for k, v in record.items()}
+        for record in data.to_dict("records")
+    ]
+    return {**spec, "data": {"values": values}}